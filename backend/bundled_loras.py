@@ -11,19 +11,24 @@ a real-time progress bar instead of a mysterious hang.
 """
 
 import asyncio
+import hashlib
+import http.client
+import json
 import logging
 import os
 import threading
+import time
 import urllib.request
 import urllib.error
+from typing import Optional
 
-import aiohttp
-
-from .config import COMFYUI_PATH, COMFYUI_URL
+from .config import COMFYUI_PATH, LORA_DOWNLOAD_CONNECTIONS, LORA_DOWNLOAD_RETRIES
 
 logger = logging.getLogger(__name__)
 
-# Same list as install.py — single source of truth for bundled LoRA URLs
+# Same list as install.py — single source of truth for bundled LoRA URLs.
+# An entry may add "sha256" (hex digest); the download is then verified
+# against it, otherwise the computed digest is only logged.
 BUNDLED_LORAS = {
     "flux1-turbo-alpha.safetensors": {
         "url": "https://huggingface.co/alimama-creative/FLUX.1-Turbo-Alpha/resolve/main/diffusion_pytorch_model.safetensors",
@@ -61,72 +66,332 @@ def _is_lora_available(filename: str) -> bool:
     return os.path.isfile(os.path.join(_get_loras_dir(), filename))
 
 
-def _download_file_sync(url: str, dest_path: str, description: str = "", progress_callback=None) -> bool:
+# ── Downloads ─────────────────────────────────────────────────────────
+# A partial download lives in <dest>.tmp, with its byte ranges recorded in
+# <dest>.tmp.json, so a dropped connection (or a restarted backend) resumes
+# with HTTP Range requests instead of starting over. Servers that accept
+# ranges get LORA_DOWNLOAD_CONNECTIONS parallel segments. The SHA-256 is
+# computed while the file arrives, by hashing the contiguous finished prefix
+# (re-read from the page cache) as it grows.
+
+USER_AGENT = "Matrice-Backend/1.0"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+PROGRESS_STEP = 5 * 1024 * 1024  # report progress every ~5 MB
+# Don't split a file into segments smaller than this
+MIN_SEGMENT_SIZE = 32 * 1024 * 1024
+# Seconds between writes of the .tmp.json resume state
+CHECKPOINT_INTERVAL = 2.0
+# Socket timeout (seconds) for connect and each read
+DOWNLOAD_TIMEOUT = 60
+
+
+class _RemoteChanged(Exception):
+    """The partial download no longer matches the remote file."""
+
+
+class _Segment:
+    """Byte range [start, end) of the file; done bytes from start are on disk."""
+
+    def __init__(self, start: int, end: Optional[int], done: int = 0):
+        self.start = start
+        self.end = end  # None: size unknown until the server closes the stream
+        self.done = done
+        self.restarts = 0
+
+    @property
+    def complete(self) -> bool:
+        return self.end is not None and self.start + self.done >= self.end
+
+
+def _state_path(tmp_path: str) -> str:
+    return tmp_path + ".json"
+
+
+def _load_state(tmp_path: str, url: str) -> Optional[dict]:
+    """Resume state of a partial download of url, or None to start fresh."""
+    if not os.path.isfile(tmp_path):
+        return None
+    try:
+        with open(_state_path(tmp_path), encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if state.get("url") == url and state.get("segments") else None
+
+
+def _save_state(tmp_path: str, state: dict, segments: list[_Segment]):
+    state["segments"] = [[seg.start, seg.end, seg.done] for seg in segments]
+    path = _state_path(tmp_path)
+    with open(path + ".new", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(path + ".new", path)
+
+
+def _discard_partial(tmp_path: str):
+    for path in (tmp_path, _state_path(tmp_path)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Could not clean up temp file %s: %s", path, e)
+
+
+def _content_range(value: Optional[str]) -> tuple[Optional[int], Optional[int]]:
+    """(first byte, total size) from a Content-Range header; None where unknown."""
+    try:
+        unit, _, rest = (value or "").partition(" ")
+        span, _, total = rest.partition("/")
+        first = int(span.split("-")[0])
+        return first, (int(total) if total.strip() != "*" else None)
+    except ValueError:
+        return None, None
+
+
+def _if_range(validator: dict) -> str:
+    """If-Range value: a strong ETag, else Last-Modified (weak ETags aren't allowed)."""
+    etag = validator.get("etag", "")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return validator.get("last_modified", "")
+
+
+def _probe(url: str) -> tuple[Optional[int], bool, dict]:
+    """(size, accepts ranges, validator) from a one-byte ranged GET."""
+    req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT, "Range": "bytes=0-0"})
+    with urllib.request.urlopen(req, timeout=DOWNLOAD_TIMEOUT) as response:
+        headers = response.headers
+        if response.status == 206:
+            size = _content_range(headers.get("Content-Range"))[1]
+            accepts_ranges = size is not None
+        else:
+            size = int(headers.get("Content-Length", 0)) or None
+            accepts_ranges = False
+        validator = {"etag": headers.get("ETag", ""), "last_modified": headers.get("Last-Modified", "")}
+    return size, accepts_ranges, validator
+
+
+def _plan_segments(size: Optional[int], accepts_ranges: bool, connections: int) -> list[_Segment]:
+    if not accepts_ranges or not size:
+        return [_Segment(0, size)]
+    count = max(1, min(connections, size // MIN_SEGMENT_SIZE))
+    step = -(-size // count)
+    return [_Segment(start, min(size, start + step)) for start in range(0, size, step)]
+
+
+def _write_all(f, data: bytes):
+    view = memoryview(data)
+    while view:
+        view = view[f.write(view):]
+
+
+def _fetch_segment(url: str, tmp_path: str, seg: _Segment, if_range: str, single: bool, stop: threading.Event):
+    """Download the rest of one segment into its place in the .tmp file."""
+    pos = seg.start + seg.done
+    headers = {"User-Agent": USER_AGENT}
+    headers["Range"] = f"bytes={pos}-{seg.end - 1}" if seg.end is not None else f"bytes={pos}-"
+    if if_range:
+        headers["If-Range"] = if_range
+    req = urllib.request.Request(url, headers=headers)
+    try:
+        response = urllib.request.urlopen(req, timeout=DOWNLOAD_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and seg.end is None and pos > 0:
+            seg.end = pos  # nothing past what we have: the stream had ended
+            return
+        raise
+
+    with response, open(tmp_path, "r+b", buffering=0) as f:
+        if response.status == 206:
+            if _content_range(response.headers.get("Content-Range"))[0] != pos:
+                raise _RemoteChanged("server answered a different byte range")
+        elif single:
+            # Full body: ranges unsupported, or If-Range saw a changed file
+            if pos:
+                logger.info("Server sent the whole file; restarting download from zero")
+                seg.restarts += 1
+                seg.done = 0
+                pos = 0
+        else:
+            raise _RemoteChanged("server no longer honours byte ranges")
+        f.seek(pos)
+        while not stop.is_set():
+            want = DOWNLOAD_CHUNK_SIZE if seg.end is None else min(DOWNLOAD_CHUNK_SIZE, seg.end - seg.start - seg.done)
+            if want <= 0:
+                break
+            chunk = response.read(want)
+            if not chunk:
+                break
+            _write_all(f, chunk)
+            seg.done += len(chunk)
+    if stop.is_set():
+        return
+    if seg.end is None:
+        seg.end = seg.start + seg.done
+    elif not seg.complete:
+        raise ConnectionError(f"connection closed at byte {seg.start + seg.done} of {seg.end}")
+
+
+def _contiguous(segments: list[_Segment]) -> int:
+    """Length of the finished prefix of the file."""
+    end = 0
+    for seg in segments:
+        if seg.start != end:
+            break
+        end = seg.start + seg.done
+        if not seg.complete:
+            break
+    return end
+
+
+def _download_attempt(url: str, tmp_path: str, description: str, progress_callback, connections: int) -> str:
+    """Fetch whatever is missing from tmp_path; returns the file's SHA-256 hex digest."""
+    state = _load_state(tmp_path, url)
+    if state is None:
+        size, accepts_ranges, validator = _probe(url)
+        segments = _plan_segments(size, accepts_ranges, connections)
+        state = {"url": url, "size": size, "validator": validator}
+        with open(tmp_path, "wb") as f:
+            if size:
+                f.truncate(size)  # sparse: segments write into their own places
+        _save_state(tmp_path, state, segments)
+        logger.info("  [%s] %s in %d segment(s)", description, f"{size:,} bytes" if size else "unknown size", len(segments))
+    else:
+        segments = [_Segment(start, end, done) for start, end, done in state["segments"]]
+        have = sum(seg.done for seg in segments)
+        logger.info("  [%s] resuming with %.1f MB already downloaded", description, have / 1e6)
+    size = state["size"]
+
+    stop = threading.Event()
+    errors: list[BaseException] = []
+
+    def run(seg: _Segment):
+        try:
+            _fetch_segment(url, tmp_path, seg, _if_range(state["validator"]), len(segments) == 1, stop)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [
+        threading.Thread(target=run, args=(seg,), name=f"lora-download-{i}", daemon=True)
+        for i, seg in enumerate(segments) if not seg.complete
+    ]
+    for thread in threads:
+        thread.start()
+
+    hasher, hashed, restarts = hashlib.sha256(), 0, 0
+    last_reported = sum(seg.done for seg in segments)
+    last_checkpoint = time.monotonic()
+    try:
+        # Unbuffered: read-ahead would cache bytes the segments haven't written yet
+        with open(tmp_path, "rb", buffering=0) as reader:
+            while True:
+                running = any(thread.is_alive() for thread in threads)
+                if sum(seg.restarts for seg in segments) != restarts:
+                    restarts = sum(seg.restarts for seg in segments)
+                    hasher, hashed = hashlib.sha256(), 0
+                # Hash the finished prefix while the rest downloads
+                target = _contiguous(segments)
+                reader.seek(hashed)
+                while hashed < target:
+                    block = reader.read(min(DOWNLOAD_CHUNK_SIZE, target - hashed))
+                    if not block:
+                        break
+                    hasher.update(block)
+                    hashed += len(block)
+
+                downloaded = sum(seg.done for seg in segments)
+                if size and (downloaded - last_reported >= PROGRESS_STEP or (not running and not errors)):
+                    last_reported = downloaded
+                    pct = downloaded / size * 100
+                    logger.info("  [%s] %.1f%% downloaded", description, pct)
+                    if progress_callback:
+                        try:
+                            progress_callback(round(pct, 1))
+                        except Exception as e:
+                            logger.debug("Progress callback error: %s", e)
+                if time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    _save_state(tmp_path, state, segments)
+                    last_checkpoint = time.monotonic()
+                if not running:
+                    break
+                stop.wait(0.2)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        _save_state(tmp_path, state, segments)
+
+    if errors:
+        raise errors[0]
+    total = segments[-1].end
+    if size is None:
+        os.truncate(tmp_path, total)  # a restarted stream may have left a longer file
+    if hashed != total:
+        raise ConnectionError(f"only {hashed} of {total} bytes could be verified")
+    return hasher.hexdigest()
+
+
+def _download_file_sync(
+    url: str,
+    dest_path: str,
+    description: str = "",
+    progress_callback=None,
+    sha256: str = "",
+    connections: int = LORA_DOWNLOAD_CONNECTIONS,
+) -> bool:
     """Download a file (blocking). Called from thread pool.
 
+    Resumes any partial download left by an earlier call and retries
+    interrupted transfers up to LORA_DOWNLOAD_RETRIES times, each continuing
+    where the last stopped; the partial file is kept when all of them fail.
+    With sha256 set, a file that doesn't match is deleted and not installed.
+
     progress_callback(percent: float) is called every ~5 MB with download progress.
     """
     tmp_path = dest_path + ".tmp"
-    try:
-        logger.info("Downloading bundled LoRA: %s (%s)", description, url)
-        req = urllib.request.Request(url, headers={"User-Agent": "Matrice-Backend/1.0"})
-
-        with urllib.request.urlopen(req) as response:
-            total = int(response.headers.get("Content-Length", 0))
-            downloaded = 0
-            chunk_size = 1024 * 1024  # 1 MB
-            last_reported = 0
-
-            with open(tmp_path, "wb") as f:
-                while True:
-                    chunk = response.read(chunk_size)
-                    if not chunk:
-                        break
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    if total > 0:
-                        pct = downloaded / total * 100
-                        # Report progress every ~5 MB
-                        if downloaded - last_reported >= 5 * 1024 * 1024 or pct >= 99:
-                            last_reported = downloaded
-                            logger.info("  [%s] %.1f%% downloaded", description, pct)
-                            if progress_callback:
-                                try:
-                                    progress_callback(round(pct, 1))
-                                except Exception as e:
-                                    logger.debug("Progress callback error: %s", e)
-
+    logger.info("Downloading bundled LoRA: %s (%s)", description, url)
+    attempts = max(1, LORA_DOWNLOAD_RETRIES)
+    for attempt in range(attempts):
+        try:
+            digest = _download_attempt(url, tmp_path, description, progress_callback, connections)
+        except _RemoteChanged as e:
+            logger.warning("Restarting download of %s: %s", description, e)
+            _discard_partial(tmp_path)
+            continue
+        except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+            logger.warning("Download of %s interrupted (attempt %d/%d): %s", description, attempt + 1, attempts, e)
+            if isinstance(e, urllib.error.HTTPError) and 400 <= e.code < 500 and e.code not in (408, 429):
+                break
+            if attempt + 1 < attempts:
+                time.sleep(min(30, 2 ** attempt))
+            continue
+
+        if sha256 and digest != sha256.lower():
+            logger.error("SHA-256 mismatch for %s: expected %s, got %s", description, sha256, digest)
+            _discard_partial(tmp_path)
+            return False
         os.replace(tmp_path, dest_path)
-        logger.info("Downloaded: %s", os.path.basename(dest_path))
+        _discard_partial(tmp_path)
+        logger.info("Downloaded: %s (sha256 %s)", os.path.basename(dest_path), digest)
         return True
 
-    except (urllib.error.URLError, OSError) as e:
-        logger.error("Failed to download %s: %s", description, e)
-        return False
-
-    finally:
-        # Bug #8: Always attempt .tmp cleanup in finally block (safe even if file doesn't exist)
-        try:
-            if os.path.isfile(tmp_path):
-                os.remove(tmp_path)
-        except OSError as e:
-            logger.warning("Could not clean up temp file %s: %s", tmp_path, e)
+    logger.error("Failed to download %s; partial download kept for the next attempt", description)
+    return False
 
 
-async def _refresh_comfyui_lora_list():
+async def _refresh_comfyui_lora_list(comfyui):
     """Poke ComfyUI to re-scan its loras folder.
 
     ComfyUI re-reads the folder when object_info is requested for LoraLoader.
+    Goes through the shared ComfyUIClient so the pooled connection is reused.
     """
+    if comfyui is None:
+        return False
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f"{COMFYUI_URL}/object_info/LoraLoader",
-                timeout=aiohttp.ClientTimeout(total=10),
-            ) as resp:
-                if resp.status == 200:
-                    logger.info("Refreshed ComfyUI LoRA list via object_info")
-                    return True
+        if await comfyui.get_object_info("LoraLoader"):
+            logger.info("Refreshed ComfyUI LoRA list via object_info")
+            return True
     except Exception as e:
         logger.warning("Could not refresh ComfyUI LoRA list: %s", e)
     return False
@@ -141,7 +406,7 @@ async def _broadcast_download_event(ws_manager, event: dict):
             logger.debug("Failed to broadcast download event: %s", e)
 
 
-async def ensure_bundled_lora(filename: str, ws_manager=None, job_id: str = "") -> bool:
+async def ensure_bundled_lora(filename: str, ws_manager=None, job_id: str = "", comfyui=None) -> bool:
     """Ensure a bundled LoRA is downloaded. Returns True if available.
 
     If the LoRA isn't a known bundled LoRA, returns True (assume user-managed).
@@ -150,6 +415,7 @@ async def ensure_bundled_lora(filename: str, ws_manager=None, job_id: str = "")
 
     ws_manager: WebSocketManager instance for broadcasting download progress
     job_id: Frontend job ID for associating progress events with the right queue item
+    comfyui: ComfyUIClient used to make ComfyUI re-scan its loras folder afterwards
     """
     # Not a bundled LoRA — nothing to do
     if filename not in BUNDLED_LORAS:
@@ -207,6 +473,7 @@ async def ensure_bundled_lora(filename: str, ws_manager=None, job_id: str = "")
             dest,
             lora_info["description"],
             on_progress,
+            lora_info.get("sha256", ""),
         )
 
         # Broadcast result
@@ -217,7 +484,7 @@ async def ensure_bundled_lora(filename: str, ws_manager=None, job_id: str = "")
                 "filename": filename,
                 "jobId": job_id,
             })
-            await _refresh_comfyui_lora_list()
+            await _refresh_comfyui_lora_list(comfyui)
         else:
             await _broadcast_download_event(ws_manager, {
                 "type": "lora_download",
@@ -230,7 +497,7 @@ async def ensure_bundled_lora(filename: str, ws_manager=None, job_id: str = "")
         return success
 
 
-async def ensure_all_bundled_loras(lora_names: list[str], ws_manager=None, job_id: str = "") -> list[str]:
+async def ensure_all_bundled_loras(lora_names: list[str], ws_manager=None, job_id: str = "", comfyui=None) -> list[str]:
     """Ensure all bundled LoRAs in the list are available.
 
     Returns a list of LoRA names that failed to download (empty = all good).
@@ -238,7 +505,7 @@ async def ensure_all_bundled_loras(lora_names: list[str], ws_manager=None, job_i
     failed = []
     for name in lora_names:
         if name in BUNDLED_LORAS:
-            ok = await ensure_bundled_lora(name, ws_manager, job_id)
+            ok = await ensure_bundled_lora(name, ws_manager, job_id, comfyui)
             if not ok:
                 failed.append(name)
     return failed
@@ -0,0 +1,108 @@
+"""
+Circuit breaker for ComfyUI calls.
+
+When ComfyUI is restarting or overloaded, waiting out the full request
+timeout on every call piles up hung requests and sockets. After
+BREAKER_FAILURE_THRESHOLD consecutive failures the circuit opens and calls
+fail immediately with ComfyUIUnavailableError. After BREAKER_RESET_TIMEOUT
+seconds one trial call is let through (half-open); its outcome closes or
+re-opens the circuit.
+
+The WebSocketManager also feeds the breaker: a dropped ComfyUI socket opens
+it right away, a successful reconnect closes it.
+"""
+
+import logging
+import time
+from typing import Optional
+
+from .config import BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ComfyUIUnavailableError(Exception):
+    """Raised instead of calling ComfyUI while the circuit is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe."""
+
+    def __init__(
+        self,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_TIMEOUT,
+    ):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._last_error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls are being rejected outright (not half-open)."""
+        return self.state == OPEN
+
+    def check(self):
+        """Raise ComfyUIUnavailableError unless a call may proceed."""
+        state = self.state
+        if state == CLOSED:
+            return
+        now = time.monotonic()
+        # A probe that never reported back (e.g. cancelled) must not wedge the breaker
+        if state == HALF_OPEN and (not self._probe_in_flight or now - self._probe_started >= self.reset_timeout):
+            self._probe_in_flight = True
+            self._probe_started = now
+            return
+        retry_in = max(0.0, self.reset_timeout - (now - self._opened_at))
+        raise ComfyUIUnavailableError(
+            f"ComfyUI is unavailable ({self._last_error or 'circuit open'}); retry in {retry_in:.0f}s"
+        )
+
+    def record_success(self):
+        if self._state != CLOSED:
+            logger.info("ComfyUI circuit closed")
+        self._state = CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+        self._last_error = None
+
+    def record_failure(self, reason: str = ""):
+        self._failures += 1
+        self._last_error = reason or self._last_error
+        state = self.state
+        if state == OPEN:
+            return  # already open — don't extend the cool-down
+        if state == HALF_OPEN or self._failures >= self.failure_threshold:
+            self.trip(reason)
+
+    def trip(self, reason: str = ""):
+        """Open the circuit immediately."""
+        if self._state != OPEN:
+            logger.warning("ComfyUI circuit opened: %s", reason or "too many failures")
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._last_error = reason or self._last_error
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self._failures,
+            "lastError": self._last_error,
+        }
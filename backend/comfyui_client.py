@@ -5,8 +5,21 @@ Async HTTP client for communicating with ComfyUI's REST API.
 import asyncio
 import aiohttp
 import logging
-from typing import Optional
-from .config import COMFYUI_URL
+import random
+from typing import AsyncIterable, Optional
+from .circuit_breaker import CircuitBreaker
+from .local_files import LocalFiles
+from .config import (
+    COMFYUI_URL,
+    RETRY_ATTEMPTS,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+    COMFYUI_POOL_LIMIT,
+    COMFYUI_POOL_LIMIT_PER_HOST,
+    COMFYUI_KEEPALIVE_TIMEOUT,
+    COMFYUI_DNS_CACHE_TTL,
+    COMFYUI_UNIX_SOCKET,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -14,20 +27,74 @@ logger = logging.getLogger(__name__)
 REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10)
 # Longer timeout for operations that may take a while (upload, submit)
 SUBMIT_TIMEOUT = aiohttp.ClientTimeout(total=120, connect=10)
+# Streaming downloads: no total cap, only a stall limit between chunks
+STREAM_TIMEOUT = aiohttp.ClientTimeout(total=None, connect=10, sock_read=30)
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def create_connector() -> aiohttp.BaseConnector:
+    """Build the pooled connector used for all ComfyUI traffic.
+
+    Keeps connections alive between bursts of uploads, /view and /history
+    calls so each request doesn't pay for TCP setup again.
+    """
+    if COMFYUI_UNIX_SOCKET:
+        return aiohttp.UnixConnector(
+            path=COMFYUI_UNIX_SOCKET,
+            limit=COMFYUI_POOL_LIMIT,
+            limit_per_host=COMFYUI_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=COMFYUI_KEEPALIVE_TIMEOUT,
+        )
+    return aiohttp.TCPConnector(
+        limit=COMFYUI_POOL_LIMIT,
+        limit_per_host=COMFYUI_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=COMFYUI_KEEPALIVE_TIMEOUT,
+        use_dns_cache=True,
+        ttl_dns_cache=COMFYUI_DNS_CACHE_TTL,
+    )
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2^attempt))."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+async def iter_response_chunks(resp: aiohttp.ClientResponse, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Yield a response body chunk by chunk, releasing the connection when done."""
+    try:
+        async for chunk in resp.content.iter_chunked(chunk_size):
+            yield chunk
+    finally:
+        resp.release()
 
 
 class ComfyUIClient:
     """Wraps ComfyUI's HTTP API for model discovery, prompt submission, and image retrieval."""
 
-    def __init__(self, base_url: str = COMFYUI_URL):
+    def __init__(self, base_url: str = COMFYUI_URL, local: Optional[LocalFiles] = None):
         self.base_url = base_url.rstrip("/")
+        # Direct access to ComfyUI's folders when it runs on this host
+        self.local = local if local is not None else LocalFiles.detect(self.base_url)
+        self._connector: Optional[aiohttp.BaseConnector] = None
         self._session: Optional[aiohttp.ClientSession] = None
         self._session_lock = asyncio.Lock()
+        self.breaker = CircuitBreaker()
+
+    @property
+    def connector(self) -> aiohttp.BaseConnector:
+        """Shared connection pool. Other sessions must pass connector_owner=False."""
+        if self._connector is None or self._connector.closed:
+            self._connector = create_connector()
+        return self._connector
 
     async def _get_session(self) -> aiohttp.ClientSession:
         async with self._session_lock:
             if self._session is None or self._session.closed:
-                self._session = aiohttp.ClientSession(timeout=REQUEST_TIMEOUT)
+                self._session = aiohttp.ClientSession(
+                    connector=self.connector,
+                    connector_owner=False,
+                    timeout=REQUEST_TIMEOUT,
+                )
             return self._session
 
     async def close(self):
@@ -35,6 +102,41 @@ class ComfyUIClient:
             if self._session and not self._session.closed:
                 await self._session.close()
                 self._session = None
+            if self._connector and not self._connector.closed:
+                await self._connector.close()
+                self._connector = None
+
+    async def _get_json(self, path: str, default, params: Optional[dict] = None):
+        """GET a JSON endpoint through the circuit breaker.
+
+        Idempotent, so connection errors, timeouts and 5xx answers are retried
+        with jittered exponential backoff. Returns default on any other non-200
+        answer or once retries are exhausted. Raises ComfyUIUnavailableError
+        while the circuit is open.
+        """
+        session = await self._get_session()
+        for attempt in range(max(1, RETRY_ATTEMPTS)):
+            self.breaker.check()
+            try:
+                async with session.get(f"{self.base_url}{path}", params=params) as resp:
+                    if resp.status < 500:
+                        data = await resp.json() if resp.status == 200 else default
+                        self.breaker.record_success()
+                        return data
+                    reason = f"HTTP {resp.status} from {path}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                reason = f"{type(e).__name__} on {path}"
+            self.breaker.record_failure(reason)
+            if attempt + 1 < RETRY_ATTEMPTS:
+                await asyncio.sleep(_backoff_delay(attempt))
+        return default
+
+    def _record_response(self, status: int, path: str):
+        """Feed a non-retried call's status into the circuit breaker."""
+        if status >= 500:
+            self.breaker.record_failure(f"HTTP {status} from {path}")
+        else:
+            self.breaker.record_success()
 
     # ── Model Discovery ──────────────────────────────────────────────
 
@@ -44,14 +146,7 @@ class ComfyUIClient:
         Folders: checkpoints, diffusion_models, loras, vae, controlnet,
                  upscale_models, clip, ipadapter, clip_vision, embeddings
         """
-        session = await self._get_session()
-        try:
-            async with session.get(f"{self.base_url}/models/{folder}") as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                return []
-        except aiohttp.ClientError:
-            return []
+        return await self._get_json(f"/models/{folder}", [])
 
     async def get_models_from_node(self, node_class: str, input_name: str) -> list[str]:
         """Get model list from a specific node's object_info input options.
@@ -88,25 +183,11 @@ class ComfyUIClient:
         return sorted(models)
 
     async def get_embeddings(self) -> list[str]:
-        session = await self._get_session()
-        try:
-            async with session.get(f"{self.base_url}/embeddings") as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                return []
-        except aiohttp.ClientError:
-            return []
+        return await self._get_json("/embeddings", [])
 
     async def get_object_info(self, node_class: str) -> dict:
         """Get node class info (used for sampler/scheduler lists)."""
-        session = await self._get_session()
-        try:
-            async with session.get(f"{self.base_url}/object_info/{node_class}") as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                return {}
-        except aiohttp.ClientError:
-            return {}
+        return await self._get_json(f"/object_info/{node_class}", {})
 
     async def get_samplers_and_schedulers(self) -> dict:
         """Extract sampler and scheduler lists from KSampler node info."""
@@ -141,35 +222,111 @@ class ComfyUIClient:
         """Submit a workflow to ComfyUI for execution.
 
         Returns: {"prompt_id": "...", "number": N, "node_errors": {}}
+
+        Not retried (a resubmission would queue the job twice). Raises
+        ComfyUIUnavailableError while the circuit is open.
         """
+        self.breaker.check()
         session = await self._get_session()
         payload = {
             "prompt": workflow,
             "client_id": client_id,
         }
-        async with session.post(
-            f"{self.base_url}/prompt",
-            json=payload,
-            timeout=SUBMIT_TIMEOUT,
-        ) as resp:
+        try:
+            resp = await session.post(f"{self.base_url}/prompt", json=payload, timeout=SUBMIT_TIMEOUT)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.breaker.record_failure(f"{type(e).__name__} on /prompt")
+            raise
+        async with resp:
+            self._record_response(resp.status, "/prompt")
             if resp.status != 200:
                 body = await resp.text()
                 logger.error("ComfyUI prompt submission failed (%d): %s", resp.status, body[:500])
                 return {"prompt_id": "", "node_errors": {"submit": body[:500]}}
             return await resp.json()
 
+    async def _post_control(self, path: str, payload: dict) -> bool:
+        """POST a small control request (/queue, /interrupt). Not retried."""
+        self.breaker.check()
+        session = await self._get_session()
+        try:
+            resp = await session.post(f"{self.base_url}{path}", json=payload)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.breaker.record_failure(f"{type(e).__name__} on {path}")
+            raise
+        async with resp:
+            self._record_response(resp.status, path)
+            if resp.status != 200:
+                logger.warning("ComfyUI %s failed (%d)", path, resp.status)
+            return resp.status == 200
+
+    async def delete_queued(self, prompt_ids: list[str]) -> bool:
+        """Remove prompts from ComfyUI's pending queue (no effect on the running one)."""
+        return await self._post_control("/queue", {"delete": prompt_ids})
+
+    async def interrupt(self, prompt_id: str = "") -> bool:
+        """Interrupt the running prompt.
+
+        With prompt_id, ComfyUI versions that support it only interrupt when
+        that prompt is the one executing; older versions ignore the field.
+        """
+        return await self._post_control("/interrupt", {"prompt_id": prompt_id} if prompt_id else {})
+
     # ── Image Upload ──────────────────────────────────────────────────
 
     async def upload_image(self, image_bytes: bytes, filename: str, subfolder: str = "", image_type: str = "input") -> dict:
-        """Upload an image to ComfyUI's input directory."""
+        """Upload an image to ComfyUI's input directory.
+
+        With a co-located ComfyUI the file is written into its input folder
+        directly (see local_files.py); otherwise it is POSTed to /upload/image.
+        Both answer {"name", "subfolder", "type"}, or {"error"} on failure.
+        """
+        return await self._upload(image_bytes, filename, subfolder, image_type)
+
+    async def upload_image_stream(
+        self,
+        chunks: AsyncIterable[bytes],
+        filename: str,
+        subfolder: str = "",
+        image_type: str = "input",
+        content_type: str = "image/png",
+    ) -> dict:
+        """Upload an image from an async iterator of chunks (sent chunked, never buffered whole).
+
+        An exception raised by the iterator aborts the request and propagates.
+        """
+        return await self._upload(chunks, filename, subfolder, image_type, content_type)
+
+    async def _upload(self, body, filename: str, subfolder: str, image_type: str, content_type: str = "image/png") -> dict:
+        if self.local is not None and image_type == "input":
+            try:
+                return await self.local.write(body, filename, subfolder, image_type)
+            except OSError as e:
+                if not isinstance(body, bytes):
+                    logger.error("Writing %s to ComfyUI's input folder failed: %s", filename, e)
+                    return {"error": str(e)}
+                logger.warning("Writing %s to ComfyUI's input folder failed, uploading instead: %s", filename, e)
+
+        self.breaker.check()
         session = await self._get_session()
         data = aiohttp.FormData()
-        data.add_field("image", image_bytes, filename=filename, content_type="image/png")
+        data.add_field("image", body, filename=filename, content_type=content_type)
         if subfolder:
             data.add_field("subfolder", subfolder)
         data.add_field("type", image_type)
 
-        async with session.post(f"{self.base_url}/upload/image", data=data, timeout=SUBMIT_TIMEOUT) as resp:
+        try:
+            resp = await session.post(f"{self.base_url}/upload/image", data=data, timeout=SUBMIT_TIMEOUT)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            cause = e.__cause__
+            if cause is not None and not isinstance(cause, (aiohttp.ClientError, OSError, asyncio.TimeoutError)):
+                # The body iterator failed (e.g. the upload went over its size
+                # limit); not ComfyUI's fault, so don't count it
+                raise cause from None
+            self.breaker.record_failure(f"{type(e).__name__} on /upload/image")
+            raise
+        async with resp:
+            self._record_response(resp.status, "/upload/image")
             if resp.status != 200:
                 body = await resp.text()
                 logger.error("ComfyUI image upload failed (%d): %s", resp.status, body[:500])
@@ -179,32 +336,65 @@ class ComfyUIClient:
     # ── Image Retrieval ───────────────────────────────────────────────
 
     async def get_image(self, filename: str, subfolder: str = "", image_type: str = "output") -> bytes:
-        """Download a generated image from ComfyUI."""
+        """Download an image from ComfyUI (read from disk when its folders are local).
+
+        Raises aiohttp.ClientResponseError when /view doesn't answer 200
+        (e.g. 404 for a missing file), so an error page is never taken for
+        image bytes.
+        """
+        if self.local is not None:
+            data = await self.local.read(filename, subfolder, image_type)
+            if data is not None:
+                return data
+        self.breaker.check()
         session = await self._get_session()
         params = {"filename": filename, "subfolder": subfolder, "type": image_type}
-        async with session.get(f"{self.base_url}/view", params=params) as resp:
+        try:
+            resp = await session.get(f"{self.base_url}/view", params=params)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.breaker.record_failure(f"{type(e).__name__} on /view")
+            raise
+        async with resp:
+            self._record_response(resp.status, "/view")
+            resp.raise_for_status()
             return await resp.read()
 
+    async def open_image_stream(self, filename: str, subfolder: str = "", image_type: str = "output") -> aiohttp.ClientResponse:
+        """Open /view without buffering the body.
+
+        The caller reads headers (status, content type/length), iterates the
+        body with iter_response_chunks(), and must release the response.
+        """
+        self.breaker.check()
+        session = await self._get_session()
+        params = {"filename": filename, "subfolder": subfolder, "type": image_type}
+        try:
+            resp = await session.get(f"{self.base_url}/view", params=params, timeout=STREAM_TIMEOUT)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.breaker.record_failure(f"{type(e).__name__} on /view")
+            raise
+        self._record_response(resp.status, "/view")
+        return resp
+
     # ── History ───────────────────────────────────────────────────────
 
     async def get_history(self, prompt_id: str) -> dict:
-        session = await self._get_session()
-        async with session.get(f"{self.base_url}/history/{prompt_id}") as resp:
-            if resp.status == 200:
-                return await resp.json()
-            return {}
+        return await self._get_json(f"/history/{prompt_id}", {})
+
+    # ── Queue ─────────────────────────────────────────────────────────
+
+    async def get_queue(self) -> dict:
+        """Get ComfyUI's running and pending queue.
+
+        Returns: {"queue_running": [...], "queue_pending": [...]} where each
+        entry is [number, prompt_id, prompt, extra_data, outputs_to_execute].
+        """
+        return await self._get_json("/queue", {})
 
     # ── System Status ─────────────────────────────────────────────────
 
     async def get_system_stats(self) -> dict:
-        session = await self._get_session()
-        try:
-            async with session.get(f"{self.base_url}/system_stats") as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                return {}
-        except aiohttp.ClientError:
-            return {}
+        return await self._get_json("/system_stats", {})
 
     async def is_connected(self) -> bool:
         """Check if ComfyUI is reachable."""
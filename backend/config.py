@@ -49,6 +49,54 @@ COMFYUI_PORT = int(os.environ.get("COMFYUI_PORT", "8188"))
 COMFYUI_URL = os.environ.get("COMFYUI_URL", f"http://{COMFYUI_HOST}:{COMFYUI_PORT}")
 COMFYUI_WS = os.environ.get("COMFYUI_WS", f"ws://{COMFYUI_HOST}:{COMFYUI_PORT}/ws")
 
+# ── ComfyUI connection pool (shared by every module that talks to ComfyUI) ──
+COMFYUI_POOL_LIMIT = int(os.environ.get("COMFYUI_POOL_LIMIT", "100"))
+COMFYUI_POOL_LIMIT_PER_HOST = int(os.environ.get("COMFYUI_POOL_LIMIT_PER_HOST", "32"))
+COMFYUI_KEEPALIVE_TIMEOUT = float(os.environ.get("COMFYUI_KEEPALIVE_TIMEOUT", "60"))
+COMFYUI_DNS_CACHE_TTL = int(os.environ.get("COMFYUI_DNS_CACHE_TTL", "300"))
+# Optional Unix domain socket for a local ComfyUI (e.g. behind a socket proxy).
+# URLs keep their host/port for the Host header; the socket carries the traffic.
+COMFYUI_UNIX_SOCKET = os.environ.get("COMFYUI_UNIX_SOCKET", "")
+
+# ── Fair-share scheduling across clients / API keys ──────────────────
+# Credit per round-robin visit, in 1-megapixel sampler steps
+FAIR_SHARE_QUANTUM = float(os.environ.get("FAIR_SHARE_QUANTUM", "25"))
+
+
+def _parse_weights(raw: str) -> dict[str, float]:
+    """Parse "key=weight,key=weight" into a dict, skipping malformed entries."""
+    weights = {}
+    for item in raw.split(","):
+        key, sep, value = item.strip().rpartition("=")
+        if not sep or not key:
+            continue
+        try:
+            weights[key] = float(value)
+        except ValueError:
+            continue
+    return weights
+
+
+# Per-client weights, keyed by API key, "client:<X-Client-Id>" or "ip:<addr>"
+FAIR_SHARE_WEIGHTS = _parse_weights(os.environ.get("FAIR_SHARE_WEIGHTS", ""))
+# API keys trusted to get their own fair-share queue (keys given a weight
+# above count too). Other API keys and X-Client-Id values are unverified:
+# each peer address gets at most FAIR_SHARE_MAX_IDS_PER_PEER of them, and
+# further ids share the address's queue, so rotating ids can't buy more share.
+FAIR_SHARE_API_KEYS = {key.strip() for key in os.environ.get("FAIR_SHARE_API_KEYS", "").split(",") if key.strip()}
+FAIR_SHARE_MAX_IDS_PER_PEER = int(os.environ.get("FAIR_SHARE_MAX_IDS_PER_PEER", "4"))
+
+# ── Circuit breaker / retry for ComfyUI calls ────────────────────────
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.environ.get("BREAKER_RESET_TIMEOUT", "15"))
+# Idempotent GETs: attempts and jittered exponential backoff bounds (seconds)
+RETRY_ATTEMPTS = int(os.environ.get("RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "0.25"))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "2.0"))
+
+# ── Health monitor — seconds between /system_stats polls ────────────
+HEALTH_STATS_INTERVAL = float(os.environ.get("HEALTH_STATS_INTERVAL", "5"))
+
 # ── Backend server ───────────────────────────────────────────────────
 BACKEND_HOST = os.environ.get("BACKEND_HOST", "127.0.0.1")
 BACKEND_PORT = int(os.environ.get("BACKEND_PORT", "3001"))
@@ -65,5 +113,52 @@ UPLOAD_DIR = os.environ.get(
     os.path.join(COMFYUI_PATH, "input")
 )
 
+# Write uploads into UPLOAD_DIR and read images from UPLOAD_DIR/GALLERY_DIR
+# directly instead of over ComfyUI's HTTP API: "auto" (when COMFYUI_URL is a
+# loopback address and the folders exist), "on" or "off" (remote ComfyUI)
+COMFYUI_LOCAL_FILES = os.environ.get("COMFYUI_LOCAL_FILES", "auto").strip().lower()
+
+# Optional normalization of uploaded images in a worker pool: EXIF rotation
+# applied, converted to sRGB, resized to multiples of 64 within a pixel
+# budget (in megapixels of 1024×1024) and re-encoded as PNG
+UPLOAD_NORMALIZE = os.environ.get("UPLOAD_NORMALIZE", "0").strip().lower() in ("1", "true", "yes", "on")
+UPLOAD_NORMALIZE_MEGAPIXELS = float(os.environ.get("UPLOAD_NORMALIZE_MEGAPIXELS", "1.0"))
+UPLOAD_NORMALIZE_WORKERS = int(os.environ.get("UPLOAD_NORMALIZE_WORKERS", "2"))
+
+# ── Bundled LoRA downloads ───────────────────────────────────────────
+# Parallel HTTP Range connections per file (1 = a single stream)
+LORA_DOWNLOAD_CONNECTIONS = int(os.environ.get("LORA_DOWNLOAD_CONNECTIONS", "4"))
+# Attempts per request; each one resumes the partial .tmp file
+LORA_DOWNLOAD_RETRIES = int(os.environ.get("LORA_DOWNLOAD_RETRIES", "3"))
+
+# ── Scheduler — model-affinity dispatch to ComfyUI ──────────────────
+# Max prompts handed to ComfyUI at once; the rest wait in the backend so
+# they can be reordered to reuse the currently loaded model chain.
+SCHEDULER_MAX_INFLIGHT = int(os.environ.get("SCHEDULER_MAX_INFLIGHT", "2"))
+# How many times a waiting job may be overtaken by same-model jobs
+SCHEDULER_MAX_SKIPS = int(os.environ.get("SCHEDULER_MAX_SKIPS", "4"))
+
+# ── Job manager — admission control ──────────────────────────────────
+# Jobs waiting in the backend beyond this are refused with 429
+JOBS_MAX_QUEUED = int(os.environ.get("JOBS_MAX_QUEUED", "64"))
+JOBS_MAX_QUEUED_PER_CLIENT = int(os.environ.get("JOBS_MAX_QUEUED_PER_CLIENT", "16"))
+# Finished job records kept in memory for status lookups
+JOBS_RETENTION = int(os.environ.get("JOBS_RETENTION", "500"))
+
+# ── Backend data — job store and other persistent state ──────────────
+DATA_DIR = os.environ.get("MATRICE_DATA_DIR", os.path.join(_ROOT, "data"))
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", os.path.join(DATA_DIR, "jobs.sqlite3"))
+# The WebSocket client id, kept across restarts: ComfyUI only sends a prompt's
+# events to the client id that queued it
+COMFYUI_CLIENT_ID_PATH = os.environ.get("COMFYUI_CLIENT_ID_PATH", os.path.join(DATA_DIR, "comfyui_client_id"))
+# Seconds between batched job-store writes
+JOBS_FLUSH_INTERVAL = float(os.environ.get("JOBS_FLUSH_INTERVAL", "0.5"))
+# Remembered results of explicitly seeded requests (0 disables the cache)
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "1000"))
+# Preprocessed ControlNet images kept in UPLOAD_DIR (0 disables the cache)
+PREPROCESS_CACHE_SIZE = int(os.environ.get("PREPROCESS_CACHE_SIZE", "500"))
+# Remembered uploads (content hash → ComfyUI input filename) for dedupe
+UPLOAD_INDEX_SIZE = int(os.environ.get("UPLOAD_INDEX_SIZE", "5000"))
+
 # ── CORS origins allowed (frontend dev server) ───────────────────────
 CORS_ORIGINS = os.environ.get("CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173").split(",")
@@ -0,0 +1,137 @@
+"""
+Background health monitor for ComfyUI.
+
+Keeps an in-memory snapshot so /api/status never has to probe ComfyUI
+itself: WebSocket connectivity, last event time and queue depth come from
+the WebSocketManager (checked every HEALTH_TICK_INTERVAL), RAM/VRAM from a
+/system_stats poll every HEALTH_STATS_INTERVAL. Subscribers (the
+/api/status/stream SSE endpoint) are woken whenever the snapshot changes.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from .circuit_breaker import ComfyUIUnavailableError
+from .config import HEALTH_STATS_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+HEALTH_TICK_INTERVAL = 1.0
+# SSE keep-alive when nothing changed (seconds)
+STREAM_HEARTBEAT = 15.0
+
+
+def _summarize_system_stats(stats: dict) -> dict:
+    """Reduce ComfyUI's /system_stats to the numbers dashboards care about."""
+    system = stats.get("system", {})
+    return {
+        "ramTotal": system.get("ram_total"),
+        "ramFree": system.get("ram_free"),
+        "devices": [
+            {
+                "name": device.get("name", ""),
+                "type": device.get("type", ""),
+                "vramTotal": device.get("vram_total"),
+                "vramFree": device.get("vram_free"),
+            }
+            for device in stats.get("devices", [])
+        ],
+    }
+
+
+class HealthMonitor:
+    """Continuously refreshed ComfyUI health snapshot."""
+
+    def __init__(self, comfyui, ws_manager, scheduler, stats_interval: float = HEALTH_STATS_INTERVAL):
+        self.comfyui = comfyui
+        self.ws_manager = ws_manager
+        self.scheduler = scheduler
+        self.stats_interval = stats_interval
+        self._reachable = False
+        self._system: dict = {}
+        self._stats_at: Optional[float] = None
+        self._state: dict = {}
+        self._updated_at: Optional[float] = None
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    # ── Lifecycle ─────────────────────────────────────────────────────
+
+    async def start(self):
+        if self._task and not self._task.done():
+            return
+        self._publish()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    # ── Snapshot ──────────────────────────────────────────────────────
+
+    def snapshot(self) -> dict:
+        """Current health, served from memory."""
+        return {**self._state, "updatedAt": self._updated_at}
+
+    async def stream(self):
+        """Yield a snapshot on every change, or None as a keep-alive."""
+        yield self.snapshot()
+        while True:
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=STREAM_HEARTBEAT)
+                yield self.snapshot()
+            except asyncio.TimeoutError:
+                yield None
+
+    # ── Internals ─────────────────────────────────────────────────────
+
+    def _collect(self) -> dict:
+        return {
+            "comfyui": self._reachable,
+            "wsConnected": self.ws_manager.is_connected,
+            "lastEventAt": self.ws_manager.last_event_at,
+            "queueRemaining": self.ws_manager.queue_remaining,
+            "system": self._system,
+            "statsAt": self._stats_at,
+            "breaker": self.comfyui.breaker.snapshot(),
+            "scheduler": self.scheduler.snapshot(),
+        }
+
+    def _publish(self):
+        state = self._collect()
+        self._updated_at = time.time()
+        if state != self._state:
+            self._state = state
+            # Wake current subscribers; later waiters get a fresh event
+            self._changed.set()
+            self._changed = asyncio.Event()
+
+    async def _poll_stats(self):
+        try:
+            stats = await self.comfyui.get_system_stats()
+        except ComfyUIUnavailableError:
+            stats = {}
+        except Exception as e:
+            logger.debug("system_stats poll failed: %s", e)
+            stats = {}
+        self._reachable = bool(stats)
+        if stats:
+            self._system = _summarize_system_stats(stats)
+            self._stats_at = time.time()
+
+    async def _run(self):
+        next_poll = 0.0
+        while True:
+            now = time.monotonic()
+            if now >= next_poll:
+                next_poll = now + self.stats_interval
+                await self._poll_stats()
+            self._publish()
+            await asyncio.sleep(HEALTH_TICK_INTERVAL)
@@ -0,0 +1,269 @@
+"""
+Durable job store — SQLite-backed persistence for job records.
+
+Job state otherwise lives only in memory, so a backend restart (including
+every --reload that start.py turns on) would orphan in-flight jobs. Each
+record keeps the payload, built workflow, prompt_id, timestamps, state and
+output filenames.
+
+The same database holds the result cache (workflow hash → output filenames,
+see result_cache.py) and the upload index (content hash → ComfyUI input
+filename, see upload_index.py).
+
+Writes are batched: save() only marks a job dirty, and a background task
+flushes all dirty records in one transaction every JOBS_FLUSH_INTERVAL
+seconds on a worker thread, so the event loop never blocks on disk I/O.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+from .config import JOBS_DB_PATH, JOBS_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id       TEXT PRIMARY KEY,
+    kind         TEXT NOT NULL,
+    state        TEXT NOT NULL,
+    priority     TEXT NOT NULL,
+    client_key   TEXT NOT NULL,
+    weight       REAL NOT NULL,
+    prompt_id    TEXT NOT NULL,
+    error        TEXT NOT NULL,
+    payload      TEXT NOT NULL,
+    workflow     TEXT NOT NULL,
+    outputs      TEXT NOT NULL,
+    created_at   REAL NOT NULL,
+    submitted_at REAL,
+    finished_at  REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+CREATE INDEX IF NOT EXISTS jobs_prompt ON jobs (prompt_id);
+CREATE TABLE IF NOT EXISTS results (
+    workflow_hash TEXT PRIMARY KEY,
+    outputs       TEXT NOT NULL,
+    created_at    REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS uploads (
+    sha256     TEXT PRIMARY KEY,
+    name       TEXT NOT NULL,
+    subfolder  TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+_COLUMNS = (
+    "job_id", "kind", "state", "priority", "client_key", "weight", "prompt_id",
+    "error", "payload", "workflow", "outputs", "created_at", "submitted_at", "finished_at",
+)
+_JSON_COLUMNS = ("payload", "workflow", "outputs")
+
+
+class JobStore:
+    """Batched SQLite persistence for Job records."""
+
+    def __init__(self, path: str = JOBS_DB_PATH, flush_interval: float = JOBS_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._dirty: dict[str, dict] = {}
+        self._deleted: set[str] = set()
+        self._dirty_results: dict[str, tuple] = {}
+        self._deleted_results: set[str] = set()
+        self._dirty_uploads: dict[str, tuple] = {}
+        self._deleted_uploads: set[str] = set()
+        self._db_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # ── Lifecycle ─────────────────────────────────────────────────────
+
+    def open(self):
+        """Open (and create if needed) the database. Blocking; call once at startup."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    async def start(self):
+        if self._conn is None:
+            self.open()
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        if self._conn is not None:
+            with self._db_lock:
+                self._conn.close()
+            self._conn = None
+
+    # ── Records ───────────────────────────────────────────────────────
+
+    def save(self, record: dict):
+        """Queue a job record (see Job.to_record) for the next batched write."""
+        self._deleted.discard(record["job_id"])
+        self._dirty[record["job_id"]] = record
+
+    def delete(self, job_id: str):
+        self._dirty.pop(job_id, None)
+        self._deleted.add(job_id)
+
+    def load_unfinished(self, finished_states) -> list[dict]:
+        """Records not in a finished state, oldest first. Blocking; startup only."""
+        if self._conn is None:
+            self.open()
+        placeholders = ",".join("?" for _ in finished_states)
+        with self._db_lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE state NOT IN ({placeholders}) ORDER BY created_at",
+                tuple(finished_states),
+            ).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def save_result(self, workflow_hash: str, outputs: list[str], created_at: float):
+        """Queue a result-cache entry for the next batched write."""
+        self._deleted_results.discard(workflow_hash)
+        self._dirty_results[workflow_hash] = (workflow_hash, json.dumps(outputs), created_at)
+
+    def delete_result(self, workflow_hash: str):
+        self._dirty_results.pop(workflow_hash, None)
+        self._deleted_results.add(workflow_hash)
+
+    def load_results(self) -> list[tuple[str, list[str], float]]:
+        """All result-cache entries, oldest first. Blocking; startup only."""
+        if self._conn is None:
+            self.open()
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT workflow_hash, outputs, created_at FROM results ORDER BY created_at"
+            ).fetchall()
+        return [(key, json.loads(outputs), created_at) for key, outputs, created_at in rows]
+
+    def save_upload(self, sha256: str, name: str, subfolder: str, created_at: float):
+        """Queue an upload-index entry for the next batched write."""
+        self._deleted_uploads.discard(sha256)
+        self._dirty_uploads[sha256] = (sha256, name, subfolder, created_at)
+
+    def delete_upload(self, sha256: str):
+        self._dirty_uploads.pop(sha256, None)
+        self._deleted_uploads.add(sha256)
+
+    def load_uploads(self) -> list[tuple[str, str, str, float]]:
+        """All upload-index entries, oldest first. Blocking; startup only."""
+        if self._conn is None:
+            self.open()
+        with self._db_lock:
+            return self._conn.execute(
+                "SELECT sha256, name, subfolder, created_at FROM uploads ORDER BY created_at"
+            ).fetchall()
+
+    async def flush(self):
+        """Write all pending changes in one transaction on a worker thread."""
+        if not (
+            self._dirty or self._deleted or self._dirty_results or self._deleted_results
+            or self._dirty_uploads or self._deleted_uploads
+        ):
+            return
+        dirty, self._dirty = self._dirty, {}
+        deleted, self._deleted = self._deleted, set()
+        dirty_results, self._dirty_results = self._dirty_results, {}
+        deleted_results, self._deleted_results = self._deleted_results, set()
+        dirty_uploads, self._dirty_uploads = self._dirty_uploads, {}
+        deleted_uploads, self._deleted_uploads = self._deleted_uploads, set()
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(
+                None, self._write,
+                list(dirty.values()), list(deleted),
+                list(dirty_results.values()), list(deleted_results),
+                list(dirty_uploads.values()), list(deleted_uploads),
+            )
+        except Exception as e:
+            logger.error("Failed to flush job store: %s", e)
+            # Put them back so the next flush retries (newer saves win)
+            for job_id, record in dirty.items():
+                self._dirty.setdefault(job_id, record)
+            self._deleted |= deleted - set(self._dirty)
+            for key, row in dirty_results.items():
+                self._dirty_results.setdefault(key, row)
+            self._deleted_results |= deleted_results - set(self._dirty_results)
+            for key, row in dirty_uploads.items():
+                self._dirty_uploads.setdefault(key, row)
+            self._deleted_uploads |= deleted_uploads - set(self._dirty_uploads)
+
+    # ── Internals ─────────────────────────────────────────────────────
+
+    def _write(
+        self,
+        records: list[dict],
+        deleted: list[str],
+        results: list[tuple],
+        deleted_results: list[str],
+        uploads: list[tuple] = (),
+        deleted_uploads: list[str] = (),
+    ):
+        if self._conn is None:
+            return
+        rows = [self._encode(record) for record in records]
+        with self._db_lock, self._conn:
+            if rows:
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO jobs ({', '.join(_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' for _ in _COLUMNS)})",
+                    rows,
+                )
+            if deleted:
+                self._conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(job_id,) for job_id in deleted])
+            if results:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO results (workflow_hash, outputs, created_at) VALUES (?, ?, ?)",
+                    results,
+                )
+            if deleted_results:
+                self._conn.executemany(
+                    "DELETE FROM results WHERE workflow_hash = ?", [(key,) for key in deleted_results]
+                )
+            if uploads:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO uploads (sha256, name, subfolder, created_at) VALUES (?, ?, ?, ?)",
+                    uploads,
+                )
+            if deleted_uploads:
+                self._conn.executemany(
+                    "DELETE FROM uploads WHERE sha256 = ?", [(key,) for key in deleted_uploads]
+                )
+
+    @staticmethod
+    def _encode(record: dict) -> tuple:
+        return tuple(
+            json.dumps(record.get(col)) if col in _JSON_COLUMNS else record.get(col)
+            for col in _COLUMNS
+        )
+
+    @staticmethod
+    def _decode(row: tuple) -> dict:
+        record = dict(zip(_COLUMNS, row))
+        for col in _JSON_COLUMNS:
+            record[col] = json.loads(record[col]) if record[col] else None
+        return record
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
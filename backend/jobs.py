@@ -0,0 +1,825 @@
+"""
+Backend job manager — job records, states and admission control.
+
+Every /api/generate and /api/edit request becomes a Job. Jobs wait in the
+PromptScheduler's priority queue and are fed to ComfyUI only up to
+SCHEDULER_MAX_INFLIGHT at a time, so ComfyUI's own queue stays shallow and
+ordering decisions stay here. When JOBS_MAX_QUEUED jobs are already waiting,
+new submissions are refused (the routes answer 429); the same goes for a
+single client with JOBS_MAX_QUEUED_PER_CLIENT jobs waiting.
+
+Lifecycle: queued → submitted → complete | error | cancelled
+
+Live progress (current node, sampler step, ETA) is tracked from the
+WebSocketManager's prompt events, so /api/jobs can answer without the
+client having seen every event.
+
+With a JobStore attached, every change is persisted; on startup recover()
+matches unfinished records against ComfyUI's /queue and /history and
+resumes tracking them.
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .circuit_breaker import ComfyUIUnavailableError
+from .config import (
+    JOBS_MAX_QUEUED,
+    JOBS_MAX_QUEUED_PER_CLIENT,
+    JOBS_RETENTION,
+    FAIR_SHARE_API_KEYS,
+    FAIR_SHARE_MAX_IDS_PER_PEER,
+    FAIR_SHARE_WEIGHTS,
+)
+from .result_cache import workflow_hash
+from .scheduler import describe_node_errors
+from .workflows.base import estimate_workflow_cost, model_chain_key
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = "queued"        # waiting in the backend
+SUBMITTED = "submitted"  # handed to ComfyUI
+COMPLETE = "complete"
+ERROR = "error"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = {COMPLETE, ERROR, CANCELLED}
+
+# Seconds between attempts to reach ComfyUI when recovering jobs at startup
+RECOVERY_RETRY_INTERVAL = 5.0
+# Seconds between /history checks for prompts adopted at startup
+ADOPTED_POLL_INTERVAL = 5.0
+
+# Priority names accepted in payloads → queue rank (lower runs first)
+JOB_PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+# Peer addresses whose unverified client ids are remembered
+MAX_TRACKED_PEERS = 4096
+_peer_ids: "OrderedDict[str, set[str]]" = OrderedDict()  # "ip:<addr>" -> fair-share keys
+
+
+class JobQueueFullError(Exception):
+    """Raised when the backend queue is at capacity."""
+
+
+class CancelFailedError(Exception):
+    """Raised when ComfyUI can't be made to drop a prompt; the job is left as it was."""
+
+
+def _is_seeded(payload: dict) -> bool:
+    """True when every seed the request uses is explicit (not -1)."""
+    seeds = (payload.get("sweep") or {}).get("seeds") or [payload.get("seed", -1)]
+    return all(seed >= 0 for seed in seeds)
+
+
+def _history_error(entry: dict) -> str:
+    """ComfyUI's error for a failed /history entry, "" when it succeeded."""
+    status = entry.get("status", {})
+    if status.get("status_str") != "error":
+        return ""
+    for message in status.get("messages", []):
+        if len(message) != 2:
+            continue
+        event, data = message
+        if event == "execution_error" and isinstance(data, dict):
+            return data.get("exception_message") or "Unknown error"
+        if event == "execution_interrupted":
+            return "Interrupted"
+    return "Failed in ComfyUI"
+
+
+def _claim_id(peer: str, key: str) -> bool:
+    """Whether peer may use key as its own fair-share key (FAIR_SHARE_MAX_IDS_PER_PEER)."""
+    ids = _peer_ids.get(peer)
+    if ids is None:
+        ids = _peer_ids[peer] = set()
+        while len(_peer_ids) > MAX_TRACKED_PEERS:
+            _peer_ids.popitem(last=False)
+    else:
+        _peer_ids.move_to_end(peer)
+    if key in ids:
+        return True
+    if len(ids) >= FAIR_SHARE_MAX_IDS_PER_PEER:
+        return False
+    ids.add(key)
+    return True
+
+
+def client_identity(request) -> tuple[str, float]:
+    """Fair-share key and weight for a request.
+
+    Prefers an X-API-Key header (hashed, so keys never show up in status
+    output), then an X-Client-Id header, then the peer address. Weights come
+    from FAIR_SHARE_WEIGHTS, looked up by raw API key or by the derived key.
+
+    Neither header is authenticated, so the per-client wait bound only holds
+    for ids that can't be minted at will: keys in FAIR_SHARE_API_KEYS (or
+    FAIR_SHARE_WEIGHTS) always get their own queue, while any other id
+    counts against its peer's FAIR_SHARE_MAX_IDS_PER_PEER and falls back to
+    the peer address beyond that.
+    """
+    peer = f"ip:{request.client.host if request.client else 'unknown'}"
+    api_key = request.headers.get("x-api-key", "")
+    key = ""
+    if api_key:
+        key = "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+        if api_key in FAIR_SHARE_API_KEYS or api_key in FAIR_SHARE_WEIGHTS:
+            return key, FAIR_SHARE_WEIGHTS.get(api_key, FAIR_SHARE_WEIGHTS.get(key, 1.0))
+    else:
+        client_id = request.headers.get("x-client-id", "")[:64]
+        if client_id:
+            key = f"client:{client_id}"
+    if not key or not _claim_id(peer, key):
+        key = peer
+    return key, FAIR_SHARE_WEIGHTS.get(key, 1.0)
+
+
+class Job:
+    """A generation/edit request tracked by the backend."""
+
+    def __init__(
+        self,
+        job_id: str,
+        kind: str,
+        workflow: dict,
+        priority: str = "normal",
+        client_key: str = "",
+        weight: float = 1.0,
+        payload: Optional[dict] = None,
+    ):
+        self.job_id = job_id
+        self.kind = kind  # "generate" or "edit"
+        self.payload = payload or {}
+        self.workflow = workflow
+        self.priority = priority if priority in JOB_PRIORITIES else "normal"
+        self.rank = JOB_PRIORITIES[self.priority]
+        self.client_key = client_key
+        self.weight = weight
+        # Only explicitly seeded requests are reproducible, hence cacheable
+        self.cache_key = workflow_hash(workflow) if _is_seeded(self.payload) else ""
+        self.cost = estimate_workflow_cost(workflow)
+        self.chain = model_chain_key(workflow)
+        self.skips = 0  # times another job was dispatched ahead of this one
+        self.seq = 0  # arrival order, assigned by the scheduler
+        self.state = QUEUED
+        self.prompt_id = ""
+        self.error = ""
+        self.outputs: list[str] = []  # output image filenames
+        # Sweep jobs: one entry per KSampler branch (see build_txt2img_sweep_workflow)
+        self.branches: list[dict] = []
+        self.created_at = time.time()
+        self.submitted_at: Optional[float] = None
+        self.started_at: Optional[float] = None  # ComfyUI began executing
+        self.finished_at: Optional[float] = None
+        # Live progress (not persisted)
+        self.node = ""
+        self.step = 0
+        self.total_steps = 0
+        self._rate_origin: Optional[tuple[float, int]] = None  # (time, step) of the current sampler pass
+        self._seconds_per_step = 0.0
+
+    @classmethod
+    def from_record(cls, record: dict) -> "Job":
+        """Rebuild a job from a JobStore record."""
+        job = cls(
+            record["job_id"],
+            record["kind"],
+            record["workflow"] or {},
+            priority=record["priority"],
+            client_key=record["client_key"],
+            weight=record["weight"],
+            payload=record["payload"],
+        )
+        job.state = record["state"]
+        job.prompt_id = record["prompt_id"]
+        job.error = record["error"]
+        job.outputs = record["outputs"] or []
+        job.created_at = record["created_at"]
+        job.submitted_at = record["submitted_at"]
+        job.finished_at = record["finished_at"]
+        return job
+
+    def to_record(self) -> dict:
+        """Full persistent form (see JobStore)."""
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "state": self.state,
+            "priority": self.priority,
+            "client_key": self.client_key,
+            "weight": self.weight,
+            "prompt_id": self.prompt_id,
+            "error": self.error,
+            "payload": self.payload,
+            "workflow": self.workflow,
+            "outputs": self.outputs,
+            "created_at": self.created_at,
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+        }
+
+    def requeue(self):
+        """Back to queued, e.g. when ComfyUI lost the prompt during a restart."""
+        self.state = QUEUED
+        self.prompt_id = ""
+        self.submitted_at = None
+
+    def mark_submitted(self, prompt_id: str):
+        self.state = SUBMITTED
+        self.prompt_id = prompt_id
+        self.submitted_at = time.time()
+
+    def mark_finished(self, error: str = ""):
+        self.state = ERROR if error else COMPLETE
+        self.error = error
+        self.finished_at = time.time()
+        self.node = ""
+
+    def mark_cancelled(self):
+        self.state = CANCELLED
+        self.error = "Cancelled"
+        self.finished_at = time.time()
+        self.node = ""
+
+    def update_progress(self, step: int, total_steps: int):
+        """Record a sampler step and refresh the per-step rate used for the ETA."""
+        now = time.monotonic()
+        if self._rate_origin is None or step < self.step:
+            # First step seen, or a new sampler pass (e.g. hires fix) started
+            self._rate_origin = (now, step)
+        else:
+            origin_time, origin_step = self._rate_origin
+            if step > origin_step:
+                self._seconds_per_step = (now - origin_time) / (step - origin_step)
+        self.step = step
+        self.total_steps = total_steps
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds left in the current sampler pass, once a rate is known."""
+        if self.state != SUBMITTED or not self._seconds_per_step:
+            return None
+        return round(max(0, self.total_steps - self.step) * self._seconds_per_step, 1)
+
+    def to_dict(self) -> dict:
+        return {
+            "jobId": self.job_id,
+            "kind": self.kind,
+            "priority": self.priority,
+            "client": self.client_key,
+            "state": self.state,
+            "promptId": self.prompt_id,
+            "error": self.error,
+            "outputs": self.outputs,
+            **({"branches": self.branches} if self.branches else {}),
+            "progress": {
+                "node": self.node,
+                "step": self.step,
+                "totalSteps": self.total_steps,
+                "eta": self.eta,
+            },
+            "createdAt": self.created_at,
+            "submittedAt": self.submitted_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+        }
+
+
+class JobManager:
+    """Owns job records and admits new jobs into the PromptScheduler."""
+
+    def __init__(
+        self,
+        scheduler,
+        ws_manager,
+        max_queued: int = JOBS_MAX_QUEUED,
+        max_queued_per_client: int = JOBS_MAX_QUEUED_PER_CLIENT,
+        retention: int = JOBS_RETENTION,
+        store=None,
+        cache=None,
+    ):
+        self.scheduler = scheduler
+        self.ws_manager = ws_manager
+        self.store = store  # optional JobStore
+        self.cache = cache  # optional ResultCache
+        self.max_queued = max(1, max_queued)
+        self.max_queued_per_client = max(1, max_queued_per_client)
+        self.retention = max(0, retention)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._by_prompt: dict[str, list[Job]] = {}  # prompt_id -> jobs sharing it
+        # Single-flight: cache_key -> the job that owns the work for that
+        # workflow, and jobs waiting for an undispatched leader
+        self._flights: dict[str, Job] = {}
+        self._followers: dict[str, list[Job]] = {}  # leader job_id -> jobs
+
+        scheduler.add_dispatch_listener(self._on_dispatched)
+        scheduler.add_lost_listener(self._on_prompt_lost)
+        ws_manager.add_finish_listener(self._on_prompt_finished)
+        ws_manager.add_event_listener(self._on_prompt_event)
+
+    async def submit(self, job: Job) -> dict:
+        """Admit a job and hand it to the scheduler.
+
+        Raises JobQueueFullError when the backend queue is at capacity.
+        Returns the scheduler's submission result, or {"cached": True, ...}
+        when an identical seeded request already produced its images, or
+        {"coalesced": True, ...} when one is already queued or running.
+        """
+        outputs = self.cache.get(job.cache_key) if self.cache and job.cache_key else None
+        if outputs:
+            return self._complete_from_cache(job, outputs)
+
+        leader = self._leader_for(job)
+        if leader is not None:
+            return self._attach(job, leader)
+
+        if self.scheduler.pending_count >= self.max_queued:
+            raise JobQueueFullError(
+                f"Server busy: {self.scheduler.pending_count} jobs already queued, try again shortly"
+            )
+        if self.scheduler.pending_for(job.client_key) >= self.max_queued_per_client:
+            raise JobQueueFullError(
+                f"Too many queued jobs for this client (limit {self.max_queued_per_client}), try again shortly"
+            )
+        self._add(job)
+        if job.cache_key:
+            self._flights[job.cache_key] = job
+        try:
+            return await self.scheduler.submit(job)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            job.mark_finished(error=error)
+            self._save(job)
+            self._fail_followers(job, error)
+            raise
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self, state: str = "", client_key: str = "") -> list[Job]:
+        """Tracked jobs, newest first. state="active" matches every unfinished job."""
+        jobs = []
+        for job in reversed(self._jobs.values()):
+            if state == "active" and job.state in FINISHED_STATES:
+                continue
+            if state and state != "active" and job.state != state:
+                continue
+            if client_key and job.client_key != client_key:
+                continue
+            jobs.append(job)
+        return jobs
+
+    def _add(self, job: Job):
+        self._jobs[job.job_id] = job
+        self._jobs.move_to_end(job.job_id)
+        self._prune()
+        self._save(job)
+
+    def _complete_from_cache(self, job: Job, outputs: list[str]) -> dict:
+        """Finish a job immediately with cached outputs."""
+        job.outputs = outputs
+        job.mark_finished()
+        self._add(job)
+        logger.info("Job %s served from result cache", job.job_id)
+        # Sent after the HTTP response is on its way, like a normal completion
+        asyncio.get_running_loop().create_task(self.ws_manager.broadcast({
+            "type": "complete",
+            "jobId": job.job_id,
+            "promptId": "",
+            "filename": outputs[0],
+            "subfolder": "",
+            "imageUrl": f"/api/gallery/{outputs[0]}",
+            "filenames": outputs,
+            "cached": True,
+        }))
+        return {"prompt_id": "", "node_errors": {}, "queued": False, "cached": True}
+
+    # ── Single-flight coalescing ──────────────────────────────────────
+
+    def _leader_for(self, job: Job) -> Optional[Job]:
+        """Unfinished job already doing the same seeded workflow, if any."""
+        if not job.cache_key:
+            return None
+        leader = self._flights.get(job.cache_key)
+        if leader is None or leader.state in FINISHED_STATES:
+            self._flights.pop(job.cache_key, None)
+            return None
+        return leader
+
+    def _attach(self, job: Job, leader: Job) -> dict:
+        """Make job share leader's prompt instead of queueing its own."""
+        self._add(job)
+        if leader.state == SUBMITTED:
+            self._join_prompt(job, leader.prompt_id)
+        else:
+            self._followers.setdefault(leader.job_id, []).append(job)
+        self._save(job)
+        logger.info("Job %s coalesced with in-flight job %s", job.job_id, leader.job_id)
+        return {"prompt_id": job.prompt_id, "node_errors": {}, "queued": job.state == QUEUED, "coalesced": True}
+
+    def _join_prompt(self, job: Job, prompt_id: str):
+        if job.state != SUBMITTED:
+            job.mark_submitted(prompt_id)
+        self._track(job)
+
+    def _track(self, job: Job):
+        """Route a submitted job's prompt events and completion to it."""
+        jobs = self._by_prompt.setdefault(job.prompt_id, [])
+        if job not in jobs:
+            jobs.append(job)
+        self.ws_manager.register_prompt(job.prompt_id, job.job_id)
+
+    def _untrack(self, job: Job):
+        jobs = self._by_prompt.get(job.prompt_id)
+        if jobs and job in jobs:
+            jobs.remove(job)
+            if not jobs:
+                del self._by_prompt[job.prompt_id]
+        self.ws_manager.unregister_job(job.prompt_id, job.job_id)
+
+    def _fail_followers(self, leader: Job, error: str):
+        for job in self._followers.pop(leader.job_id, []):
+            job.mark_finished(error)
+            self._save(job)
+            asyncio.get_running_loop().create_task(self.ws_manager.broadcast({
+                "type": "error",
+                "jobId": job.job_id,
+                "promptId": "",
+                "message": error,
+            }))
+
+    def _promote(self, followers: list[Job]):
+        """Queue the first follower of a cancelled leader in its place."""
+        leader, rest = followers[0], followers[1:]
+        if rest:
+            self._followers[leader.job_id] = rest
+        if leader.cache_key:
+            self._flights[leader.cache_key] = leader
+        self.scheduler.enqueue(leader)
+
+    def _requeue(self, job: Job):
+        """Queue a job again (recovery), coalescing with an identical one."""
+        leader = self._leader_for(job)
+        if leader is not None and leader is not job:
+            self._attach(job, leader)
+            return
+        if job.cache_key:
+            self._flights[job.cache_key] = job
+        self.scheduler.enqueue(job)
+
+    # ── Cancellation ──────────────────────────────────────────────────
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a job wherever it is. Returns the job (None if unknown).
+
+        Jobs still waiting here are simply dropped. Submitted prompts are
+        deleted from ComfyUI's pending queue, or interrupted if already
+        running, so abandoned work stops using the GPU — unless coalesced
+        jobs still want the same prompt, in which case only this job is
+        detached from it.
+
+        ComfyUI is told first and the job is only marked cancelled once it
+        has accepted, so a failed cancel (ComfyUIUnavailableError,
+        CancelFailedError or a connection error) can be retried.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.state in FINISHED_STATES:
+            return job
+
+        was_submitted = job.state == SUBMITTED
+        peers = []
+        running = False
+        if was_submitted:
+            peers = [other for other in self._by_prompt.get(job.prompt_id, ()) if other.state == SUBMITTED and other is not job]
+            if not peers:
+                running = await self._abort_prompt(job.prompt_id)
+                if job.state == COMPLETE:
+                    return job  # finished while ComfyUI answered
+
+        # A QUEUED job that is no longer in the scheduler is mid-dispatch;
+        # _on_dispatched aborts its prompt as soon as the id is known
+        self.scheduler.remove(job)
+        for waiting in self._followers.values():
+            if job in waiting:
+                waiting.remove(job)
+        job.mark_cancelled()
+        self._save(job)
+        logger.info("Cancelled job %s", job.job_id)
+        followers = self._followers.pop(job.job_id, [])
+        if followers:
+            self._promote(followers)
+
+        if peers:
+            self._untrack(job)
+        elif was_submitted and not running:
+            # ComfyUI sends nothing for deleted prompts — free the slot ourselves
+            self.ws_manager.release_prompt(job.prompt_id, job.error)
+        if not running:
+            # Interrupted prompts are reported by ComfyUI's execution_interrupted
+            await self.ws_manager.broadcast({
+                "type": "error",
+                "jobId": job.job_id,
+                "promptId": job.prompt_id,
+                "message": job.error,
+                "cancelled": True,
+            })
+        return job
+
+    async def _abort_prompt(self, prompt_id: str) -> bool:
+        """Remove a prompt from ComfyUI. True if it had to be interrupted.
+
+        Raises CancelFailedError when ComfyUI's queue can't be read or it
+        refuses the request: whether the prompt is running is then unknown.
+        """
+        comfyui = self.scheduler.comfyui
+        queue = await comfyui.get_queue()
+        if not queue:
+            raise CancelFailedError("ComfyUI did not return its queue")
+        running = {item[1] for item in queue.get("queue_running", []) if len(item) > 1}
+        if prompt_id in running:
+            if not await comfyui.interrupt(prompt_id):
+                raise CancelFailedError("ComfyUI refused to interrupt the prompt")
+            return True
+        if not await comfyui.delete_queued([prompt_id]):
+            raise CancelFailedError("ComfyUI refused to delete the prompt")
+        return False
+
+    async def _abort_dispatched(self, job: Job):
+        """Drop the prompt of a job cancelled while its submission was in flight."""
+        try:
+            running = await self._abort_prompt(job.prompt_id)
+        except Exception as e:
+            # Its slot stays held until reconcile sees the prompt leave the queue
+            logger.warning("Could not drop prompt %s of cancelled job %s: %s", job.prompt_id, job.job_id, e)
+            return
+        if not running:
+            self.ws_manager.release_prompt(job.prompt_id, job.error)
+
+    def snapshot(self) -> dict:
+        counts: dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.state] = counts.get(job.state, 0) + 1
+        return {
+            "maxQueued": self.max_queued,
+            "maxQueuedPerClient": self.max_queued_per_client,
+            "states": counts,
+        }
+
+    # ── Crash recovery ────────────────────────────────────────────────
+
+    async def recover(self, comfyui):
+        """Resume jobs persisted by a previous backend process.
+
+        Prompt mappings are restored immediately so WebSocket events route to
+        the right jobId. Once ComfyUI answers /queue, submitted jobs are
+        matched up: still queued/running → tracked as in-flight, with /history
+        polled until they finish; found in /history → finished with their
+        outputs; unknown (ComfyUI restarted too) → queued again. Jobs that
+        never left the backend are re-queued.
+        """
+        if self.store is None:
+            return
+        loop = asyncio.get_running_loop()
+        records = await loop.run_in_executor(None, self.store.load_unfinished, FINISHED_STATES)
+        if not records:
+            return
+
+        jobs = [Job.from_record(record) for record in records]
+        for job in jobs:
+            self._jobs[job.job_id] = job
+            if job.state == SUBMITTED and job.prompt_id:
+                self._track(job)
+                if job.cache_key:
+                    self._flights.setdefault(job.cache_key, job)
+        logger.info("Recovering %d unfinished job(s) from the job store", len(jobs))
+
+        queue = {}
+        while not queue:
+            try:
+                queue = await comfyui.get_queue()
+            except ComfyUIUnavailableError:
+                queue = {}
+            if not queue:
+                await asyncio.sleep(RECOVERY_RETRY_INTERVAL)
+        live = {
+            item[1]
+            for key in ("queue_running", "queue_pending")
+            for item in queue.get(key, [])
+            if len(item) > 1
+        }
+
+        adopted: set[str] = set()
+        for job in jobs:
+            if job.state == QUEUED:
+                self._requeue(job)
+                continue
+            if job.state != SUBMITTED:
+                continue  # finished meanwhile via a coalesced peer
+            if job.prompt_id in live:
+                self.scheduler.adopt(job.prompt_id, job.chain)
+                adopted.add(job.prompt_id)
+                continue
+            entry = (await comfyui.get_history(job.prompt_id)).get(job.prompt_id) if job.prompt_id else None
+            if entry:
+                await self._finish_from_history(job, entry)
+            else:
+                self._resubmit(job)
+
+        # Cancelled along with recover() at shutdown
+        await asyncio.gather(*(self._watch_adopted(comfyui, prompt_id) for prompt_id in adopted))
+
+    async def _watch_adopted(self, comfyui, prompt_id: str):
+        """Poll /history for a prompt adopted at startup until it finishes.
+
+        Its events normally keep arriving since the client id survives
+        restarts, but a prompt queued under another id (an older backend, a
+        lost id file) gets none, and would otherwise stay submitted forever.
+        """
+        while prompt_id in self._by_prompt:
+            await asyncio.sleep(ADOPTED_POLL_INTERVAL)
+            try:
+                entry = (await comfyui.get_history(prompt_id)).get(prompt_id)
+            except ComfyUIUnavailableError:
+                continue
+            if entry:
+                await self._finish_prompt_from_history(prompt_id, entry)
+                return
+
+    def _resubmit(self, job: Job):
+        """Queue a submitted job again after ComfyUI lost its prompt."""
+        self._untrack(job)
+        if self._flights.get(job.cache_key) is job:
+            del self._flights[job.cache_key]
+        job.requeue()
+        self._save(job)
+        self._requeue(job)
+
+    async def _finish_prompt_from_history(self, prompt_id: str, entry: dict):
+        """Finish every job on a prompt from its /history entry and free its slot."""
+        jobs = list(self._by_prompt.get(prompt_id, []))
+        for job in jobs:
+            if job.state == SUBMITTED:
+                await self._finish_from_history(job, entry)
+        error = _history_error(entry)
+        if not error and self.cache is not None:
+            for job in jobs:
+                if job.cache_key and job.outputs:
+                    self.cache.put(job.cache_key, job.outputs)
+                    break
+        self.ws_manager.release_prompt(prompt_id, error)
+
+    async def _finish_from_history(self, job: Job, entry: dict):
+        """Close out a job whose completion events were missed, from its /history entry."""
+        self._untrack(job)
+        images = [
+            image
+            for output in entry.get("outputs", {}).values()
+            for image in output.get("images", [])
+            if image.get("type", "output") == "output"
+        ]
+        job.outputs = [image.get("filename", "") for image in images]
+        error = _history_error(entry)
+        if error:
+            job.mark_finished(error=error)
+            await self.ws_manager.broadcast({
+                "type": "error",
+                "jobId": job.job_id,
+                "promptId": job.prompt_id,
+                "message": job.error,
+            })
+        else:
+            job.mark_finished()
+            if images:
+                await self.ws_manager.broadcast({
+                    "type": "complete",
+                    "jobId": job.job_id,
+                    "promptId": job.prompt_id,
+                    "filename": images[0].get("filename", ""),
+                    "subfolder": images[0].get("subfolder", ""),
+                    "imageUrl": f"/api/gallery/{images[0].get('filename', '')}",
+                    "filenames": job.outputs,
+                })
+        self._save(job)
+
+    # ── Listeners ─────────────────────────────────────────────────────
+
+    def _on_dispatched(self, job: Job, result: dict):
+        prompt_id = result.get("prompt_id", "")
+        if job.state == CANCELLED:
+            # Cancelled while its submission was in flight
+            if prompt_id:
+                job.prompt_id = prompt_id
+                asyncio.create_task(self._abort_dispatched(job))
+            return
+        followers = self._followers.pop(job.job_id, [])
+        if prompt_id:
+            self._join_prompt(job, prompt_id)
+            for follower in followers:
+                self._join_prompt(follower, prompt_id)
+                self._save(follower)
+        else:
+            error = describe_node_errors(result.get("node_errors", {}))
+            job.mark_finished(error=error)
+            self._followers[job.job_id] = followers
+            self._fail_followers(job, error)
+        self._save(job)
+
+    async def _on_prompt_lost(self, prompt_id: str):
+        """Settle a prompt that left ComfyUI's queue without a completion event.
+
+        Finished from its /history entry when there is one; with no entry
+        ComfyUI dropped it (restarted, or history cleared) and its jobs are
+        queued again, as recover() does.
+        """
+        jobs = self._by_prompt.get(prompt_id)
+        if not jobs:
+            return
+        try:
+            entry = (await self.scheduler.comfyui.get_history(prompt_id)).get(prompt_id)
+        except ComfyUIUnavailableError:
+            # Keep it in flight; the next reconcile looks again
+            self.scheduler.adopt(prompt_id, jobs[0].chain)
+            return
+        if entry:
+            await self._finish_prompt_from_history(prompt_id, entry)
+            return
+        logger.warning("Prompt %s vanished from ComfyUI; queueing its jobs again", prompt_id)
+        for job in list(self._by_prompt.get(prompt_id, [])):
+            if job.state == SUBMITTED:
+                self._resubmit(job)
+        self.ws_manager.release_prompt(prompt_id)
+
+    def _on_prompt_finished(self, prompt_id: str, error: str = ""):
+        jobs = self._by_prompt.pop(prompt_id, [])
+        for job in jobs:
+            if job.state not in FINISHED_STATES:
+                job.mark_finished(error)
+                self._save(job)
+        if not error and self.cache is not None:
+            for job in jobs:
+                if job.cache_key and job.outputs:
+                    self.cache.put(job.cache_key, job.outputs)
+                    break
+
+    def _on_prompt_event(self, message: dict):
+        job = self._jobs.get(message.get("jobId", ""))
+        if job is None or job.state in FINISHED_STATES:
+            return
+        event_type = message.get("type")
+        if event_type == "started":
+            job.started_at = time.time()
+        elif event_type == "executing":
+            job.node = message.get("node", "")
+        elif event_type == "progress":
+            job.update_progress(message.get("step", 0), message.get("totalSteps", 1))
+        elif event_type == "complete":
+            filenames = [f for f in message.get("filenames") or [message.get("filename", "")] if f]
+            for filename in filenames:
+                if filename not in job.outputs:
+                    job.outputs.append(filename)
+            self._save(job)
+            if job.branches:
+                self._branch_complete(job, message.get("node", ""), filenames)
+
+    def _branch_complete(self, job: Job, node_id: str, filenames: list[str]):
+        """Report one finished sweep branch."""
+        # Identical combinations share one (interned) SaveImage node
+        matched = [b for b in job.branches if b["saveNode"] == node_id]
+        for branch in matched:
+            branch["outputs"] = filenames
+        completed = sum(1 for b in job.branches if "outputs" in b)
+        loop = asyncio.get_running_loop()
+        for branch in matched:
+            loop.create_task(self.ws_manager.broadcast({
+                "type": "branch_complete",
+                "jobId": job.job_id,
+                "promptId": job.prompt_id,
+                "branch": branch,
+                "imageUrl": f"/api/gallery/{filenames[0]}" if filenames else "",
+                "completed": completed,
+                "total": len(job.branches),
+            }))
+
+    def _save(self, job: Job):
+        if self.store is not None:
+            self.store.save(job.to_record())
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond the retention limit."""
+        excess = len(self._jobs) - self.retention
+        if excess <= 0:
+            return
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            job = self._jobs[job_id]
+            if job.state in FINISHED_STATES:
+                del self._jobs[job_id]
+                if self.store is not None:
+                    self.store.delete(job_id)
+                excess -= 1
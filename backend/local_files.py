@@ -0,0 +1,209 @@
+"""
+Local file transport — ComfyUI's input/output folders read and written directly.
+
+With ComfyUI on this machine (the default start.py setup), sending an upload
+through POST /upload/image copies every byte twice and adds an HTTP hop, and
+reading it back through /view does the same. LocalFiles writes uploads into
+UPLOAD_DIR itself: the bytes go to a hidden temporary file in the target
+folder, which is then linked into place under ComfyUI's own collision naming
+("name (1).png", ...), so ComfyUI never sees a half-written file and an
+existing file is never overwritten. Input and output images are read from
+UPLOAD_DIR and GALLERY_DIR.
+
+ComfyUIClient uses it when COMFYUI_LOCAL_FILES allows (see detect()) and
+keeps HTTP for everything else, including images that aren't on disk.
+"""
+
+import asyncio
+import ipaddress
+import logging
+import os
+import tempfile
+from typing import AsyncIterable, Optional, Union
+from urllib.parse import urlparse
+
+from .config import COMFYUI_LOCAL_FILES, COMFYUI_UNIX_SOCKET, COMFYUI_URL, GALLERY_DIR, UPLOAD_DIR
+
+logger = logging.getLogger(__name__)
+
+# Give up looking for a free "name (n).ext" after this many tries
+MAX_NAME_ATTEMPTS = 10000
+
+
+def _is_loopback(url: str) -> bool:
+    host = urlparse(url).hostname or ""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class LocalFiles:
+    """Direct access to a co-located ComfyUI's input and output folders."""
+
+    def __init__(self, upload_dir: str = UPLOAD_DIR, output_dir: str = GALLERY_DIR):
+        self.upload_dir = upload_dir
+        self.output_dir = output_dir
+
+    @classmethod
+    def detect(cls, base_url: str = COMFYUI_URL, mode: str = COMFYUI_LOCAL_FILES) -> Optional["LocalFiles"]:
+        """A LocalFiles for this deployment, or None to go through HTTP only."""
+        if mode in ("off", "0", "false", "no"):
+            return None
+        if mode not in ("on", "1", "true", "yes"):
+            # auto: ComfyUI must be on this host and its input folder visible
+            if not (COMFYUI_UNIX_SOCKET or _is_loopback(base_url)) or not os.path.isdir(UPLOAD_DIR):
+                return None
+        logger.info("Using ComfyUI's folders directly (input: %s, output: %s)", UPLOAD_DIR, GALLERY_DIR)
+        return cls()
+
+    def _folder(self, image_type: str) -> Optional[str]:
+        if image_type == "input":
+            return self.upload_dir
+        if image_type == "output":
+            return self.output_dir
+        return None  # temp and anything else: ask ComfyUI
+
+    def path(self, filename: str, subfolder: str = "", image_type: str = "output") -> Optional[str]:
+        """Absolute path of an image, or None when it isn't available locally.
+
+        Names that would escape the folder (as ComfyUI's /view refuses) give None.
+        """
+        folder = self._folder(image_type)
+        if folder is None or not filename:
+            return None
+        root = os.path.realpath(folder)
+        path = os.path.realpath(os.path.join(root, subfolder, filename))
+        if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+            return None
+        return path
+
+    # ── Reads ─────────────────────────────────────────────────────────
+
+    async def read(self, filename: str, subfolder: str = "", image_type: str = "output") -> Optional[bytes]:
+        """Image bytes straight from disk, or None if ComfyUI should be asked."""
+        path = self.path(filename, subfolder, image_type)
+        if path is None:
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, _read_file, path)
+        except OSError as e:
+            logger.warning("Could not read %s locally: %s", path, e)
+            return None
+
+    # ── Writes ────────────────────────────────────────────────────────
+
+    def stage(self, subfolder: str = "", image_type: str = "input") -> "StagedFile":
+        """Temp file in the target folder, published later under a free name. Blocking.
+
+        Raises ValueError for a subfolder outside the folder.
+        """
+        folder = self._folder(image_type)
+        if folder is None:
+            raise ValueError(f"Cannot write {image_type} images locally")
+        root = os.path.realpath(folder)
+        target_dir = os.path.realpath(os.path.join(root, subfolder))
+        if os.path.commonpath([root, target_dir]) != root:
+            raise ValueError(f"Invalid subfolder: {subfolder}")
+        return StagedFile(target_dir, subfolder, image_type)
+
+    async def write(
+        self,
+        body: Union[bytes, AsyncIterable[bytes]],
+        filename: str,
+        subfolder: str = "",
+        image_type: str = "input",
+    ) -> dict:
+        """Store an upload the way POST /upload/image would.
+
+        Returns ComfyUI's answer shape: {"name", "subfolder", "type"}, or
+        {"error"} for a subfolder outside the folder (ComfyUI answers 400).
+        An exception from a chunk iterator discards the partial file and
+        propagates.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            staged = await loop.run_in_executor(None, self.stage, subfolder, image_type)
+        except ValueError as e:
+            return {"error": str(e)}
+        with staged:
+            if isinstance(body, (bytes, bytearray, memoryview)):
+                await loop.run_in_executor(None, staged.write, body)
+            else:
+                async for chunk in body:
+                    await loop.run_in_executor(None, staged.write, chunk)
+            return await loop.run_in_executor(None, staged.publish, filename)
+
+
+class StagedFile:
+    """A hidden temp file in one of ComfyUI's folders; removed on exit unless published.
+
+    Blocking file object: call its methods from a worker thread.
+    """
+
+    def __init__(self, target_dir: str, subfolder: str, image_type: str):
+        self.target_dir = target_dir
+        self.subfolder = subfolder
+        self.image_type = image_type
+        os.makedirs(target_dir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix=".matrice-upload-", suffix=".tmp", dir=target_dir)
+        os.chmod(self.path, 0o644)  # mkstemp's 0600 would hide it from a ComfyUI running as another user
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, data: bytes) -> int:
+        return self._file.write(data)
+
+    def publish(self, filename: str) -> dict:
+        """Give the file its final name; returns {"name", "subfolder", "type"}."""
+        self._file.close()
+        name = _publish(self.path, self.target_dir, os.path.basename(filename))
+        return {"name": name, "subfolder": self.subfolder, "type": self.image_type}
+
+    def close(self):
+        self._file.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "StagedFile":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _publish(tmp_path: str, target_dir: str, filename: str) -> str:
+    """Move a finished temp file to the first free "name", "name (1)", ... Returns the name used.
+
+    os.link fails instead of replacing when the name is taken, which makes
+    claiming a name atomic even against a concurrent ComfyUI upload. Where
+    hard links aren't supported the name is reserved with O_EXCL and the temp
+    file renamed over the placeholder.
+    """
+    stem, ext = os.path.splitext(filename)
+    for i in range(MAX_NAME_ATTEMPTS):
+        name = filename if i == 0 else f"{stem} ({i}){ext}"
+        path = os.path.join(target_dir, name)
+        try:
+            os.link(tmp_path, path)
+            return name
+        except FileExistsError:
+            continue
+        except OSError:
+            pass
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            continue
+        os.replace(tmp_path, path)
+        return name
+    raise FileExistsError(f"No free name for {filename} in {target_dir}")
@@ -6,20 +6,41 @@ Provides REST endpoints for model discovery, generation, editing,
 and a WebSocket proxy for real-time generation preview.
 """
 
+import asyncio
+import json
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from .config import CORS_ORIGINS
+from .circuit_breaker import ComfyUIUnavailableError
 from .comfyui_client import ComfyUIClient
+from .health import HealthMonitor
+from .job_store import JobStore
+from .jobs import JobManager
+from .preprocess_cache import PreprocessCache
+from .result_cache import ResultCache
+from .upload_index import UploadIndex
+from .upload_normalize import UploadNormalizer
 from .websocket_manager import WebSocketManager
-from .routes import models, generate, edit, gallery, ws
+from .scheduler import PromptScheduler
+from .routes import models, generate, edit, gallery, jobs, ws
 
 
 # Shared instances
 comfyui = ComfyUIClient()
-ws_manager = WebSocketManager()
+ws_manager = WebSocketManager(comfyui)
+scheduler = PromptScheduler(comfyui, ws_manager)
+job_store = JobStore()
+result_cache = ResultCache(job_store)
+upload_index = UploadIndex(job_store)
+upload_normalizer = UploadNormalizer()
+job_manager = JobManager(scheduler, ws_manager, store=job_store, cache=result_cache)
+preprocess_cache = PreprocessCache(comfyui)
+ws_manager.add_event_listener(preprocess_cache.on_event)
+health = HealthMonitor(comfyui, ws_manager, scheduler)
 
 
 @asynccontextmanager
@@ -27,9 +48,21 @@ async def lifespan(app: FastAPI):
     """Startup and shutdown lifecycle."""
     # Startup: begin ComfyUI WebSocket listener
     await ws_manager.start()
+    await job_store.start()
+    result_cache.load()
+    upload_index.load()
+    await scheduler.start()
+    await health.start()
+    # Resume jobs orphaned by the previous process (waits for ComfyUI)
+    recovery = asyncio.create_task(job_manager.recover(comfyui))
     yield
     # Shutdown: clean up connections
+    recovery.cancel()
+    await health.stop()
+    await scheduler.stop()
+    await job_store.stop()
     await ws_manager.stop()
+    upload_normalizer.stop()
     await comfyui.close()
 
 
@@ -45,27 +78,54 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "DELETE", "OPTIONS"],
-    allow_headers=["Content-Type", "Accept"],
+    allow_methods=["GET", "HEAD", "POST", "DELETE", "OPTIONS"],
+    allow_headers=["Content-Type", "Accept", "X-Client-Id", "X-API-Key", "X-Content-SHA256"],
 )
 
 # Make shared instances available to routes
 app.state.comfyui = comfyui
 app.state.ws_manager = ws_manager
+app.state.scheduler = scheduler
+app.state.job_manager = job_manager
+app.state.preprocess_cache = preprocess_cache
+app.state.upload_index = upload_index
+app.state.upload_normalizer = upload_normalizer
+
+@app.exception_handler(ComfyUIUnavailableError)
+async def comfyui_unavailable_handler(request: Request, exc: ComfyUIUnavailableError):
+    """Circuit open — fail fast instead of waiting out ComfyUI timeouts."""
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
 
 # Register route modules
 app.include_router(models.router, prefix="/api")
 app.include_router(generate.router, prefix="/api")
 app.include_router(edit.router, prefix="/api")
 app.include_router(gallery.router, prefix="/api")
+app.include_router(jobs.router, prefix="/api")
 app.include_router(ws.router, prefix="/api")
 
 
 @app.get("/api/status")
 async def get_status():
-    """Check ComfyUI connection status."""
-    connected = await comfyui.is_connected()
-    return {
-        "comfyui": connected,
-        "wsConnected": ws_manager.is_connected,
-    }
+    """ComfyUI health, served from the background monitor's snapshot."""
+    return health.snapshot()
+
+
+@app.get("/api/status/stream")
+async def stream_status(request: Request):
+    """Server-sent events: a status snapshot on every change, so dashboards don't poll."""
+    async def events():
+        async for snapshot in health.stream():
+            if await request.is_disconnected():
+                break
+            if snapshot is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"data: {json.dumps(snapshot)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,184 @@
+"""
+ControlNet preprocessor output cache.
+
+Depth, pose and lineart estimation on a reference image is deterministic, yet
+every generation that reuses the reference would run it again. Outputs are
+keyed by sha256(source image bytes, preprocessor node, its inputs) and kept
+as PNGs in a subfolder of ComfyUI's input directory (UPLOAD_DIR), named by
+key, so a later job can load the preprocessed image directly and skip the
+preprocessor.
+
+Capturing an output works through the graph itself: on a miss the builder
+adds a PreviewImage after the preprocessor and the route registers its node
+ID with watch(). When ComfyUI reports that node's (temp) image, it is copied
+into the cache folder through ComfyUI's upload API, which also works when
+ComfyUI runs on another machine.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Optional
+
+from .config import PREPROCESS_CACHE_SIZE, UPLOAD_DIR
+from .workflows.controlnet import preprocessor_node
+
+logger = logging.getLogger(__name__)
+
+# Subfolder of ComfyUI's input directory holding cached outputs
+PREPROCESS_SUBFOLDER = "matrice_preprocessed"
+
+# Capture nodes remembered while waiting for ComfyUI to run them
+MAX_WATCHED = 256
+# PreviewImage writes PNGs; anything else fetched from /view isn't an image
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class PreprocessCache:
+    """Cache key → preprocessed image filename (relative to ComfyUI's input dir)."""
+
+    def __init__(self, comfyui, upload_dir: str = UPLOAD_DIR, max_entries: int = PREPROCESS_CACHE_SIZE):
+        self.comfyui = comfyui
+        self.upload_dir = upload_dir
+        self.max_entries = max(0, max_entries)
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._watched: "OrderedDict[str, str]" = OrderedDict()  # node_id -> key
+        self._storing: set[str] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @property
+    def _local_dir(self) -> Optional[str]:
+        """Cache folder on this machine, when ComfyUI's input dir is local."""
+        if not os.path.isdir(self.upload_dir):
+            return None
+        return os.path.join(self.upload_dir, PREPROCESS_SUBFOLDER)
+
+    # ── Lookup ────────────────────────────────────────────────────────
+
+    async def resolve(self, controlnets: list[dict]) -> list[dict]:
+        """Annotate ControlNet entries for add_controlnet_chain.
+
+        A hit sets "preprocessed" to the cached image; a miss sets "cacheKey"
+        so the builder adds a capture node. Entries without a preprocessor,
+        or whose source image can't be read, are returned unchanged.
+        """
+        if not self.enabled:
+            return controlnets
+        resolved = []
+        for cn in controlnets:
+            node = preprocessor_node(cn.get("preprocessor", ""))
+            if node is None or not cn.get("image") or not cn.get("model"):
+                resolved.append(cn)
+                continue
+            try:
+                key = self.key(await self._image_digest(cn["image"]), *node)
+            except Exception as e:
+                logger.warning("Preprocess cache skipped for %s: %s", cn["image"], e)
+                resolved.append(cn)
+                continue
+            cached = self.get(key)
+            if cached:
+                logger.debug("Preprocess cache hit for %s (%s)", cn["image"], node[0])
+                resolved.append({**cn, "preprocessed": cached})
+            else:
+                resolved.append({**cn, "cacheKey": key})
+        return resolved
+
+    @staticmethod
+    def key(image_digest: str, class_type: str, inputs: dict) -> str:
+        data = json.dumps([image_digest, class_type, inputs], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached filename for a key, if the file still exists."""
+        local_dir = self._local_dir
+        if local_dir is not None:
+            # The folder itself is the index; it survives restarts
+            filename = f"{key}.png"
+            if os.path.isfile(os.path.join(local_dir, filename)):
+                return f"{PREPROCESS_SUBFOLDER}/{filename}"
+            self._entries.pop(key, None)
+            return None
+        name = self._entries.get(key)
+        if name is not None:
+            self._entries.move_to_end(key)
+        return name
+
+    async def _image_digest(self, filename: str) -> str:
+        """sha256 of an image in ComfyUI's input directory."""
+        if os.path.isdir(self.upload_dir):
+            path = os.path.join(self.upload_dir, filename)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, _file_digest, path)
+        data = await self.comfyui.get_image(filename, image_type="input")
+        return hashlib.sha256(data).hexdigest()
+
+    # ── Capture ───────────────────────────────────────────────────────
+
+    def watch(self, captures: dict[str, str]):
+        """Register {node_id: key} capture nodes of a submitted workflow."""
+        for node_id, key in captures.items():
+            self._watched[node_id] = key
+            self._watched.move_to_end(node_id)
+        while len(self._watched) > MAX_WATCHED:
+            self._watched.popitem(last=False)
+
+    def on_event(self, message: dict):
+        """WebSocketManager event listener: store watched preview outputs."""
+        if message.get("type") != "preview_output":
+            return
+        key = self._watched.pop(message.get("node", ""), None)
+        images = message.get("images") or []
+        if key is None or not images or key in self._storing:
+            return
+        self._storing.add(key)
+        asyncio.get_running_loop().create_task(self._store(key, images[0]))
+
+    async def _store(self, key: str, image: dict):
+        try:
+            data = await self.comfyui.get_image(image.get("filename", ""), image.get("subfolder", ""), "temp")
+            if not data.startswith(PNG_SIGNATURE):
+                raise ValueError("not a PNG image")
+            result = await self.comfyui.upload_image(data, f"{key}.png", subfolder=PREPROCESS_SUBFOLDER)
+            if result.get("error") or not result.get("name"):
+                raise RuntimeError(result.get("error", "no filename returned"))
+            self._entries[key] = f"{PREPROCESS_SUBFOLDER}/{result['name']}"
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            logger.debug("Cached preprocessed image %s", key[:12])
+            local_dir = self._local_dir
+            if local_dir is not None:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, _prune_dir, local_dir, self.max_entries)
+        except Exception as e:
+            logger.warning("Failed to cache preprocessed image %s: %s", key[:12], e)
+        finally:
+            self._storing.discard(key)
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _prune_dir(path: str, max_files: int):
+    """Delete the oldest files beyond max_files."""
+    try:
+        entries = [entry for entry in os.scandir(path) if entry.is_file()]
+    except FileNotFoundError:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:max(0, len(entries) - max_files)]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
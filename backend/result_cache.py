@@ -0,0 +1,89 @@
+"""
+Result cache — reuse outputs of identical, explicitly seeded requests.
+
+A request with a fixed seed builds the same workflow every time, and ComfyUI
+would spend a full diffusion run producing the same image again. Workflows
+are keyed by a canonical hash (node graph serialized with sorted keys,
+display titles dropped); a hit returns the earlier output filenames without
+submitting anything. Requests with a random seed (-1) are never cached.
+
+Entries live in memory (LRU, RESULT_CACHE_SIZE) and are persisted through
+the JobStore. An entry whose files were deleted from the gallery is dropped
+on lookup.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .config import GALLERY_DIR, RESULT_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def workflow_hash(workflow: dict) -> str:
+    """Stable hash of a workflow's nodes and inputs."""
+    canonical = {
+        node_id: {"class_type": node.get("class_type"), "inputs": node.get("inputs", {})}
+        for node_id, node in workflow.items()
+    }
+    data = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class ResultCache:
+    """Workflow hash → output filenames, LRU-bounded and optionally persisted."""
+
+    def __init__(self, store=None, max_entries: int = RESULT_CACHE_SIZE):
+        self.store = store  # optional JobStore
+        self.max_entries = max(0, max_entries)
+        self._entries: "OrderedDict[str, list[str]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def load(self):
+        """Fill the cache from the store. Blocking; call once at startup."""
+        if self.store is None or not self.enabled:
+            return
+        for key, outputs, _created_at in self.store.load_results():
+            self._entries[key] = outputs
+        self._evict()
+        logger.info("Loaded %d cached result(s)", len(self._entries))
+
+    def get(self, key: str) -> Optional[list[str]]:
+        """Output filenames for a workflow hash, if they still exist."""
+        outputs = self._entries.get(key)
+        if outputs is None:
+            return None
+        if os.path.isdir(GALLERY_DIR) and not all(
+            os.path.isfile(os.path.join(GALLERY_DIR, filename)) for filename in outputs
+        ):
+            # Deleted from the gallery since — forget it
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return list(outputs)
+
+    def put(self, key: str, outputs: list[str]):
+        if not self.enabled or not outputs:
+            return
+        self._entries[key] = list(outputs)
+        self._entries.move_to_end(key)
+        if self.store is not None:
+            self.store.save_result(key, outputs, time.time())
+        self._evict()
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        if self.store is not None:
+            self.store.delete_result(key)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
@@ -2,16 +2,24 @@
 Edit endpoint — handles img2img, inpaint, and upscale jobs.
 """
 
+import asyncio
+import io
 import logging
 import uuid
+from typing import Optional
 
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel, Field
 
+from ..circuit_breaker import ComfyUIUnavailableError
+from ..jobs import Job, JobQueueFullError, client_identity
+from ..workflows.upscale import SIZED_UPSCALE_MODES
+
 router = APIRouter(tags=["edit"])
 logger = logging.getLogger(__name__)
 
 VALID_EDIT_MODES = {"img2img", "inpaint", "upscale"}
+VALID_UPSCALE_MODES = {"latent", "tiled", "hybrid"}
 
 
 class EditLoRAConfig(BaseModel):
@@ -38,21 +46,64 @@ class EditPayload(BaseModel):
     seed: int = Field(-1, ge=-1, le=2147483647)
     denoise: float = Field(0.7, ge=0.0, le=1.0)
     jobId: str = ""  # Optional frontend-assigned job ID for WS progress tracking
+    priority: str = "normal"  # high, normal, low — backend queue ordering
     loras: list[EditLoRAConfig] = Field(default_factory=list)
     # Upscale-specific
     upscaleModel: str = ""
     upscaleMethod: str = "nearest-exact"
+    upscaleMode: str = "latent"  # latent (or model, when upscaleModel is set), tiled, hybrid
+    upscaleFactor: float = Field(2.0, ge=1.0, le=8.0)
+    tileSize: int = Field(1024, ge=256, le=2048)
+    tileOverlap: int = Field(64, ge=0, le=256)
     # Inpaint-specific
     maskBlur: int = Field(6, ge=0, le=64)
     inpaintArea: str = "full"  # full or masked_only
     inpaintPadding: int = Field(32, ge=0, le=512)
 
 
+async def _masked_region(payload: EditPayload, comfyui) -> Optional[dict]:
+    """Crop region for masked-only inpainting, or None to inpaint the full image."""
+    from ..workflows.inpaint import compute_inpaint_region
+    try:
+        mask_bytes = await comfyui.get_image(payload.mask, image_type="input")
+        loop = asyncio.get_running_loop()
+        region = await loop.run_in_executor(
+            None, compute_inpaint_region, mask_bytes, payload.inpaintPadding, payload.maskBlur
+        )
+    except ComfyUIUnavailableError:
+        raise HTTPException(status_code=503, detail="ComfyUI is unavailable")
+    except Exception as e:
+        logger.warning("Masked-only inpaint unavailable for %s, using full image: %s", payload.mask, e)
+        return None
+    if region is None:
+        logger.info("Mask %s is empty, inpainting the full image", payload.mask)
+    return region
+
+
+async def _source_size(payload: EditPayload, comfyui) -> tuple[int, int]:
+    """(width, height) of the source image in ComfyUI's input folder."""
+    try:
+        image_bytes = await comfyui.get_image(payload.image, image_type="input")
+    except ComfyUIUnavailableError:
+        raise HTTPException(status_code=503, detail="ComfyUI is unavailable")
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Could not read source image: {e}")
+
+    def read_size() -> tuple[int, int]:
+        from PIL import Image
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            return img.size
+
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, read_size)
+    except Exception:
+        raise HTTPException(status_code=400, detail=f"Unreadable source image: {payload.image}")
+
+
 @router.post("/edit")
 async def edit(payload: EditPayload, request: Request):
     """Submit an edit job (img2img, inpaint, or upscale) to ComfyUI."""
-    comfyui = request.app.state.comfyui
-    ws_manager = request.app.state.ws_manager
+    job_manager = request.app.state.job_manager
 
     if payload.mode not in VALID_EDIT_MODES:
         raise HTTPException(status_code=400, detail=f"Invalid mode: {payload.mode}")
@@ -62,34 +113,53 @@ async def edit(payload: EditPayload, request: Request):
     # Use frontend-assigned jobId if provided, otherwise generate one
     job_id = payload.jobId or uuid.uuid4().hex[:12]
 
+    if payload.mode == "upscale" and payload.upscaleMode not in VALID_UPSCALE_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid upscale mode: {payload.upscaleMode}")
+
+    region = None
+    if payload.mode == "inpaint" and payload.inpaintArea == "masked_only" and payload.mask:
+        region = await _masked_region(payload, request.app.state.comfyui)
+    source_size = None
+    if payload.mode == "upscale" and payload.upscaleMode in SIZED_UPSCALE_MODES:
+        source_size = await _source_size(payload, request.app.state.comfyui)
+
     try:
         # Build appropriate workflow based on mode
         if payload.mode == "upscale":
             from ..workflows.upscale import build_upscale_workflow
-            workflow = build_upscale_workflow(payload)
+            workflow = build_upscale_workflow(payload, source_size)
         elif payload.mode == "inpaint":
             from ..workflows.inpaint import build_inpaint_workflow
-            workflow = build_inpaint_workflow(payload)
+            workflow = build_inpaint_workflow(payload, region)
         else:
             from ..workflows.img2img import build_img2img_workflow
             workflow = build_img2img_workflow(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("Failed to build edit workflow")
         raise HTTPException(status_code=500, detail=f"Workflow build error: {str(e)}")
 
+    client_key, weight = client_identity(request)
+    job = Job(job_id, "edit", workflow, payload.priority, client_key, weight, payload.model_dump())
     try:
-        # Submit to ComfyUI
-        result = await comfyui.submit_prompt(workflow, ws_manager.client_id)
+        # Submit to ComfyUI (or hold in the backend queue)
+        result = await job_manager.submit(job)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except ComfyUIUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.exception("Failed to submit edit prompt to ComfyUI")
         raise HTTPException(status_code=502, detail=f"ComfyUI submission error: {str(e)}")
 
-    prompt_id = result.get("prompt_id", "")
-    if prompt_id:
-        ws_manager.register_prompt(prompt_id, job_id)
-
     return {
         "jobId": job_id,
-        "promptId": prompt_id,
+        "promptId": result.get("prompt_id", ""),
         "nodeErrors": result.get("node_errors", {}),
+        "queued": result.get("queued", False),
+        "cached": result.get("cached", False),
+        "coalesced": result.get("coalesced", False),
+        "outputs": job.outputs,
+        "state": job.state,
     }
@@ -2,17 +2,26 @@
 Gallery endpoints — list, serve, and delete generated images.
 """
 
+import hashlib
+import io
 import json
 import logging
 import os
 import re
+import tempfile
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
 from fastapi import APIRouter, HTTPException, Request
-from fastapi.responses import FileResponse
+import aiohttp
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
+from ..comfyui_client import iter_response_chunks
 from ..config import GALLERY_DIR
+from ..upload_index import SHA256_RE
+from ..uploads import InvalidUploadError, UploadStream, UploadTooLargeError
 
 router = APIRouter(tags=["gallery"])
 logger = logging.getLogger(__name__)
@@ -20,11 +29,17 @@ logger = logging.getLogger(__name__)
 # Security constants
 ALLOWED_IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
 MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # 50 MB
+# Allowance for multipart boundaries/headers when pre-checking Content-Length
+MULTIPART_OVERHEAD = 64 * 1024
+# Uploads are spooled while hashed: in memory up to this, then to a temp file
+UPLOAD_SPOOL_MEMORY = 1024 * 1024
+UPLOAD_SPOOL_CHUNK = 256 * 1024
 IMAGE_MAGIC_BYTES = {
     b"\x89PNG\r\n\x1a\n": ".png",
     b"\xff\xd8\xff": ".jpg",
     b"RIFF": ".webp",  # WebP starts with RIFF....WEBP
 }
+MAGIC_BYTES_LENGTH = max(len(magic) for magic in IMAGE_MAGIC_BYTES)
 
 
 def _sanitize_filename(filename: str) -> str:
@@ -57,6 +72,16 @@ def _safe_resolve(gallery_dir: Path, filename: str) -> Path:
     return resolved
 
 
+def _safe_subfolder(subfolder: str) -> str:
+    """Validate a ComfyUI output subfolder (relative, no traversal)."""
+    subfolder = subfolder.replace("\\", "/").strip("/")
+    if not subfolder:
+        return ""
+    if any(part in ("", ".", "..") for part in subfolder.split("/")):
+        raise HTTPException(status_code=400, detail="Invalid subfolder")
+    return subfolder
+
+
 def _get_gallery_dir() -> Path:
     return Path(GALLERY_DIR)
 
@@ -141,29 +166,58 @@ async def list_gallery():
     return images
 
 
-@router.get("/gallery/{filename}")
-async def serve_image(filename: str):
-    """Serve a generated image file."""
-    gallery = _get_gallery_dir()
-    filepath = _safe_resolve(gallery, filename)
+CONTENT_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+}
 
-    if not filepath.exists():
-        raise HTTPException(status_code=404, detail="Image not found")
 
+@router.get("/gallery/{filename}")
+async def serve_image(filename: str, request: Request, subfolder: str = ""):
+    """Serve a generated image file.
+
+    Fast path: when ComfyUI shares our filesystem the file is served straight
+    from GALLERY_DIR (FileResponse uses sendfile via the ASGI pathsend
+    extension when the server supports it). Otherwise the image is streamed
+    from ComfyUI's /view chunk by chunk without buffering it here.
+    """
     # Only serve known image extensions
-    suffix = filepath.suffix.lower()
+    suffix = Path(filename).suffix.lower()
     if suffix not in ALLOWED_IMAGE_EXTENSIONS:
         raise HTTPException(status_code=400, detail="Invalid file type")
+    content_type = CONTENT_TYPES.get(suffix, "application/octet-stream")
 
-    content_types = {
-        ".png": "image/png",
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-        ".webp": "image/webp",
-    }
-    content_type = content_types.get(suffix, "application/octet-stream")
+    subfolder = _safe_subfolder(subfolder)
+    gallery = _get_gallery_dir()
+    filepath = _safe_resolve(gallery / subfolder if subfolder else gallery, filename)
+    if not str(filepath).startswith(str(gallery.resolve())):
+        raise HTTPException(status_code=400, detail="Invalid filename")
 
-    return FileResponse(filepath, media_type=content_type)
+    if filepath.is_file():
+        return FileResponse(filepath, media_type=content_type)
+
+    return await _stream_from_comfyui(request.app.state.comfyui, filepath.name, subfolder, content_type)
+
+
+async def _stream_from_comfyui(comfyui, filename: str, subfolder: str, content_type: str) -> StreamingResponse:
+    """Proxy an output image from ComfyUI's /view endpoint (remote deployments)."""
+    try:
+        resp = await comfyui.open_image_stream(filename, subfolder)
+    except (aiohttp.ClientError, TimeoutError) as e:
+        logger.warning("Failed to fetch %s from ComfyUI: %s", filename, e)
+        raise HTTPException(status_code=502, detail="Could not reach ComfyUI")
+
+    if resp.status != 200:
+        resp.release()
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    headers = {}
+    if resp.content_length is not None:
+        headers["Content-Length"] = str(resp.content_length)
+    media_type = resp.headers.get("Content-Type", content_type)
+    return StreamingResponse(iter_response_chunks(resp), media_type=media_type, headers=headers)
 
 
 @router.delete("/gallery/{filename}")
@@ -184,33 +238,130 @@ async def delete_image(filename: str):
 
 
 @router.post("/upload")
-async def upload_image(request: Request):
-    """Upload an image to ComfyUI's input directory."""
+async def upload_image(request: Request, normalize: Optional[bool] = None):
+    """Upload an image to ComfyUI's input directory.
+
+    The file is streamed: checked against the magic bytes from its first
+    chunk and cut off as soon as it passes MAX_UPLOAD_SIZE. While it streams
+    in it is hashed and spooled (in memory up to UPLOAD_SPOOL_MEMORY, then
+    on disk); content already in ComfyUI's input returns the existing
+    filename without being sent upstream. When ComfyUI's input folder is
+    local the spool is a temp file inside it, renamed into place on success.
+    A client that sends the hash as X-Content-SHA256 gets an existing upload
+    back before any bytes are read.
+
+    With normalization (UPLOAD_NORMALIZE, or ?normalize=true|false for one
+    upload) the file is kept in memory instead, since the whole image gets
+    decoded anyway, and a normalized PNG is stored (see upload_normalize.py).
+    """
     comfyui = request.app.state.comfyui
-    form = await request.form()
+    index = request.app.state.upload_index
+    normalizer = request.app.state.upload_normalizer
+    if normalize is None:
+        normalize = normalizer.enabled
+
+    def index_key(sha256: str) -> str:
+        return normalizer.index_key(sha256) if normalize else sha256
+
+    claimed = request.headers.get("x-content-sha256", "").lower()
+    if claimed:
+        existing = index.get(index_key(claimed))
+        if existing:
+            return {**existing, "sha256": claimed, "normalized": normalize, "deduplicated": True}
+
+    # Refuse obviously oversized bodies before reading anything
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD:
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {MAX_UPLOAD_SIZE // (1024*1024)}MB")
 
     # Accept both 'file' and 'image' field names for compatibility
-    file = form.get("file") or form.get("image")
-    if not file:
-        raise HTTPException(status_code=400, detail="No file provided")
-
-    # Read with size limit
-    contents = await file.read()
-    if len(contents) > MAX_UPLOAD_SIZE:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large. Maximum size is {MAX_UPLOAD_SIZE // (1024*1024)}MB"
-        )
-
-    # Validate it's actually an image (magic bytes check)
-    if not _validate_image_bytes(contents):
-        raise HTTPException(status_code=400, detail="File is not a valid image")
-
-    # Sanitize filename + enforce image extension
-    safe_filename = _sanitize_filename(file.filename or "upload.png")
-    ext = os.path.splitext(safe_filename)[1].lower()
-    if ext not in ALLOWED_IMAGE_EXTENSIONS:
-        safe_filename = os.path.splitext(safe_filename)[0] + ".png"
-
-    result = await comfyui.upload_image(contents, safe_filename)
-    return result
+    stream = UploadStream(request, ("file", "image"), MAX_UPLOAD_SIZE)
+    # With ComfyUI's input folder on this machine, spool straight into it so
+    # a new upload only needs a rename; otherwise spool here and send it on
+    staged = comfyui.local is not None and not normalize
+    if normalize:
+        spool = io.BytesIO()
+    elif staged:
+        try:
+            spool = await run_in_threadpool(comfyui.local.stage)
+        except OSError as e:
+            logger.error("Cannot write to ComfyUI's input folder: %s", e)
+            raise HTTPException(status_code=500, detail="Cannot write to ComfyUI's input folder")
+    else:
+        spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MEMORY)
+    with spool:
+        try:
+            filename = await stream.open()
+
+            # Validate it's actually an image (magic bytes check)
+            if not _validate_image_bytes(await stream.peek(MAGIC_BYTES_LENGTH)):
+                raise HTTPException(status_code=400, detail="File is not a valid image")
+
+            digest = hashlib.sha256()
+            async for chunk in stream:
+                digest.update(chunk)
+                if normalize:
+                    spool.write(chunk)
+                else:
+                    await run_in_threadpool(spool.write, chunk)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except InvalidUploadError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        sha256 = digest.hexdigest()
+        existing = index.get(index_key(sha256))
+        if existing:
+            return {**existing, "sha256": sha256, "normalized": normalize, "deduplicated": True}
+
+        # Sanitize filename + enforce image extension
+        safe_filename = _sanitize_filename(filename or "upload.png")
+        ext = os.path.splitext(safe_filename)[1].lower()
+        if ext not in ALLOWED_IMAGE_EXTENSIONS:
+            safe_filename = os.path.splitext(safe_filename)[0] + ".png"
+
+        if normalize:
+            data = spool.getvalue()
+            normalized = await normalizer.normalize(data)
+            if normalized is not None:
+                data = normalized
+                safe_filename = os.path.splitext(safe_filename)[0] + ".png"
+            result = await comfyui.upload_image(data, safe_filename)
+        elif staged:
+            try:
+                result = await run_in_threadpool(spool.publish, safe_filename)
+            except OSError as e:
+                logger.error("Writing %s to ComfyUI's input folder failed: %s", safe_filename, e)
+                result = {"error": str(e)}
+        else:
+            await run_in_threadpool(spool.seek, 0)
+            result = await comfyui.upload_image_stream(_iter_spool(spool), safe_filename)
+    if result.get("name"):
+        index.put(index_key(sha256), result["name"], result.get("subfolder", ""))
+    return {**result, "sha256": sha256, "normalized": normalize, "deduplicated": False}
+
+
+async def _iter_spool(spool):
+    while True:
+        chunk = await run_in_threadpool(spool.read, UPLOAD_SPOOL_CHUNK)
+        if not chunk:
+            break
+        yield chunk
+
+
+@router.api_route("/upload/{sha256}", methods=["GET", "HEAD"])
+async def check_upload(sha256: str, request: Request, normalize: Optional[bool] = None):
+    """Look up an upload by content hash, so clients can skip sending known bytes.
+
+    normalize selects the normalized variant, as on POST /upload.
+    """
+    sha256 = sha256.lower()
+    if not SHA256_RE.match(sha256):
+        raise HTTPException(status_code=400, detail="Expected a hex SHA-256 digest")
+    normalizer = request.app.state.upload_normalizer
+    if normalize is None:
+        normalize = normalizer.enabled
+    existing = request.app.state.upload_index.get(normalizer.index_key(sha256) if normalize else sha256)
+    if not existing:
+        raise HTTPException(status_code=404, detail="Not uploaded")
+    return {**existing, "sha256": sha256}
@@ -4,15 +4,22 @@ Generation endpoint — accepts frontend payload, builds ComfyUI workflow, submi
 
 import logging
 import uuid
+from typing import Annotated
 
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel, Field
 
 from ..bundled_loras import ensure_all_bundled_loras
+from ..circuit_breaker import ComfyUIUnavailableError
+from ..jobs import Job, JobQueueFullError, client_identity
+from ..scheduler import describe_node_errors
 
 router = APIRouter(tags=["generate"])
 logger = logging.getLogger(__name__)
 
+# Upper bound on KSampler branches in one sweep workflow
+MAX_SWEEP_BRANCHES = 16
+
 
 class LoRAConfig(BaseModel):
     name: str
@@ -53,6 +60,7 @@ class FaceSwapConfig(BaseModel):
 class IPAdapterRefConfig(BaseModel):
     enabled: bool = False
     image: str = ""
+    images: list[str] = Field(default_factory=list)  # several references, batched
     strength: float = Field(0.6, ge=0.0, le=2.0)
     startPercent: float = Field(0.0, ge=0.0, le=1.0)
     endPercent: float = Field(1.0, ge=0.0, le=1.0)
@@ -79,6 +87,7 @@ class GeneratePayload(BaseModel):
     batchSize: int = Field(1, ge=1, le=16)
     performance: str = "Custom"
     jobId: str = ""  # Optional frontend-assigned job ID for WS progress tracking
+    priority: str = "normal"  # high, normal, low — backend queue ordering
     loras: list[LoRAConfig] = Field(default_factory=list)
     hiresFix: HiresFixConfig = Field(default_factory=HiresFixConfig)
     img2img: Img2ImgConfig = Field(default_factory=Img2ImgConfig)
@@ -88,39 +97,50 @@ class GeneratePayload(BaseModel):
     controlNets: list[ControlNetConfig] = Field(default_factory=list)
 
 
-@router.post("/generate")
-async def generate(payload: GeneratePayload, request: Request):
-    """Submit a generation job to ComfyUI."""
-    comfyui = request.app.state.comfyui
-    ws_manager = request.app.state.ws_manager
+class SweepConfig(BaseModel):
+    """Values to sweep; an empty list keeps the base payload value."""
+    seeds: list[Annotated[int, Field(ge=-1, le=2147483647)]] = Field(default_factory=list)
+    cfgs: list[Annotated[float, Field(ge=0.0, le=100.0)]] = Field(default_factory=list)
+    steps: list[Annotated[int, Field(ge=1, le=150)]] = Field(default_factory=list)
+    samplers: list[str] = Field(default_factory=list)
 
-    if not payload.model:
-        raise HTTPException(status_code=400, detail="No model selected")
 
-    # Use frontend-assigned jobId if provided, otherwise generate one
-    job_id = payload.jobId or uuid.uuid4().hex[:12]
+class SweepPayload(GeneratePayload):
+    sweep: SweepConfig = Field(default_factory=SweepConfig)
+
 
-    # Auto-download any missing bundled LoRAs (Flux turbo presets)
+async def _prepare_loras(payload: GeneratePayload, request: Request, job_id: str):
+    """Auto-download any missing bundled LoRAs (Flux turbo presets)."""
     lora_names = [l.name for l in payload.loras if l.name]
     if lora_names:
-        failed = await ensure_all_bundled_loras(lora_names, ws_manager, job_id)
+        ws_manager = request.app.state.ws_manager
+        failed = await ensure_all_bundled_loras(lora_names, ws_manager, job_id, request.app.state.comfyui)
         if failed:
             raise HTTPException(
                 status_code=503,
                 detail=f"Failed to download required LoRA(s): {', '.join(failed)}. Check your internet connection.",
             )
 
-    try:
-        # Build workflow from payload
-        from ..workflows.txt2img import build_txt2img_workflow
-        workflow = build_txt2img_workflow(payload)
-    except Exception as e:
-        logger.exception("Failed to build workflow")
-        raise HTTPException(status_code=500, detail=f"Workflow build error: {str(e)}")
 
+async def _prepare_controlnets(payload: GeneratePayload, request: Request) -> list[dict]:
+    """Enabled ControlNets, pointed at cached preprocessor outputs where available."""
+    from ..workflows.txt2img import active_controlnets
+    controlnets = active_controlnets(payload)
+    if not controlnets:
+        return controlnets
+    return await request.app.state.preprocess_cache.resolve(controlnets)
+
+
+async def _submit_job(job: Job, request: Request) -> dict:
+    """Hand a job to the JobManager and shape the response."""
+    job_manager = request.app.state.job_manager
     try:
-        # Submit to ComfyUI
-        result = await comfyui.submit_prompt(workflow, ws_manager.client_id)
+        # Submit to ComfyUI (or hold in the backend queue)
+        result = await job_manager.submit(job)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except ComfyUIUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.exception("Failed to submit prompt to ComfyUI")
         raise HTTPException(status_code=502, detail=f"ComfyUI submission error: {str(e)}")
@@ -130,22 +150,84 @@ async def generate(payload: GeneratePayload, request: Request):
 
     # If ComfyUI rejected the prompt (validation failure), return an error
     if not prompt_id and node_errors:
-        # Extract first meaningful error message
-        error_details = []
-        for node_id, err_info in node_errors.items():
-            if isinstance(err_info, str):
-                error_details.append(err_info)
-            elif isinstance(err_info, dict):
-                for err in err_info.get("errors", []):
-                    error_details.append(err.get("message", "") + ": " + err.get("details", ""))
-        detail_msg = "; ".join(error_details) if error_details else "ComfyUI rejected the prompt"
-        raise HTTPException(status_code=502, detail=detail_msg)
-
-    if prompt_id:
-        ws_manager.register_prompt(prompt_id, job_id)
+        raise HTTPException(status_code=502, detail=describe_node_errors(node_errors))
 
     return {
-        "jobId": job_id,
+        "jobId": job.job_id,
         "promptId": prompt_id,
         "nodeErrors": node_errors,
+        "queued": result.get("queued", False),
+        "cached": result.get("cached", False),
+        "coalesced": result.get("coalesced", False),
+        "outputs": job.outputs,
+        "state": job.state,
     }
+
+
+@router.post("/generate")
+async def generate(payload: GeneratePayload, request: Request):
+    """Submit a generation job to ComfyUI."""
+    if not payload.model:
+        raise HTTPException(status_code=400, detail="No model selected")
+
+    # Use frontend-assigned jobId if provided, otherwise generate one
+    job_id = payload.jobId or uuid.uuid4().hex[:12]
+    await _prepare_loras(payload, request, job_id)
+    controlnets = await _prepare_controlnets(payload, request)
+
+    captures: dict[str, str] = {}
+    try:
+        # Build workflow from payload (patched from a compiled template
+        # unless IP-Adapter/ControlNet/img2img/face swap are in use)
+        from ..workflows.templates import build_txt2img_from_template
+        workflow = build_txt2img_from_template(payload, controlnets, captures)
+    except Exception as e:
+        logger.exception("Failed to build workflow")
+        raise HTTPException(status_code=500, detail=f"Workflow build error: {str(e)}")
+    request.app.state.preprocess_cache.watch(captures)
+
+    client_key, weight = client_identity(request)
+    job = Job(job_id, "generate", workflow, payload.priority, client_key, weight, payload.model_dump())
+    return await _submit_job(job, request)
+
+
+@router.post("/generate/sweep")
+async def generate_sweep(payload: SweepPayload, request: Request):
+    """Submit a seed/CFG/steps/sampler sweep as one workflow.
+
+    Models load and prompts encode once; each combination gets its own
+    KSampler branch and SaveImage. A "branch_complete" WebSocket event is
+    sent as each branch's image is saved.
+    """
+    if not payload.model:
+        raise HTTPException(status_code=400, detail="No model selected")
+    sweep = payload.sweep
+    branch_count = (
+        max(1, len(sweep.seeds)) * max(1, len(sweep.cfgs))
+        * max(1, len(sweep.steps)) * max(1, len(sweep.samplers))
+    )
+    if branch_count > MAX_SWEEP_BRANCHES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Sweep has {branch_count} combinations (limit {MAX_SWEEP_BRANCHES})",
+        )
+
+    job_id = payload.jobId or uuid.uuid4().hex[:12]
+    await _prepare_loras(payload, request, job_id)
+    controlnets = await _prepare_controlnets(payload, request)
+
+    captures: dict[str, str] = {}
+    try:
+        from ..workflows.txt2img import build_txt2img_sweep_workflow
+        workflow, branches = build_txt2img_sweep_workflow(payload, controlnets, captures)
+    except Exception as e:
+        logger.exception("Failed to build sweep workflow")
+        raise HTTPException(status_code=500, detail=f"Workflow build error: {str(e)}")
+    request.app.state.preprocess_cache.watch(captures)
+
+    client_key, weight = client_identity(request)
+    job = Job(job_id, "generate", workflow, payload.priority, client_key, weight, payload.model_dump())
+    job.branches = branches
+    response = await _submit_job(job, request)
+    response["branches"] = branches
+    return response
@@ -0,0 +1,65 @@
+"""
+Job endpoints — query status and cancel backend jobs.
+
+Lets clients recover from a missed WebSocket event by polling instead of
+waiting on a spinner forever.
+"""
+
+import logging
+
+from fastapi import APIRouter, HTTPException, Request
+
+from ..circuit_breaker import ComfyUIUnavailableError
+from ..jobs import FINISHED_STATES, CancelFailedError
+
+router = APIRouter(tags=["jobs"])
+logger = logging.getLogger(__name__)
+
+# Upper bound on /jobs results
+MAX_LIST_LIMIT = 500
+
+
+@router.get("/jobs")
+async def list_jobs(request: Request, state: str = "", client: str = "", limit: int = 100):
+    """List tracked jobs, newest first.
+
+    state: a job state, or "active" for everything not yet finished.
+    client: fair-share client key as shown in job records.
+    """
+    job_manager = request.app.state.job_manager
+    limit = max(1, min(limit, MAX_LIST_LIMIT))
+    jobs = job_manager.list_jobs(state, client)
+    return {
+        "jobs": [job.to_dict() for job in jobs[:limit]],
+        "total": len(jobs),
+    }
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    """Current state, progress, ETA and outputs of a single job."""
+    job = request.app.state.job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, request: Request):
+    """Cancel a queued or running job."""
+    job_manager = request.app.state.job_manager
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.state in FINISHED_STATES:
+        raise HTTPException(status_code=409, detail=f"Job already {job.state}")
+    try:
+        job = await job_manager.cancel(job_id)
+    except ComfyUIUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except CancelFailedError as e:
+        raise HTTPException(status_code=502, detail=f"ComfyUI cancel error: {e}")
+    except Exception as e:
+        logger.exception("Failed to cancel job %s in ComfyUI", job_id)
+        raise HTTPException(status_code=502, detail=f"ComfyUI cancel error: {str(e)}")
+    return job.to_dict()
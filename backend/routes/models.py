@@ -4,14 +4,18 @@ Model discovery endpoints — dynamically fetches available models from ComfyUI.
 
 import logging
 
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, HTTPException, Request
 
 router = APIRouter(tags=["models"])
 logger = logging.getLogger(__name__)
 
 
 def get_comfyui(request: Request):
-    return request.app.state.comfyui
+    """Return the shared client, failing fast with 503 while its circuit is open."""
+    client = request.app.state.comfyui
+    if client.breaker.is_open:
+        raise HTTPException(status_code=503, detail="ComfyUI is unavailable")
+    return client
 
 
 @router.get("/models")
@@ -21,8 +25,8 @@ async def list_models(request: Request):
     Combines standard checkpoint/diffusion_models folders with GGUF loader
     node types so Flux GGUF models show up even when stored in the unet/ folder.
     """
+    client = get_comfyui(request)
     try:
-        client = get_comfyui(request)
         return await client.get_all_unet_models()
     except Exception as e:
         logger.warning("Failed to fetch models from ComfyUI: %s", e)
@@ -32,8 +36,8 @@ async def list_models(request: Request):
 @router.get("/diffusion-models")
 async def list_diffusion_models(request: Request):
     """List diffusion model files (e.g., Flux GGUF)."""
+    client = get_comfyui(request)
     try:
-        client = get_comfyui(request)
         return await client.get_models("diffusion_models")
     except Exception as e:
         logger.warning("Failed to fetch diffusion models from ComfyUI: %s", e)
@@ -43,8 +47,8 @@ async def list_diffusion_models(request: Request):
 @router.get("/loras")
 async def list_loras(request: Request):
     """List LoRA files."""
+    client = get_comfyui(request)
     try:
-        client = get_comfyui(request)
         return await client.get_models("loras")
     except Exception as e:
         logger.warning("Failed to fetch LoRAs from ComfyUI: %s", e)
@@ -54,8 +58,8 @@ async def list_loras(request: Request):
 @router.get("/vaes")
 async def list_vaes(request: Request):
     """List VAE files."""
+    client = get_comfyui(request)
     try:
-        client = get_comfyui(request)
         return await client.get_models("vae")
     except Exception as e:
         logger.warning("Failed to fetch VAEs from ComfyUI: %s", e)
@@ -65,8 +69,8 @@ async def list_vaes(request: Request):
 @router.get("/controlnets")
 async def list_controlnets(request: Request):
     """List ControlNet model files."""
+    client = get_comfyui(request)
     try:
-        client = get_comfyui(request)
         return await client.get_models("controlnet")
     except Exception as e:
         logger.warning("Failed to fetch ControlNets from ComfyUI: %s", e)
@@ -76,8 +80,8 @@ async def list_controlnets(request: Request):
 @router.get("/upscalers")
 async def list_upscalers(request: Request):
     """List upscale model files."""
+    client = get_comfyui(request)
     try:
-        client = get_comfyui(request)
         return await client.get_models("upscale_models")
     except Exception as e:
         logger.warning("Failed to fetch upscalers from ComfyUI: %s", e)
@@ -90,8 +94,8 @@ async def list_clip_models(request: Request):
 
     Checks standard clip folder and also GGUF CLIP loader nodes.
     """
+    client = get_comfyui(request)
     try:
-        client = get_comfyui(request)
         models = set(await client.get_models("clip"))
 
         # Also check GGUF CLIP loaders
@@ -112,8 +116,8 @@ async def list_clip_models(request: Request):
 @router.get("/ipadapter-models")
 async def list_ipadapter_models(request: Request):
     """List IP-Adapter model files."""
+    client = get_comfyui(request)
     try:
-        client = get_comfyui(request)
         return await client.get_models("ipadapter")
     except Exception as e:
         logger.warning("Failed to fetch IP-Adapter models from ComfyUI: %s", e)
@@ -123,8 +127,8 @@ async def list_ipadapter_models(request: Request):
 @router.get("/clip-vision-models")
 async def list_clip_vision_models(request: Request):
     """List CLIP Vision model files."""
+    client = get_comfyui(request)
     try:
-        client = get_comfyui(request)
         return await client.get_models("clip_vision")
     except Exception as e:
         logger.warning("Failed to fetch CLIP Vision models from ComfyUI: %s", e)
@@ -134,8 +138,8 @@ async def list_clip_vision_models(request: Request):
 @router.get("/embeddings")
 async def list_embeddings(request: Request):
     """List available text embeddings."""
+    client = get_comfyui(request)
     try:
-        client = get_comfyui(request)
         return await client.get_embeddings()
     except Exception as e:
         logger.warning("Failed to fetch embeddings from ComfyUI: %s", e)
@@ -145,8 +149,8 @@ async def list_embeddings(request: Request):
 @router.get("/samplers")
 async def list_samplers(request: Request):
     """Get available samplers and schedulers from ComfyUI's KSampler node."""
+    client = get_comfyui(request)
     try:
-        client = get_comfyui(request)
         return await client.get_samplers_and_schedulers()
     except Exception as e:
         logger.warning("Failed to fetch samplers from ComfyUI: %s", e)
@@ -156,8 +160,8 @@ async def list_samplers(request: Request):
 @router.get("/preprocessors")
 async def list_preprocessors(request: Request):
     """List available ControlNet preprocessor nodes."""
+    client = get_comfyui(request)
     try:
-        client = get_comfyui(request)
         return await client.get_controlnet_preprocessors()
     except Exception as e:
         logger.warning("Failed to fetch preprocessors from ComfyUI: %s", e)
@@ -0,0 +1,319 @@
+"""
+Model-affinity prompt scheduler.
+
+Sits in front of ComfyUIClient.submit_prompt. ComfyUI executes one prompt at a
+time and keeps the last model chain resident, so switching between e.g. a Flux
+GGUF stack and an SDXL checkpoint costs a full reload. Instead of forwarding
+every request straight into ComfyUI's FIFO queue, we hand it at most
+SCHEDULER_MAX_INFLIGHT prompts and hold the rest here, picking the next one
+whose model/VAE/CLIP/LoRA stack matches what ComfyUI last ran.
+
+Pending jobs are kept per client (API key / client id / address), each
+queue ordered by priority rank, then arrival. Selection happens in three
+steps:
+
+1. Priority — only clients whose head job is in the most urgent band present
+   are eligible; a lower-priority job never overtakes a higher one.
+2. Fair share — deficit round robin across eligible clients. Each visit
+   credits a client FAIR_SHARE_QUANTUM × its weight; a job is dispatched once
+   the client's deficit covers its estimated cost (sampler steps × images ×
+   megapixels). A client flooding 16-image batches therefore can't starve
+   others: everyone's wait is bounded by one round of the other clients.
+3. Model affinity — within the chosen client's queue, prefer the oldest job
+   on the chain ComfyUI last ran, overtaking others at most
+   SCHEDULER_MAX_SKIPS times.
+
+(A plain asyncio.PriorityQueue can't be used here because the picker has to
+look past the head of each queue.)
+"""
+
+import asyncio
+import bisect
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from .circuit_breaker import ComfyUIUnavailableError
+from .config import (
+    SCHEDULER_MAX_INFLIGHT,
+    SCHEDULER_MAX_SKIPS,
+    FAIR_SHARE_QUANTUM,
+)
+
+logger = logging.getLogger(__name__)
+
+# How often to re-check ComfyUI's /queue when completions may have been missed
+# (e.g. the WebSocket dropped while a prompt was running)
+RECONCILE_INTERVAL = 10.0
+
+
+def describe_node_errors(node_errors: dict) -> str:
+    """Flatten ComfyUI's node_errors into a single readable message."""
+    error_details = []
+    for node_id, err_info in node_errors.items():
+        if isinstance(err_info, str):
+            error_details.append(err_info)
+        elif isinstance(err_info, dict):
+            for err in err_info.get("errors", []):
+                error_details.append(err.get("message", "") + ": " + err.get("details", ""))
+    return "; ".join(error_details) if error_details else "ComfyUI rejected the prompt"
+
+
+class PromptScheduler:
+    """Dispatches workflows to ComfyUI, grouping jobs that share a model chain."""
+
+    def __init__(
+        self,
+        comfyui,
+        ws_manager,
+        max_inflight: int = SCHEDULER_MAX_INFLIGHT,
+        max_skips: int = SCHEDULER_MAX_SKIPS,
+        quantum: float = FAIR_SHARE_QUANTUM,
+    ):
+        self.comfyui = comfyui
+        self.ws_manager = ws_manager
+        self.max_inflight = max(1, max_inflight)
+        self.max_skips = max(0, max_skips)
+        self.quantum = max(1.0, quantum)
+        # client_key -> Job objects sorted by (rank, arrival); dict order is
+        # the round-robin order
+        self._queues: "OrderedDict[str, list]" = OrderedDict()
+        self._deficits: dict[str, float] = {}
+        self._weights: dict[str, float] = {}
+        self._pending_total = 0
+        self._seq = itertools.count()
+        self._inflight: dict[str, tuple] = {}  # prompt_id -> model chain key
+        self._dispatching = 0  # submissions currently awaiting ComfyUI's reply
+        self._last_chain: Optional[tuple] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._dispatch_listeners: list[Callable] = []
+        self._lost_listeners: list[Callable] = []
+        self._reconciled_at = 0.0
+
+        ws_manager.add_finish_listener(self.prompt_finished)
+
+    # ── Lifecycle ─────────────────────────────────────────────────────
+
+    async def start(self):
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._dispatch_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    # ── Submission ────────────────────────────────────────────────────
+
+    @property
+    def pending_count(self) -> int:
+        return self._pending_total
+
+    def pending_for(self, client_key: str) -> int:
+        return len(self._queues.get(client_key, ()))
+
+    def add_dispatch_listener(self, callback: Callable):
+        """Call callback(job, result) after each submission attempt to ComfyUI."""
+        self._dispatch_listeners.append(callback)
+
+    def add_lost_listener(self, callback: Callable):
+        """Await callback(prompt_id) for in-flight prompts that left ComfyUI's queue unannounced."""
+        self._lost_listeners.append(callback)
+
+    async def submit(self, job) -> dict:
+        """Submit a job's workflow, or hold it until ComfyUI has a free slot.
+
+        When nothing is waiting and a slot is free the prompt goes straight to
+        ComfyUI and its response is returned as-is. Otherwise the job is queued
+        here and {"prompt_id": "", "queued": True} is returned; the prompt is
+        registered with the WebSocketManager once dispatched, and a failed
+        dispatch is reported as an "error" event for the job.
+        """
+        if not self._pending_total and self._has_capacity():
+            return await self._dispatch(job)
+
+        self.enqueue(job)
+        return {"prompt_id": "", "node_errors": {}, "queued": True}
+
+    def enqueue(self, job):
+        """Queue a job for the dispatch loop (never dispatches inline)."""
+        job.seq = next(self._seq)
+        self._weights[job.client_key] = job.weight
+        queue = self._queues.setdefault(job.client_key, [])
+        bisect.insort(queue, job, key=lambda j: (j.rank, j.seq))
+        self._pending_total += 1
+        self._wakeup.set()
+
+    def remove(self, job) -> bool:
+        """Drop a job that is still waiting here. False if it already left."""
+        queue = self._queues.get(job.client_key)
+        if not queue or job not in queue:
+            return False
+        queue.remove(job)
+        self._pending_total -= 1
+        if not queue:
+            del self._queues[job.client_key]
+            self._deficits.pop(job.client_key, None)
+            self._weights.pop(job.client_key, None)
+        return True
+
+    def adopt(self, prompt_id: str, chain: tuple):
+        """Count a prompt already in ComfyUI's queue (e.g. after a backend restart)."""
+        self._inflight[prompt_id] = chain
+
+    def prompt_finished(self, prompt_id: str, error: str = ""):
+        """Free the slot held by a prompt (called by the WebSocketManager)."""
+        if self._inflight.pop(prompt_id, None) is not None:
+            self._wakeup.set()
+
+    def snapshot(self) -> dict:
+        return {
+            "pending": self._pending_total,
+            "inflight": len(self._inflight) + self._dispatching,
+            "maxInflight": self.max_inflight,
+            "clients": {client: len(queue) for client, queue in self._queues.items()},
+        }
+
+    # ── Internals ─────────────────────────────────────────────────────
+
+    def _has_capacity(self) -> bool:
+        return len(self._inflight) + self._dispatching < self.max_inflight
+
+    def _weight(self, client_key: str) -> float:
+        return max(0.01, self._weights.get(client_key, 1.0))
+
+    def _pick_next(self):
+        """Pop the next job: top priority band, then deficit round robin, then affinity."""
+        top_rank = min(queue[0].rank for queue in self._queues.values())
+        while True:
+            client, queue = next(iter(self._queues.items()))
+            if queue[0].rank != top_rank:
+                # Not eligible this round — no credit, just rotate
+                self._queues.move_to_end(client)
+                continue
+
+            index = self._pick_index(queue)
+            job = queue[index]
+            deficit = self._deficits.get(client, 0.0)
+            if deficit >= job.cost:
+                self._deficits[client] = deficit - job.cost
+                for passed in queue[:index]:
+                    passed.skips += 1
+                queue.pop(index)
+                self._pending_total -= 1
+                if not queue:
+                    # Idle clients don't bank credit
+                    del self._queues[client]
+                    self._deficits.pop(client, None)
+                    self._weights.pop(client, None)
+                return job
+
+            self._deficits[client] = deficit + self.quantum * self._weight(client)
+            self._queues.move_to_end(client)
+
+    def _pick_index(self, queue: list) -> int:
+        """Index of the oldest job on the current model chain, within the fairness bound.
+
+        Walks the queue's most urgent priority band in arrival order and stops
+        at the first job that either matches the last dispatched chain or has
+        already been skipped max_skips times. Falls back to the oldest job.
+        """
+        top_rank = queue[0].rank
+        for i, job in enumerate(queue):
+            if job.rank != top_rank:
+                break
+            if job.chain == self._last_chain or job.skips >= self.max_skips:
+                return i
+        return 0
+
+    async def _dispatch(self, job) -> dict:
+        self._dispatching += 1
+        try:
+            result = await self.comfyui.submit_prompt(job.workflow, self.ws_manager.client_id)
+        finally:
+            self._dispatching -= 1
+
+        prompt_id = result.get("prompt_id", "")
+        if prompt_id:
+            self._inflight[prompt_id] = job.chain
+            self._last_chain = job.chain
+            self.ws_manager.register_prompt(prompt_id, job.job_id)
+        self._notify_dispatched(job, result)
+        return result
+
+    def _notify_dispatched(self, job, result: dict):
+        for callback in self._dispatch_listeners:
+            try:
+                callback(job, result)
+            except Exception as e:
+                logger.debug("Dispatch listener error: %s", e)
+
+    async def _dispatch_loop(self):
+        while True:
+            self._wakeup.clear()
+            while self._pending_total and self._has_capacity():
+                job = self._pick_next()
+                try:
+                    result = await self._dispatch(job)
+                except Exception as e:
+                    logger.warning("Deferred prompt submission failed for job %s: %s", job.job_id, e)
+                    result = {"prompt_id": "", "node_errors": {"submit": f"ComfyUI submission error: {e}"}}
+                    self._notify_dispatched(job, result)
+                if not result.get("prompt_id"):
+                    await self.ws_manager.broadcast({
+                        "type": "error",
+                        "jobId": job.job_id,
+                        "promptId": "",
+                        "message": describe_node_errors(result.get("node_errors", {})),
+                    })
+
+            # asyncio.wait rather than wait_for: on Python < 3.12 wait_for can
+            # swallow a cancel that races with the event being set, which
+            # would leave stop() waiting forever
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                done, _ = await asyncio.wait({waiter}, timeout=RECONCILE_INTERVAL)
+            finally:
+                waiter.cancel()
+            # Checked on a timer rather than only when idle, so a lost
+            # completion can't hold a slot while other jobs keep arriving
+            if self._inflight and time.monotonic() - self._reconciled_at >= RECONCILE_INTERVAL:
+                self._reconciled_at = time.monotonic()
+                await self._reconcile()
+
+    async def _reconcile(self):
+        """Free in-flight prompts ComfyUI no longer has queued and report them lost.
+
+        Their completion events were missed; the lost listeners settle them
+        (the JobManager from /history).
+        """
+        # Prompts dispatched while /queue is being fetched may not be listed yet
+        candidates = set(self._inflight)
+        try:
+            queue = await self.comfyui.get_queue()
+        except ComfyUIUnavailableError:
+            return
+        if not queue:
+            return
+        live = {
+            item[1]
+            for key in ("queue_running", "queue_pending")
+            for item in queue.get(key, [])
+            if len(item) > 1
+        }
+        for prompt_id in candidates - live:
+            if self._inflight.pop(prompt_id, None) is None:
+                continue  # finished meanwhile
+            logger.info("Prompt %s left ComfyUI's queue without a completion event", prompt_id)
+            for callback in self._lost_listeners:
+                try:
+                    await callback(prompt_id)
+                except Exception as e:
+                    logger.warning("Lost-prompt listener error for %s: %s", prompt_id, e)
@@ -0,0 +1,44 @@
+"""
+Microbenchmark: txt2img workflows from WorkflowBuilder vs compiled templates.
+
+Run with `python -m backend.tests.bench_templates`.
+"""
+
+import time
+
+from backend.routes.generate import GeneratePayload
+from backend.workflows.templates import build_txt2img_from_template
+from backend.workflows.txt2img import build_txt2img_workflow
+
+ROUNDS = 5
+
+
+def sample_payloads(count: int = 2000) -> list[GeneratePayload]:
+    return [
+        GeneratePayload(
+            model="sdxl.safetensors" if i % 2 else "flux-dev-Q4.gguf",
+            prompt=f"a photo of subject {i}",
+            seed=i,
+            cfg=5.0 + i % 4,
+            loras=[{"name": f"style{i % 3}.safetensors"}] * (i % 3),
+            clipSkip=1 + i % 2,
+            hiresFix={"enabled": i % 5 == 0},
+        )
+        for i in range(count)
+    ]
+
+
+def main():
+    payloads = sample_payloads()
+    for name, build in (("WorkflowBuilder", build_txt2img_workflow), ("template", build_txt2img_from_template)):
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            for payload in payloads:
+                build(payload)
+        elapsed = time.perf_counter() - start
+        calls = ROUNDS * len(payloads)
+        print(f"{name:>16}: {elapsed / calls * 1e6:8.1f} µs/workflow  ({calls / elapsed:,.0f} workflows/s)")
+
+
+if __name__ == "__main__":
+    main()
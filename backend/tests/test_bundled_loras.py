@@ -0,0 +1,156 @@
+"""
+Resumable, segmented LoRA downloads (bundled_loras._download_file_sync)
+against a local HTTP server with Range / If-Range support.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from backend import bundled_loras
+
+SEGMENT_SIZE = 256 * 1024
+DATA = os.urandom(3 * SEGMENT_SIZE + 12345)
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves DATA with byte ranges; If-Range is checked against server.etag."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        start, end, status = 0, len(DATA) - 1, 200
+        if range_header and (if_range is None or if_range == server.etag):
+            first, _, last = range_header.removeprefix("bytes=").partition("-")
+            start = int(first)
+            end = min(int(last), len(DATA) - 1) if last else len(DATA) - 1
+            status = 206
+        with server.lock:
+            server.requests.append((range_header, if_range, status))
+        body = DATA[start:end + 1]
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", server.etag)
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(DATA)}")
+        self.end_headers()
+        if server.cut_after is not None and len(body) > server.cut_after:
+            # Drop the connection mid-body
+            self.wfile.write(body[:server.cut_after])
+            self.wfile.flush()
+            server.cut_after = None
+            return
+        self.wfile.write(body)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.etag = '"v1"'
+        self.cut_after = None  # truncate the next long response after this many bytes
+        self.requests = []
+
+    def handle_error(self, request, client_address):
+        pass  # the probe closes its connection before reading the body
+
+    def ranged_requests(self) -> list:
+        """Range headers of the download requests (the one-byte probe excluded)."""
+        return [r for r, _, _ in self.requests if r and r != "bytes=0-0"]
+
+
+class DownloadFileSyncTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = _Server()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/lora.safetensors"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.reset()
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.dest = os.path.join(self.dir, "lora.safetensors")
+        self.tmp = self.dest + ".tmp"
+        for name, value in (
+            ("MIN_SEGMENT_SIZE", SEGMENT_SIZE),
+            ("DOWNLOAD_CHUNK_SIZE", 16 * 1024),
+            ("LORA_DOWNLOAD_RETRIES", 1),
+        ):
+            patcher = mock.patch.object(bundled_loras, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def download(self, sha256: str = SHA256, connections: int = 1) -> bool:
+        return bundled_loras._download_file_sync(self.url, self.dest, "test", None, sha256, connections)
+
+    def assertInstalled(self):
+        with open(self.dest, "rb") as f:
+            self.assertEqual(f.read(), DATA)
+        self.assertEqual(os.listdir(self.dir), ["lora.safetensors"])
+
+    def test_segmented_download_uses_several_connections(self):
+        self.assertTrue(self.download(connections=3))
+        self.assertInstalled()
+        starts = {int(r.removeprefix("bytes=").split("-")[0]) for r in self.server.ranged_requests()}
+        self.assertEqual(len(starts), 3)
+        self.assertTrue(all(status == 206 for _, _, status in self.server.requests))
+
+    def test_resumes_from_kept_partial(self):
+        self.server.cut_after = SEGMENT_SIZE
+        self.assertFalse(self.download())
+        self.assertTrue(os.path.isfile(self.tmp))
+        with open(self.tmp + ".json", encoding="utf-8") as f:
+            state = json.load(f)
+        done = state["segments"][0][2]
+        self.assertGreater(done, 0)
+
+        self.server.requests.clear()
+        self.assertTrue(self.download())
+        self.assertInstalled()
+        self.assertEqual(self.server.requests, [(f"bytes={done}-{len(DATA) - 1}", '"v1"', 206)])
+
+    def test_restarts_from_zero_when_etag_changes(self):
+        # A kept partial whose first bytes are not the current file's
+        self.server.cut_after = SEGMENT_SIZE
+        self.assertFalse(self.download())
+        with open(self.tmp, "r+b") as f:
+            f.write(b"\0" * 1024)
+
+        self.server.etag = '"v2"'
+        self.server.requests.clear()
+        self.assertTrue(self.download())
+        self.assertInstalled()
+        _, if_range, status = self.server.requests[0]
+        self.assertEqual((if_range, status), ('"v1"', 200))
+
+    def test_sha256_mismatch_deletes_download(self):
+        self.assertFalse(self.download(sha256="0" * 64, connections=3))
+        self.assertEqual(os.listdir(self.dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
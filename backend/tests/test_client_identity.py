@@ -0,0 +1,52 @@
+"""
+Fair-share keys from request headers (jobs.client_identity).
+"""
+
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from backend import jobs
+
+
+def _request(host: str = "10.0.0.1", **headers) -> SimpleNamespace:
+    return SimpleNamespace(headers={k.replace("_", "-"): v for k, v in headers.items()}, client=SimpleNamespace(host=host))
+
+
+class ClientIdentityTest(unittest.TestCase):
+    def setUp(self):
+        for name, value in (
+            ("_peer_ids", type(jobs._peer_ids)()),
+            ("FAIR_SHARE_API_KEYS", {"trusted-key"}),
+            ("FAIR_SHARE_WEIGHTS", {"weighted-key": 2.0}),
+            ("FAIR_SHARE_MAX_IDS_PER_PEER", 2),
+        ):
+            patcher = mock.patch.object(jobs, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_no_headers_uses_peer_address(self):
+        self.assertEqual(jobs.client_identity(_request()), ("ip:10.0.0.1", 1.0))
+
+    def test_rotating_client_ids_fall_back_to_peer(self):
+        keys = [jobs.client_identity(_request(x_client_id=f"id{i}"))[0] for i in range(5)]
+        self.assertEqual(keys, ["client:id0", "client:id1", "ip:10.0.0.1", "ip:10.0.0.1", "ip:10.0.0.1"])
+        # Ids already granted keep their queue; other peers have their own allowance
+        self.assertEqual(jobs.client_identity(_request(x_client_id="id1"))[0], "client:id1")
+        self.assertEqual(jobs.client_identity(_request("10.0.0.2", x_client_id="id9"))[0], "client:id9")
+
+    def test_trusted_api_keys_are_not_capped(self):
+        for i in range(3):
+            jobs.client_identity(_request(x_client_id=f"id{i}"))
+        key, _ = jobs.client_identity(_request(x_api_key="trusted-key"))
+        self.assertTrue(key.startswith("key:"))
+        self.assertEqual(jobs.client_identity(_request(x_api_key="weighted-key"))[1], 2.0)
+
+    def test_untrusted_api_keys_count_against_the_peer(self):
+        keys = {jobs.client_identity(_request(x_api_key=f"made-up-{i}"))[0] for i in range(10)}
+        self.assertEqual(len(keys), 3)
+        self.assertIn("ip:10.0.0.1", keys)
+
+
+if __name__ == "__main__":
+    unittest.main()
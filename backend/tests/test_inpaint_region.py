@@ -0,0 +1,66 @@
+"""
+compute_inpaint_region() on the mask encodings the edit canvas and users send.
+"""
+
+import io
+import unittest
+
+from PIL import Image, ImageDraw
+
+from backend.workflows.inpaint import compute_inpaint_region
+
+BOX = (200, 100, 300, 150)  # 100×50 masked box in a 512×512 mask
+
+
+def _png(image: Image.Image) -> bytes:
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+def _white_on_black(mode: str) -> bytes:
+    """Opaque mask in RGB or RGBA with BOX painted white."""
+    image = Image.new(mode, (512, 512), (0, 0, 0, 255)[:len(mode)])
+    ImageDraw.Draw(image).rectangle((BOX[0], BOX[1], BOX[2] - 1, BOX[3] - 1), fill=(255,) * len(mode))
+    return _png(image)
+
+
+class ComputeInpaintRegionTest(unittest.TestCase):
+    def assertCoversBox(self, region: dict):
+        self.assertIsNotNone(region)
+        self.assertLessEqual(region["x"], BOX[0])
+        self.assertLessEqual(region["y"], BOX[1])
+        self.assertGreaterEqual(region["x"] + region["width"], BOX[2])
+        self.assertGreaterEqual(region["y"] + region["height"], BOX[3])
+        self.assertEqual(region["width"] % 8, 0)
+        self.assertEqual(region["height"] % 8, 0)
+        self.assertEqual(region["targetWidth"] % 64, 0)
+        self.assertEqual(region["targetHeight"] % 64, 0)
+
+    def test_opaque_rgba_mask_is_read_from_red(self):
+        # What the edit canvas exports via toDataURL
+        region = compute_inpaint_region(_white_on_black("RGBA"), padding=0)
+        self.assertCoversBox(region)
+        self.assertEqual(region["maskSource"], "red")
+        self.assertEqual((region["width"], region["height"]), (104, 56))
+
+    def test_rgb_mask_is_read_from_red(self):
+        region = compute_inpaint_region(_white_on_black("RGB"), padding=16)
+        self.assertCoversBox(region)
+        self.assertEqual(region["maskSource"], "red")
+        self.assertEqual((region["x"], region["y"]), (BOX[0] - 16, BOX[1] - 16))
+
+    def test_transparent_area_of_alpha_mask_is_masked(self):
+        image = Image.new("RGBA", (512, 512), (0, 0, 0, 255))
+        ImageDraw.Draw(image).rectangle((BOX[0], BOX[1], BOX[2] - 1, BOX[3] - 1), fill=(0, 0, 0, 0))
+        region = compute_inpaint_region(_png(image), padding=0)
+        self.assertCoversBox(region)
+        self.assertEqual(region["maskSource"], "alpha")
+
+    def test_empty_mask_gives_none(self):
+        self.assertIsNone(compute_inpaint_region(_png(Image.new("RGBA", (64, 64), (0, 0, 0, 255))), padding=8))
+        self.assertIsNone(compute_inpaint_region(_png(Image.new("RGB", (64, 64))), padding=8))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Compiled txt2img templates must produce the graph WorkflowBuilder builds.
+"""
+
+import itertools
+import unittest
+
+from backend.routes.generate import GeneratePayload
+from backend.workflows.templates import build_txt2img_from_template
+from backend.workflows.txt2img import build_txt2img_workflow
+
+
+def canonical(workflow: dict) -> list:
+    """Nodes with links replaced by their target's canonical form, sorted.
+
+    Node IDs differ between a template (placeholder build) and a direct
+    build, so graphs are compared by structure, inputs and titles.
+    """
+    memo: dict[str, tuple] = {}
+
+    def node_form(node_id: str) -> tuple:
+        if node_id not in memo:
+            node = workflow[node_id]
+            inputs = tuple(
+                (name, ("link", node_form(value[0]), value[1]) if isinstance(value, list) else value)
+                for name, value in sorted(node["inputs"].items())
+            )
+            memo[node_id] = (node["class_type"], node.get("_meta", {}).get("title", ""), inputs)
+        return memo[node_id]
+
+    return sorted(repr(node_form(node_id)) for node_id in workflow)
+
+
+class TemplateGraphTest(unittest.TestCase):
+    def assertSameGraph(self, payload: GeneratePayload):
+        self.assertEqual(
+            canonical(build_txt2img_from_template(payload)),
+            canonical(build_txt2img_workflow(payload)),
+        )
+
+    def test_matches_builder_across_shapes(self):
+        lora_lists = ([], [{"name": "a.safetensors"}], [{"name": "a.safetensors", "strengthModel": 0.5}, {"name": "b.safetensors"}])
+        for i, (model, vae, clip1, loras, clip_skip, hires) in enumerate(itertools.product(
+            ("sdxl.safetensors", "flux-dev-Q4.gguf"),
+            ("Automatic", "ae.safetensors"),
+            ("", "t5.gguf"),
+            lora_lists,
+            (1, 2),
+            (False, True),
+        )):
+            payload = GeneratePayload(
+                model=model,
+                vae=vae,
+                clipModel1=clip1,
+                prompt=f"a photo of subject {i}",
+                negativePrompt="blurry",
+                seed=i,
+                cfg=4.0 + i % 3,
+                width=768 + 64 * (i % 4),
+                loras=loras,
+                clipSkip=clip_skip,
+                hiresFix={"enabled": hires, "scale": 1.5},
+            )
+            with self.subTest(shape=i):
+                self.assertSameGraph(payload)
+
+    def test_lora_titles_count_empty_entries(self):
+        # add_lora_chain numbers LoRAs by list position, skipped ones included
+        payload = GeneratePayload(
+            model="sdxl.safetensors",
+            prompt="a cat",
+            seed=1,
+            loras=[{"name": ""}, {"name": "l1.safetensors"}, {"name": ""}, {"name": "l2.safetensors"}],
+        )
+        self.assertSameGraph(payload)
+        titles = sorted(
+            node["_meta"]["title"]
+            for node in build_txt2img_from_template(payload).values()
+            if node["class_type"] == "LoraLoader"
+        )
+        self.assertEqual(titles, ["LoRA 2: l1.safetensors", "LoRA 4: l2.safetensors"])
+
+
+if __name__ == "__main__":
+    unittest.main()
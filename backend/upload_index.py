@@ -0,0 +1,80 @@
+"""
+Upload index — content-addressed dedupe for images sent to ComfyUI's input.
+
+The same reference image, mask or ControlNet source tends to be uploaded
+again for every job. Uploads are keyed by the SHA-256 of their bytes; when
+the content is already in ComfyUI's input directory the existing filename is
+returned and nothing is sent upstream. Clients that know the hash up front
+can ask first (GET/HEAD /api/upload/{sha256}) and skip sending the bytes.
+
+Entries live in memory (LRU, UPLOAD_INDEX_SIZE) and are persisted through
+the JobStore. When UPLOAD_DIR is on this machine, an entry whose file was
+deleted is dropped on lookup.
+"""
+
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .config import UPLOAD_DIR, UPLOAD_INDEX_SIZE
+
+logger = logging.getLogger(__name__)
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class UploadIndex:
+    """SHA-256 → {"name", "subfolder"} of an image in ComfyUI's input directory."""
+
+    def __init__(self, store=None, upload_dir: str = UPLOAD_DIR, max_entries: int = UPLOAD_INDEX_SIZE):
+        self.store = store  # optional JobStore
+        self.upload_dir = upload_dir
+        self.max_entries = max(0, max_entries)
+        self._entries: "OrderedDict[str, tuple[str, str]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def load(self):
+        """Fill the index from the store. Blocking; call once at startup."""
+        if self.store is None or not self.enabled:
+            return
+        for sha256, name, subfolder, _created_at in self.store.load_uploads():
+            self._entries[sha256] = (name, subfolder)
+        self._evict()
+        logger.info("Loaded %d indexed upload(s)", len(self._entries))
+
+    def get(self, sha256: str) -> Optional[dict]:
+        """Existing upload with this content hash, if it is still there."""
+        entry = self._entries.get(sha256)
+        if entry is None:
+            return None
+        name, subfolder = entry
+        if os.path.isdir(self.upload_dir) and not os.path.isfile(os.path.join(self.upload_dir, subfolder, name)):
+            # Deleted from ComfyUI's input since — forget it
+            self._remove(sha256)
+            return None
+        self._entries.move_to_end(sha256)
+        return {"name": name, "subfolder": subfolder, "type": "input"}
+
+    def put(self, sha256: str, name: str, subfolder: str = ""):
+        if not self.enabled or not name:
+            return
+        self._entries[sha256] = (name, subfolder)
+        self._entries.move_to_end(sha256)
+        if self.store is not None:
+            self.store.save_upload(sha256, name, subfolder, time.time())
+        self._evict()
+
+    def _remove(self, sha256: str):
+        self._entries.pop(sha256, None)
+        if self.store is not None:
+            self.store.delete_upload(sha256)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
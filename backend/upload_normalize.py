@@ -0,0 +1,162 @@
+"""
+Upload normalization — make uploaded source images model-friendly.
+
+A 6000×4000 camera JPEG used as an img2img or inpaint source is decoded at
+full size by LoadImage and VAE-encoded at a huge latent, so encode time and
+VRAM depend on whatever the user's camera produced. With UPLOAD_NORMALIZE on
+(or ?normalize=true on an upload), each new upload is:
+
+- rotated upright from its EXIF orientation,
+- converted to sRGB (through its ICC profile when it has one) as RGB, or RGBA
+  when it has transparency so masks keep their alpha,
+- resized to multiples of 64 within UPLOAD_NORMALIZE_MEGAPIXELS,
+- re-encoded as PNG without metadata.
+
+Decoding and resampling are CPU-heavy and can spike memory, so they run in a
+small process pool rather than on the event loop or its thread pool. Images
+that already meet all of the above are kept byte-for-byte.
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from .config import UPLOAD_NORMALIZE, UPLOAD_NORMALIZE_MEGAPIXELS, UPLOAD_NORMALIZE_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# UPLOAD_NORMALIZE_MEGAPIXELS is counted in 1024×1024 so 1.0 admits 1024²
+MEGAPIXEL = 1024 * 1024
+# Side lengths are snapped to multiples of this (latent and UNet friendly)
+SIZE_MULTIPLE = 64
+# EXIF tag 0x0112; values 5-8 swap width and height
+ORIENTATION_TAG = 0x0112
+PNG_COMPRESS_LEVEL = 4  # ComfyUI's SaveImage default
+
+
+def normalized_size(width: int, height: int, max_pixels: int) -> tuple[int, int]:
+    """Nearest multiple-of-64 size to width×height that fits in max_pixels.
+
+    Never enlarges beyond snapping to the grid; an image smaller than one
+    grid cell becomes 64 on that side.
+    """
+    scale = min(1.0, math.sqrt(max_pixels / (width * height)))
+    snapped = [max(SIZE_MULTIPLE, round(side * scale / SIZE_MULTIPLE) * SIZE_MULTIPLE) for side in (width, height)]
+    if snapped[0] * snapped[1] > max_pixels:
+        # Rounding up went over budget; round down instead
+        snapped = [max(SIZE_MULTIPLE, math.floor(side * scale / SIZE_MULTIPLE) * SIZE_MULTIPLE) for side in (width, height)]
+    if snapped[0] * snapped[1] > max_pixels:
+        # The short side was held at 64, so shorten the long side to fit
+        longest = max(SIZE_MULTIPLE, max_pixels // SIZE_MULTIPLE // SIZE_MULTIPLE * SIZE_MULTIPLE)
+        snapped = [min(side, longest) for side in snapped]
+    return snapped[0], snapped[1]
+
+
+def normalize_image(data: bytes, max_pixels: int) -> Optional[bytes]:
+    """Normalized PNG bytes, or None when the image needs no changes.
+
+    Runs in a worker process. Raises on images Pillow can't decode.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as src:
+        orientation = src.getexif().get(ORIENTATION_TAG, 1)
+        width, height = src.size
+        if orientation in (5, 6, 7, 8):
+            width, height = height, width
+        target = normalized_size(width, height, max_pixels)
+        icc = src.info.get("icc_profile")
+        if orientation == 1 and not icc and src.mode in ("RGB", "RGBA") and (width, height) == target:
+            return None
+
+        if src.format == "JPEG":
+            # Let libjpeg decode at a reduced scale (never below the target),
+            # far cheaper than decoding the full frame and resampling it
+            draft_size = target if orientation not in (5, 6, 7, 8) else target[::-1]
+            src.draft(src.mode, draft_size)
+        image = ImageOps.exif_transpose(src)
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    mode = "RGBA" if has_alpha else "RGB"
+    if icc:
+        image = _to_srgb(image, icc, mode)
+    if image.mode in ("I", "I;16", "I;16L", "I;16B"):
+        # 16-bit greyscale: keep the high byte instead of clipping to white
+        image = image.convert("I").point(lambda v: v / 256).convert("L")
+    if image.mode != mode:
+        image = image.convert(mode)
+    if image.size != target:
+        image = image.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    image.info.pop("icc_profile", None)  # pixels are sRGB now (or the profile was unusable)
+    out = io.BytesIO()
+    image.save(out, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+    return out.getvalue()
+
+
+def _to_srgb(image, icc: bytes, mode: str):
+    """Convert through the embedded ICC profile; unchanged if that isn't possible."""
+    from PIL import ImageCms
+
+    try:
+        profile = ImageCms.ImageCmsProfile(io.BytesIO(icc))
+        return ImageCms.profileToProfile(image, profile, ImageCms.createProfile("sRGB"), outputMode=mode)
+    except (ImageCms.PyCMSError, OSError, ValueError) as e:
+        logger.debug("Ignoring unusable ICC profile: %s", e)
+        return image
+
+
+class UploadNormalizer:
+    """Runs normalize_image() for uploads on a lazily started process pool."""
+
+    def __init__(
+        self,
+        enabled: bool = UPLOAD_NORMALIZE,
+        megapixels: float = UPLOAD_NORMALIZE_MEGAPIXELS,
+        workers: int = UPLOAD_NORMALIZE_WORKERS,
+    ):
+        self.enabled = enabled
+        self.max_pixels = max(SIZE_MULTIPLE * SIZE_MULTIPLE, int(megapixels * MEGAPIXEL))
+        self.workers = max(1, workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def index_key(self, sha256: str) -> str:
+        """Upload-index key for the normalized variant of an original's digest.
+
+        Normalized and original uploads of the same bytes are different
+        files, and so is a normalization under another pixel budget.
+        """
+        return hashlib.sha256(f"{sha256}:normalized:{self.max_pixels}".encode()).hexdigest()
+
+    async def normalize(self, data: bytes) -> Optional[bytes]:
+        """Normalized PNG bytes, or None to keep the upload as it is.
+
+        None also covers images that can't be normalized (undecodable,
+        over Pillow's decompression-bomb limit, or a crashed worker): the
+        original still gets uploaded and ComfyUI decides what to do with it.
+        """
+        if self._pool is None:
+            # spawn, not Linux's default fork: forking the threaded server
+            # can copy a lock (logging, sqlite) held by another thread and
+            # deadlock the worker
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._pool, normalize_image, data, self.max_pixels)
+        except BrokenProcessPool:
+            logger.error("Upload normalization worker died; restarting the pool")
+            self.stop()
+        except Exception as e:
+            logger.warning("Could not normalize upload, keeping the original: %s", e)
+        return None
@@ -0,0 +1,159 @@
+"""
+Streaming multipart upload reader.
+
+Starlette's request.form() consumes the whole body (spooling file parts to
+temporary files) before the route sees a single byte, and UploadFile.read()
+then loads the file into memory. UploadStream instead feeds the request body
+through python-multipart as it arrives and hands out the file part chunk by
+chunk, so a route can validate the first bytes, enforce the size limit the
+moment it is crossed, and pipe the rest onward without holding a copy.
+"""
+
+import logging
+from typing import AsyncIterator, Optional
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidUploadError(ValueError):
+    """Malformed request or unacceptable file (→ 400)."""
+
+
+class UploadTooLargeError(Exception):
+    """File part exceeded the size limit (→ 413)."""
+
+
+class UploadStream:
+    """The first file part of a multipart/form-data request, read incrementally.
+
+    Usage: filename = await stream.open(); head = await stream.peek(n); then
+    iterate the stream for the file's chunks (starting with the peeked bytes).
+    Other form fields are ignored.
+    """
+
+    def __init__(self, request: Request, field_names: tuple[str, ...], max_size: int):
+        self.request = request
+        self.field_names = field_names
+        self.max_size = max_size
+        self.filename = ""
+        self.size = 0  # bytes handed out so far
+        self._events = self._parse()
+        self._head = b""
+        self._ended = False
+
+    async def open(self) -> str:
+        """Read up to the start of the file part and return its filename."""
+        async for kind, value in self._events:
+            if kind == "begin":
+                self.filename = value
+                return value
+        raise InvalidUploadError("No file provided")
+
+    async def peek(self, n: int) -> bytes:
+        """The first n bytes of the file (fewer if it is shorter), without consuming them."""
+        while len(self._head) < n and not self._ended:
+            kind, value = await self._next_event()
+            if kind == "data":
+                self._head += value
+            else:
+                self._ended = True
+        self._check_size(len(self._head))
+        return self._head[:n]
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        if self._head:
+            head, self._head = self._head, b""
+            self.size = len(head)
+            yield head
+        while not self._ended:
+            kind, value = await self._next_event()
+            if kind != "data":
+                self._ended = True
+                break
+            self.size += len(value)
+            self._check_size(self.size)
+            yield value
+
+    def _check_size(self, size: int):
+        if size > self.max_size:
+            raise UploadTooLargeError(f"File too large. Maximum size is {self.max_size // (1024 * 1024)}MB")
+
+    async def _next_event(self) -> tuple[str, Optional[object]]:
+        try:
+            return await self._events.__anext__()
+        except StopAsyncIteration:
+            return "end", None
+
+    async def _parse(self):
+        """Yield ("begin", filename), ("data", bytes)..., ("end", None) for the chosen part."""
+        _, params = parse_options_header(self.request.headers.get("content-type", ""))
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise InvalidUploadError("Expected a multipart/form-data request")
+
+        events: list[tuple[str, object]] = []
+        state = {"header": b"", "value": b"", "disposition": b"", "selected": False, "done": False}
+
+        def on_part_begin():
+            state["disposition"] = b""
+
+        def on_header_field(data, start, end):
+            state["header"] += data[start:end]
+
+        def on_header_value(data, start, end):
+            state["value"] += data[start:end]
+
+        def on_header_end():
+            if state["header"].lower() == b"content-disposition":
+                state["disposition"] = state["value"]
+            state["header"] = state["value"] = b""
+
+        def on_headers_finished():
+            _, options = parse_options_header(state["disposition"])
+            name = options.get(b"name", b"").decode("utf-8", "replace")
+            selected = (
+                not state["done"]
+                and b"filename" in options
+                and name in self.field_names
+            )
+            state["selected"] = selected
+            if selected:
+                events.append(("begin", options[b"filename"].decode("utf-8", "replace")))
+
+        def on_part_data(data, start, end):
+            if state["selected"]:
+                events.append(("data", bytes(data[start:end])))
+
+        def on_part_end():
+            if state["selected"]:
+                state["selected"] = False
+                state["done"] = True
+                events.append(("end", None))
+
+        parser = MultipartParser(boundary, {
+            "on_part_begin": on_part_begin,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+        })
+        try:
+            async for body in self.request.stream():
+                parser.write(body)
+                for event in events:
+                    yield event
+                    if event[0] == "end":
+                        return
+                events.clear()
+            parser.finalize()
+        except Exception as e:
+            if isinstance(e, (InvalidUploadError, UploadTooLargeError)):
+                raise
+            raise InvalidUploadError(f"Malformed multipart body: {e}") from e
+        for event in events:
+            yield event
@@ -10,14 +10,16 @@ import asyncio
 import base64
 import json
 import logging
+import os
 import uuid
 import struct
-from typing import Optional
+import time
+from typing import Callable, Optional
 
 import aiohttp
 from fastapi import WebSocket, WebSocketDisconnect
 
-from .config import COMFYUI_WS
+from .config import COMFYUI_CLIENT_ID_PATH, COMFYUI_WS
 
 logger = logging.getLogger(__name__)
 
@@ -29,18 +31,47 @@ TEXT = 3
 PREVIEW_IMAGE_WITH_METADATA = 4
 
 
+def load_client_id(path: str = COMFYUI_CLIENT_ID_PATH) -> str:
+    """The client id used by the previous backend process, or a new saved one.
+
+    ComfyUI sends executing/executed/execution_error only to the client id a
+    prompt was queued with, so prompts adopted after a restart keep reporting
+    only if the id survives it.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            client_id = f.read().strip()
+        if client_id:
+            return client_id
+    except OSError:
+        pass
+    client_id = f"matrice-{uuid.uuid4().hex[:8]}"
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(client_id)
+    except OSError as e:
+        logger.warning("Could not save the ComfyUI client id to %s: %s", path, e)
+    return client_id
+
+
 class WebSocketManager:
     """Manages WebSocket connections between frontend clients and ComfyUI."""
 
-    def __init__(self):
-        self.client_id = f"matrice-{uuid.uuid4().hex[:8]}"
+    def __init__(self, comfyui, client_id: Optional[str] = None):
+        self.comfyui = comfyui  # ComfyUIClient — its connection pool is reused here
+        self.client_id = client_id or load_client_id()
         self.frontend_clients: list[WebSocket] = []
         self._clients_lock = asyncio.Lock()
         self._comfyui_ws: Optional[aiohttp.ClientWebSocketResponse] = None
         self._session: Optional[aiohttp.ClientSession] = None
         self._listen_task: Optional[asyncio.Task] = None
-        self._prompt_map: dict[str, str] = {}  # prompt_id -> job_id
+        self._prompt_map: dict[str, list[str]] = {}  # prompt_id -> job_ids sharing it
+        self._finish_listeners: list[Callable[[str, str], None]] = []
+        self._event_listeners: list[Callable[[dict], None]] = []
         self._connected = False
+        self.last_event_at: Optional[float] = None  # wall-clock time of last ComfyUI event
+        self.queue_remaining = 0  # from ComfyUI "status" events
 
     @property
     def is_connected(self) -> bool:
@@ -79,15 +110,62 @@ class WebSocketManager:
     # ── Prompt tracking ───────────────────────────────────────────────
 
     def register_prompt(self, prompt_id: str, job_id: str):
-        """Map a ComfyUI prompt_id to a frontend job_id."""
-        self._prompt_map[prompt_id] = job_id
+        """Map a ComfyUI prompt_id to a frontend job_id.
+
+        Several jobs may share one prompt (coalesced identical requests);
+        every prompt event is then sent once per job.
+        """
+        job_ids = self._prompt_map.setdefault(prompt_id, [])
+        if job_id not in job_ids:
+            job_ids.append(job_id)
+
+    def unregister_job(self, prompt_id: str, job_id: str):
+        """Stop sending a prompt's events to one of its jobs."""
+        job_ids = self._prompt_map.get(prompt_id)
+        if job_ids and job_id in job_ids:
+            job_ids.remove(job_id)
 
     def get_job_id(self, prompt_id: str) -> Optional[str]:
-        return self._prompt_map.get(prompt_id)
+        job_ids = self._prompt_map.get(prompt_id)
+        return job_ids[0] if job_ids else None
+
+    def get_job_ids(self, prompt_id: str) -> list[str]:
+        return list(self._prompt_map.get(prompt_id, ()))
+
+    def add_finish_listener(self, callback: Callable[[str, str], None]):
+        """Call callback(prompt_id, error) whenever a prompt finishes ("" on success)."""
+        self._finish_listeners.append(callback)
+
+    def add_event_listener(self, callback: Callable[[dict], None]):
+        """Call callback(message) for every prompt event before it is broadcast."""
+        self._event_listeners.append(callback)
+
+    async def _emit(self, message: dict, job_ids: Optional[list[str]] = None):
+        """Notify event listeners, then broadcast a prompt event to the frontend.
 
-    def _cleanup_prompt(self, prompt_id: str):
+        With job_ids, one copy per job is emitted (jobId replaced).
+        """
+        for job_id in job_ids or [message["jobId"]]:
+            copy = {**message, "jobId": job_id}
+            for callback in self._event_listeners:
+                try:
+                    callback(copy)
+                except Exception as e:
+                    logger.debug("Prompt event listener error: %s", e)
+            await self.broadcast(copy)
+
+    def release_prompt(self, prompt_id: str, error: str = ""):
+        """Finish a prompt ComfyUI will send no more events for (e.g. deleted from its queue)."""
+        self._cleanup_prompt(prompt_id, error)
+
+    def _cleanup_prompt(self, prompt_id: str, error: str = ""):
         """Remove a completed prompt from the mapping to prevent memory leak."""
         self._prompt_map.pop(prompt_id, None)
+        for callback in self._finish_listeners:
+            try:
+                callback(prompt_id, error)
+            except Exception as e:
+                logger.debug("Prompt finish listener error: %s", e)
 
     # ── ComfyUI WebSocket connection ──────────────────────────────────
 
@@ -130,16 +208,25 @@ class WebSocketManager:
         if self._session and not self._session.closed:
             await self._session.close()
 
-        self._session = aiohttp.ClientSession()
+        # Own session (no total timeout — the socket stays open indefinitely)
+        # on top of the client's shared connector
+        self._session = aiohttp.ClientSession(
+            connector=self.comfyui.connector,
+            connector_owner=False,
+        )
         ws_url = f"{COMFYUI_WS}?clientId={self.client_id}"
 
+        established = False
         try:
             async with self._session.ws_connect(ws_url, heartbeat=30) as ws:
                 self._comfyui_ws = ws
                 self._connected = True
+                established = True
+                self.comfyui.breaker.record_success()
                 await self.broadcast({"type": "connection_status", "connected": True})
 
                 async for msg in ws:
+                    self.last_event_at = time.time()
                     if msg.type == aiohttp.WSMsgType.TEXT:
                         await self._handle_text_message(msg.data)
                     elif msg.type == aiohttp.WSMsgType.BINARY:
@@ -148,6 +235,12 @@ class WebSocketManager:
                         break
         finally:
             self._connected = False
+            # Feed the HTTP circuit breaker: a dropped socket usually means
+            # ComfyUI is restarting, so fail fast until it's back
+            if established:
+                self.comfyui.breaker.trip("ComfyUI WebSocket disconnected")
+            else:
+                self.comfyui.breaker.record_failure("ComfyUI WebSocket connect failed")
             await self.broadcast({"type": "connection_status", "connected": False})
             if self._session and not self._session.closed:
                 await self._session.close()
@@ -162,70 +255,106 @@ class WebSocketManager:
         event_type = msg.get("type")
         event_data = msg.get("data", {})
         prompt_id = event_data.get("prompt_id", "")
-        job_id = self.get_job_id(prompt_id) or prompt_id
+        # Resolved before any cleanup below drops the mapping
+        job_ids = self.get_job_ids(prompt_id) or [prompt_id]
+        job_id = job_ids[0]
 
         if event_type == "progress":
-            await self.broadcast({
+            await self._emit({
                 "type": "progress",
                 "jobId": job_id,
                 "promptId": prompt_id,
                 "step": event_data.get("value", 0),
                 "totalSteps": event_data.get("max", 1),
-            })
+            }, job_ids)
 
         elif event_type == "executing":
             node = event_data.get("node")
             if node is None:
                 # Execution complete for this prompt — clean up mapping
                 self._cleanup_prompt(prompt_id)
-                await self.broadcast({
+                await self._emit({
                     "type": "executing_done",
                     "jobId": job_id,
                     "promptId": prompt_id,
-                })
+                }, job_ids)
             else:
-                await self.broadcast({
+                await self._emit({
                     "type": "executing",
                     "jobId": job_id,
                     "promptId": prompt_id,
                     "node": node,
-                })
+                }, job_ids)
 
         elif event_type == "executed":
             output = event_data.get("output", {})
-            images = output.get("images", [])
+            # PreviewImage results (type "temp") are intermediates, not job outputs
+            images = [img for img in output.get("images", []) if img.get("type", "output") == "output"]
+            previews = [img for img in output.get("images", []) if img.get("type") == "temp"]
+            if previews:
+                await self._emit({
+                    "type": "preview_output",
+                    "jobId": job_id,
+                    "promptId": prompt_id,
+                    "node": event_data.get("node", ""),
+                    "images": [
+                        {"filename": img.get("filename", ""), "subfolder": img.get("subfolder", "")}
+                        for img in previews
+                    ],
+                }, job_ids)
             if images:
                 image_info = images[0]
-                await self.broadcast({
+                await self._emit({
                     "type": "complete",
                     "jobId": job_id,
                     "promptId": prompt_id,
                     "filename": image_info.get("filename", ""),
                     "subfolder": image_info.get("subfolder", ""),
                     "imageUrl": f"/api/gallery/{image_info.get('filename', '')}",
-                })
+                    "filenames": [img.get("filename", "") for img in images],
+                    "node": event_data.get("node", ""),
+                }, job_ids)
 
         elif event_type == "execution_error":
-            self._cleanup_prompt(prompt_id)
-            await self.broadcast({
+            self._cleanup_prompt(prompt_id, event_data.get("exception_message", "Unknown error"))
+            await self._emit({
                 "type": "error",
                 "jobId": job_id,
                 "promptId": prompt_id,
                 "message": event_data.get("exception_message", "Unknown error"),
                 "nodeType": event_data.get("node_type", ""),
                 "nodeId": event_data.get("node_id", ""),
-            })
+            }, job_ids)
+
+        elif event_type == "execution_interrupted":
+            self._cleanup_prompt(prompt_id, "Interrupted")
+            await self._emit({
+                "type": "error",
+                "jobId": job_id,
+                "promptId": prompt_id,
+                "message": "Interrupted",
+                "nodeType": event_data.get("node_type", ""),
+                "nodeId": event_data.get("node_id", ""),
+            }, job_ids)
+
+        elif event_type == "execution_start":
+            await self._emit({
+                "type": "started",
+                "jobId": job_id,
+                "promptId": prompt_id,
+            }, job_ids)
 
         elif event_type == "execution_cached":
-            await self.broadcast({
+            await self._emit({
                 "type": "cached",
                 "jobId": job_id,
                 "promptId": prompt_id,
                 "nodes": event_data.get("nodes", []),
-            })
+            }, job_ids)
 
         elif event_type == "status":
             queue_remaining = event_data.get("status", {}).get("exec_info", {}).get("queue_remaining", 0)
+            self.queue_remaining = queue_remaining
             await self.broadcast({
                 "type": "queue_status",
                 "queueRemaining": queue_remaining,
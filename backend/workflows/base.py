@@ -3,20 +3,59 @@ Shared utilities for building ComfyUI workflow JSON (node graphs).
 
 ComfyUI workflows are dicts mapping string node IDs to node definitions.
 Each node has: class_type, inputs (with values or [nodeId, outputIndex] links).
+
+Node IDs are content hashes by default: a digest of the node's class and
+inputs, where inputs that link to other nodes carry those nodes' (already
+hashed) IDs. The model loaders and prompt encodes therefore get the same ID
+in every submission that uses them, whatever optional nodes (LoRAs, CLIP
+skip, hires fix) were added before them, so ComfyUI's per-node execution
+cache can reuse their outputs across jobs.
+
+Nodes are also interned: adding a node identical to one already in the graph
+(same class and inputs) returns the existing node's ID instead of a copy. Two
+ControlNets on the same model, or character and style references that both
+need CLIP Vision, therefore load it once per prompt. Identical nodes compute
+identical outputs, so sharing one is always safe.
 """
 
+import hashlib
+import json
+
+# Node ID strategies for WorkflowBuilder
+ID_CONTENT = "content"  # hash of class_type + resolved inputs
+ID_COUNTER = "counter"  # "1", "2", ... in insertion order
+
+# Hex digits kept from the content hash
+NODE_ID_LENGTH = 12
+
 
 class WorkflowBuilder:
     """Helper for constructing ComfyUI workflow dicts."""
 
-    def __init__(self):
+    def __init__(self, id_strategy: str = ID_CONTENT, intern: bool = True):
         self._nodes: dict[str, dict] = {}
         self._counter = 0
+        self.id_strategy = id_strategy
+        self.intern = intern
+        self._interned: dict[str, str] = {}  # content digest -> node_id
 
     def add_node(self, class_type: str, inputs: dict, meta_title: str = "") -> str:
-        """Add a node to the workflow and return its ID."""
+        """Add a node to the workflow and return its ID.
+
+        With interning on, an identical node already in the graph is reused
+        (keeping its title) and its ID returned.
+        """
+        digest = ""
+        if self.intern or self.id_strategy == ID_CONTENT:
+            digest = self._digest(class_type, inputs)
+            if self.intern and digest in self._interned:
+                return self._interned[digest]
+
         self._counter += 1
-        node_id = str(self._counter)
+        if self.id_strategy == ID_CONTENT:
+            node_id = self._content_id(digest)
+        else:
+            node_id = str(self._counter)
         node = {
             "class_type": class_type,
             "inputs": inputs,
@@ -24,6 +63,27 @@ class WorkflowBuilder:
         if meta_title:
             node["_meta"] = {"title": meta_title}
         self._nodes[node_id] = node
+        if self.intern:
+            self._interned[digest] = node_id
+        return node_id
+
+    @staticmethod
+    def _digest(class_type: str, inputs: dict) -> str:
+        """Hash of the node's class and inputs (titles don't count)."""
+        data = json.dumps([class_type, inputs], sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def _content_id(self, digest: str) -> str:
+        """Stable ID from the node's content digest.
+
+        Without interning, a second node with identical content gets a
+        numbered suffix, so both stay in the graph.
+        """
+        node_id = digest[:NODE_ID_LENGTH]
+        base, n = node_id, 1
+        while node_id in self._nodes:
+            n += 1
+            node_id = f"{base}-{n}"
         return node_id
 
     def link(self, source_id: str, output_index: int = 0) -> list:
@@ -247,3 +307,56 @@ def add_latent_upscale(wb: WorkflowBuilder, latent_link, method: str, width: int
         "samples": latent_link,
     }, meta_title="Latent Upscale")
     return wb.link(node_id, 0)
+
+
+# Loader nodes whose weights ComfyUI keeps resident between prompts.
+# Two workflows with the same set of these share one model chain.
+MODEL_CHAIN_CLASSES = {
+    "CheckpointLoaderSimple",
+    "UnetLoaderGGUF",
+    "DualCLIPLoaderGGUF",
+    "CLIPLoaderGGUF",
+    "VAELoader",
+    "LoraLoader",
+}
+
+
+def model_chain_key(workflow: dict) -> tuple:
+    """Summarize the model/VAE/CLIP/LoRA stack a workflow loads.
+
+    Collects the literal inputs of the nodes emitted by load_model_chain and
+    add_lora_chain (links are ignored, so node numbering doesn't matter).
+    Returns a hashable, order-independent key.
+    """
+    parts = []
+    for node in workflow.values():
+        class_type = node.get("class_type", "")
+        if class_type not in MODEL_CHAIN_CLASSES:
+            continue
+        literals = tuple(sorted(
+            (name, value) for name, value in node.get("inputs", {}).items()
+            if not isinstance(value, list)
+        ))
+        parts.append((class_type, literals))
+    return tuple(sorted(parts))
+
+
+def estimate_workflow_cost(workflow: dict) -> float:
+    """Rough GPU cost of a workflow, in sampler steps of a 1-megapixel image.
+
+    Sums KSampler steps (scaled by denoise) and multiplies by the batch size
+    and latent area from EmptyLatentImage when present. Used for fair-share
+    scheduling, so only relative magnitudes matter.
+    """
+    batch = 1
+    megapixels = 1.0
+    steps = 0.0
+    for node in workflow.values():
+        inputs = node.get("inputs", {})
+        class_type = node.get("class_type", "")
+        if class_type == "EmptyLatentImage":
+            batch = max(batch, int(inputs.get("batch_size", 1)))
+            megapixels = max(megapixels, inputs.get("width", 1024) * inputs.get("height", 1024) / (1024 * 1024))
+        elif class_type == "KSampler":
+            steps += inputs.get("steps", 0) * inputs.get("denoise", 1.0)
+    return max(1.0, steps * batch * megapixels)
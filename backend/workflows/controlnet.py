@@ -3,16 +3,60 @@ ControlNet sub-workflow builder.
 
 Inserts ControlNet conditioning between CLIP encode and KSampler.
 Supports chaining multiple ControlNets.
+
+Each control image goes through its preprocessor (edge, depth, pose, ...)
+unless the caller already has the preprocessed image: an entry with
+"preprocessed" loads that file instead. An entry with a "cacheKey" also gets
+a PreviewImage of the preprocessor output, so the PreprocessCache can keep
+it for the next job (see backend/preprocess_cache.py).
 """
 
+from typing import Optional
+
 from .base import WorkflowBuilder
 
+# Preprocessor name (as the frontend sends it) → (node class, fixed inputs).
+# Canny is a core ComfyUI node; the rest come from comfyui_controlnet_aux.
+PREPROCESSORS = {
+    "canny": ("Canny", {"low_threshold": 0.4, "high_threshold": 0.8}),
+    "depth_midas": ("MiDaS-DepthMapPreprocessor", {"a": 6.28, "bg_threshold": 0.1, "resolution": 512}),
+    "depth_zoe": ("Zoe-DepthMapPreprocessor", {"resolution": 512}),
+    "depth_anything": ("DepthAnythingPreprocessor", {"ckpt_name": "depth_anything_vitl14.pth", "resolution": 512}),
+    "lineart": ("LineArtPreprocessor", {"coarse": "disable", "resolution": 512}),
+    "lineart_anime": ("AnimeLineArtPreprocessor", {"resolution": 512}),
+    "openpose": ("OpenposePreprocessor", {
+        "detect_hand": "enable", "detect_body": "enable", "detect_face": "enable", "resolution": 512,
+    }),
+    "dwpose": ("DWPreprocessor", {
+        "detect_hand": "enable", "detect_body": "enable", "detect_face": "enable", "resolution": 512,
+        "bbox_detector": "yolox_l.onnx", "pose_estimator": "dw-ll_ucoco_384.onnx",
+    }),
+    "scribble": ("ScribblePreprocessor", {"resolution": 512}),
+    "softedge": ("HEDPreprocessor", {"safe": "enable", "resolution": 512}),
+    "tile": ("TilePreprocessor", {"pyrUp_iters": 3, "resolution": 512}),
+    "normal": ("NormalBaePreprocessor", {"resolution": 512}),
+}
+
+# Node class names (as listed by /api/preprocessors) are accepted too
+_PREPROCESSOR_CLASSES = {class_type: (class_type, inputs) for class_type, inputs in PREPROCESSORS.values()}
+_PREPROCESSOR_CLASSES["CannyEdgePreprocessor"] = (
+    "CannyEdgePreprocessor", {"low_threshold": 100, "high_threshold": 200, "resolution": 512},
+)
+
+
+def preprocessor_node(name: str) -> Optional[tuple[str, dict]]:
+    """(class_type, inputs) for a preprocessor name, or None to use the image as-is."""
+    if not name or name == "none":
+        return None
+    return PREPROCESSORS.get(name) or _PREPROCESSOR_CLASSES.get(name)
+
 
 def add_controlnet_chain(
     wb: WorkflowBuilder,
     positive_cond,
     negative_cond,
     controlnets: list[dict],
+    captures: Optional[dict] = None,
 ) -> tuple:
     """Apply one or more ControlNets to conditioning.
 
@@ -21,7 +65,11 @@ def add_controlnet_chain(
         positive_cond: Positive CONDITIONING link
         negative_cond: Negative CONDITIONING link
         controlnets: List of dicts with keys:
-            model, image, strength, startPercent, endPercent
+            model, image, strength, startPercent, endPercent, and optionally
+            preprocessor, preprocessed (cached preprocessed image filename)
+            and cacheKey (key to store the preprocessor output under)
+        captures: Filled with {PreviewImage node_id: cacheKey} for the
+            preprocessor outputs worth caching
 
     Returns:
         (positive_cond, negative_cond) — modified conditioning links
@@ -39,11 +87,7 @@ def add_controlnet_chain(
         }, meta_title=f"ControlNet {i + 1}")
         cn_model_link = wb.link(loader_id, 0)
 
-        # Load control image
-        img_id = wb.add_node("LoadImage", {
-            "image": cn["image"],
-        }, meta_title=f"ControlNet Image {i + 1}")
-        cn_image_link = wb.link(img_id, 0)
+        cn_image_link = _add_control_image(wb, cn, i, captures)
 
         # Apply ControlNet (ControlNetApplyAdvanced supports start/end percent)
         apply_id = wb.add_node("ControlNetApplyAdvanced", {
@@ -60,3 +104,34 @@ def add_controlnet_chain(
         current_negative = wb.link(apply_id, 1)
 
     return current_positive, current_negative
+
+
+def _add_control_image(wb: WorkflowBuilder, cn: dict, index: int, captures: Optional[dict]) -> list:
+    """Control image link: the cached preprocessed image, or raw image → preprocessor."""
+    if cn.get("preprocessed"):
+        img_id = wb.add_node("LoadImage", {
+            "image": cn["preprocessed"],
+        }, meta_title=f"ControlNet Image {index + 1} (preprocessed)")
+        return wb.link(img_id, 0)
+
+    img_id = wb.add_node("LoadImage", {
+        "image": cn["image"],
+    }, meta_title=f"ControlNet Image {index + 1}")
+    image_link = wb.link(img_id, 0)
+
+    node = preprocessor_node(cn.get("preprocessor", ""))
+    if node is None:
+        return image_link
+    class_type, inputs = node
+    pre_id = wb.add_node(class_type, {
+        **inputs,
+        "image": image_link,
+    }, meta_title=f"Preprocess {index + 1}")
+    image_link = wb.link(pre_id, 0)
+
+    if cn.get("cacheKey") and captures is not None:
+        preview_id = wb.add_node("PreviewImage", {
+            "images": image_link,
+        }, meta_title=f"Preprocessed {index + 1}")
+        captures[preview_id] = cn["cacheKey"]
+    return image_link
@@ -0,0 +1,51 @@
+"""
+Face swap sub-workflow builder.
+
+Swaps the face from a source image onto a decoded image via the ReActor
+custom node (ReActorFaceSwap), with CodeFormer restoration.
+"""
+
+from .base import WorkflowBuilder
+
+FACE_SWAP_MODEL = "inswapper_128.onnx"
+FACE_DETECTION_MODEL = "retinaface_resnet50"
+FACE_RESTORE_MODEL = "codeformer-v0.1.0.pth"
+
+
+def add_face_swap(wb: WorkflowBuilder, image_link, faceswap_config: dict) -> list:
+    """Swap the reference face onto an IMAGE.
+
+    Args:
+        wb: WorkflowBuilder instance
+        image_link: Input IMAGE link (the generated image)
+        faceswap_config: Dict with keys:
+            image (source face filename), fidelity (CodeFormer weight:
+            0 favours restoration quality, 1 the original features)
+
+    Returns:
+        image_link — IMAGE link with the face swapped
+    """
+    if not faceswap_config.get("image"):
+        return image_link
+
+    source_id = wb.add_node("LoadImage", {
+        "image": faceswap_config["image"],
+    }, meta_title="Face Source")
+
+    swap_id = wb.add_node("ReActorFaceSwap", {
+        "enabled": True,
+        "swap_model": FACE_SWAP_MODEL,
+        "facedetection": FACE_DETECTION_MODEL,
+        "face_restore_model": FACE_RESTORE_MODEL,
+        "face_restore_visibility": 1.0,
+        "codeformer_weight": faceswap_config.get("fidelity", 0.8),
+        "detect_gender_input": "no",
+        "detect_gender_source": "no",
+        "input_faces_index": "0",
+        "source_faces_index": "0",
+        "console_log_level": 1,
+        "input_image": image_link,
+        "source_image": wb.link(source_id, 0),
+    }, meta_title="Face Swap")
+
+    return wb.link(swap_id, 0)
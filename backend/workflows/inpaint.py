@@ -3,9 +3,20 @@ Inpaint workflow builder.
 
 Flow: LoadModel → LoadImage (source) + LoadImage (mask) → VAEEncodeForInpaint
       → KSampler → VAEDecode → SaveImage
+
+Masked-only mode (inpaintArea="masked_only") diffuses just the masked region:
+      crop source + mask to the mask's bounding box (+ padding) → scale to
+      ~1 megapixel → VAEEncodeForInpaint → KSampler → VAEDecode → scale back
+      → ImageCompositeMasked onto the untouched source → SaveImage
+The bounding box comes from compute_inpaint_region(), which needs the mask's
+pixels and so runs in the route before the graph is built.
 """
 
+import io
+import math
 import random
+from typing import Optional
+
 from .base import (
     WorkflowBuilder,
     load_model_chain,
@@ -17,9 +28,95 @@ from .base import (
 )
 from .lora import add_lora_chain
 
+# Masked-only: diffuse the crop at about this many pixels (model-native area)
+INPAINT_TARGET_PIXELS = 1024 * 1024
+# ...but never enlarge a tiny crop more than this
+INPAINT_MAX_UPSCALE = 4.0
+# Mask pixel value (0-255) counted as masked when finding the bounding box
+MASK_THRESHOLD = 8
+
+
+def compute_inpaint_region(mask_bytes: bytes, padding: int, grow: int = 0) -> Optional[dict]:
+    """Bounding box of the masked area plus padding, and its working size.
+
+    Masks are white-on-black images (what the edit canvas exports, as an
+    opaque RGBA PNG); a mask whose alpha actually varies is read from its
+    alpha channel instead, matching LoadImage's MASK output. Returns None
+    when nothing is masked.
+
+    Result: {"x", "y", "width", "height"} of the crop in source pixels (a
+    multiple of 8, clamped to the image), {"targetWidth", "targetHeight"}
+    for diffusion (multiples of 64), and "maskSource" ("alpha" or "red").
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(mask_bytes)) as img:
+        alpha = None
+        if img.mode in ("RGBA", "LA") or "transparency" in img.info:
+            alpha = img.convert("RGBA").getchannel("A")
+            if alpha.getextrema()[0] == 255:
+                alpha = None  # fully opaque: the mask is in the colour channels
+        if alpha is not None:
+            mask = alpha.point(lambda v: 255 - v)
+            mask_source = "alpha"
+        else:
+            mask = img.convert("RGB").getchannel("R")
+            mask_source = "red"
+        width, height = img.size
+        bbox = mask.point(lambda v: 255 if v >= MASK_THRESHOLD else 0).getbbox()
+    if bbox is None:
+        return None
+
+    margin = padding + grow
+    left, top = max(0, bbox[0] - margin), max(0, bbox[1] - margin)
+    right, bottom = min(width, bbox[2] + margin), min(height, bbox[3] + margin)
+
+    # Round the crop out to multiples of 8, staying inside the image
+    crop_w = min(width, math.ceil((right - left) / 8) * 8)
+    crop_h = min(height, math.ceil((bottom - top) / 8) * 8)
+    left = min(left, width - crop_w)
+    top = min(top, height - crop_h)
+
+    scale = min(INPAINT_MAX_UPSCALE, math.sqrt(INPAINT_TARGET_PIXELS / (crop_w * crop_h)))
+    return {
+        "x": left,
+        "y": top,
+        "width": crop_w,
+        "height": crop_h,
+        "targetWidth": max(64, round(crop_w * scale / 64) * 64),
+        "targetHeight": max(64, round(crop_h * scale / 64) * 64),
+        "maskSource": mask_source,
+    }
+
+
+def _scale_image(wb: WorkflowBuilder, image_link, width: int, height: int, method: str = "lanczos") -> list:
+    node_id = wb.add_node("ImageScale", {
+        "upscale_method": method,
+        "width": width,
+        "height": height,
+        "crop": "disabled",
+        "image": image_link,
+    }, meta_title="Scale Image")
+    return wb.link(node_id, 0)
+
+
+def _mask_via_image(wb: WorkflowBuilder, mask_link, transform) -> list:
+    """Apply an IMAGE node to a MASK (MaskToImage → transform → ImageToMask)."""
+    image_id = wb.add_node("MaskToImage", {"mask": mask_link})
+    image_link = transform(wb.link(image_id, 0))
+    mask_id = wb.add_node("ImageToMask", {"channel": "red", "image": image_link})
+    return wb.link(mask_id, 0)
+
+
+def build_inpaint_workflow(payload, region: Optional[dict] = None) -> dict:
+    """Build an inpaint ComfyUI workflow from the edit payload.
+
+    With a region from compute_inpaint_region(), only that crop is diffused
+    and stitched back into the source image.
+    """
+    if region is not None:
+        return _build_masked_only(payload, region)
 
-def build_inpaint_workflow(payload) -> dict:
-    """Build an inpaint ComfyUI workflow from the edit payload."""
     wb = WorkflowBuilder()
 
     seed = payload.seed if payload.seed >= 0 else random.randint(0, 2**32 - 1)
@@ -68,3 +165,102 @@ def build_inpaint_workflow(payload) -> dict:
     add_save_image(wb, result_image, prefix="Matrice_inpaint")
 
     return wb.build()
+
+
+def _build_masked_only(payload, region: dict) -> dict:
+    """Crop-and-stitch inpaint of the mask's bounding box."""
+    wb = WorkflowBuilder()
+
+    seed = payload.seed if payload.seed >= 0 else random.randint(0, 2**32 - 1)
+    x, y, crop_w, crop_h = region["x"], region["y"], region["width"], region["height"]
+    target_w, target_h = region["targetWidth"], region["targetHeight"]
+
+    # 1. Load model chain + LoRAs + text encoding (as in full mode)
+    model_link, clip_link, vae_link = load_model_chain(wb, payload)
+    if payload.loras:
+        lora_dicts = [{"name": l.name, "strengthModel": l.strengthModel, "strengthClip": l.strengthClip} for l in payload.loras]
+        model_link, clip_link = add_lora_chain(wb, model_link, clip_link, lora_dicts)
+    positive_cond = add_clip_text_encode(wb, payload.prompt, clip_link)
+    negative_cond = add_clip_text_encode(wb, payload.negativePrompt or "", clip_link)
+
+    # 2. Source image and mask (white-on-black masks read from the red channel)
+    image_link, _ = add_load_image(wb, payload.image, title="Source Image")
+    mask_image_link, mask_link = add_load_image(wb, payload.mask, title="Mask")
+    if region.get("maskSource") != "alpha":
+        to_mask = wb.add_node("ImageToMask", {"channel": "red", "image": mask_image_link})
+        mask_link = wb.link(to_mask, 0)
+
+    # 3. Crop both to the region
+    crop_id = wb.add_node("ImageCrop", {
+        "width": crop_w,
+        "height": crop_h,
+        "x": x,
+        "y": y,
+        "image": image_link,
+    }, meta_title="Crop to Mask")
+    crop_mask_id = wb.add_node("CropMask", {
+        "x": x,
+        "y": y,
+        "width": crop_w,
+        "height": crop_h,
+        "mask": mask_link,
+    }, meta_title="Crop Mask")
+    crop_link = wb.link(crop_id, 0)
+    crop_mask_link = wb.link(crop_mask_id, 0)
+
+    # 4. Scale to the working resolution and diffuse
+    work_image = _scale_image(wb, crop_link, target_w, target_h)
+    work_mask = _mask_via_image(
+        wb, crop_mask_link, lambda link: _scale_image(wb, link, target_w, target_h, method="bilinear")
+    )
+    inpaint_node_id = wb.add_node("VAEEncodeForInpaint", {
+        "grow_mask_by": payload.maskBlur,
+        "pixels": work_image,
+        "vae": vae_link,
+        "mask": work_mask,
+    }, meta_title="VAE Encode (Inpaint)")
+    latent_link = add_ksampler(
+        wb, model_link, positive_cond, negative_cond, wb.link(inpaint_node_id, 0),
+        seed=seed,
+        steps=payload.steps,
+        cfg=payload.cfg,
+        sampler_name=payload.sampler,
+        scheduler=payload.scheduler,
+        denoise=payload.denoise,
+        title="KSampler (Inpaint)",
+    )
+    result_image = add_vae_decode(wb, latent_link, vae_link)
+
+    # 5. Back to crop size, then paste through a grown, softened mask so the
+    #    seam falls inside the area VAEEncodeForInpaint regenerated
+    patch_link = _scale_image(wb, result_image, crop_w, crop_h)
+    blend_mask = crop_mask_link
+    if payload.maskBlur > 0:
+        grow_id = wb.add_node("GrowMask", {
+            "expand": payload.maskBlur,
+            "tapered_corners": True,
+            "mask": crop_mask_link,
+        }, meta_title="Grow Mask")
+
+        def soften(link):
+            blur_id = wb.add_node("ImageBlur", {
+                "blur_radius": min(31, payload.maskBlur),
+                "sigma": 1.0,
+                "image": link,
+            }, meta_title="Soften Mask")
+            return wb.link(blur_id, 0)
+
+        blend_mask = _mask_via_image(wb, wb.link(grow_id, 0), soften)
+    composite_id = wb.add_node("ImageCompositeMasked", {
+        "x": x,
+        "y": y,
+        "resize_source": False,
+        "destination": image_link,
+        "source": patch_link,
+        "mask": blend_mask,
+    }, meta_title="Stitch")
+
+    # 6. Save
+    add_save_image(wb, wb.link(composite_id, 0), prefix="Matrice_inpaint")
+
+    return wb.build()
@@ -19,13 +19,17 @@ def add_ipadapter(
         wb: WorkflowBuilder instance
         model_link: Input MODEL link
         ipadapter_config: Dict with keys:
-            model (IP-Adapter model name), image (reference image filename),
+            model (IP-Adapter model name), image (reference image filename)
+            and/or images (several references, batched into one embedding),
             strength, startPercent, endPercent, noise
 
     Returns:
         model_link — modified MODEL output link
     """
-    if not ipadapter_config.get("model") or not ipadapter_config.get("image"):
+    images = list(ipadapter_config.get("images") or [])
+    if ipadapter_config.get("image") and ipadapter_config["image"] not in images:
+        images.insert(0, ipadapter_config["image"])
+    if not ipadapter_config.get("model") or not images:
         return model_link
 
     # Load IP-Adapter model
@@ -41,11 +45,20 @@ def add_ipadapter(
     }, meta_title="CLIP Vision")
     clip_vision_link = wb.link(clip_vision_id, 0)
 
-    # Load reference image
-    ref_img_id = wb.add_node("LoadImage", {
-        "image": ipadapter_config["image"],
-    }, meta_title=f"{title} Reference")
-    ref_image_link = wb.link(ref_img_id, 0)
+    # Load reference image(s); several are batched (resized to the first)
+    ref_image_link = None
+    for n, image in enumerate(images):
+        ref_img_id = wb.add_node("LoadImage", {
+            "image": image,
+        }, meta_title=f"{title} Reference {n + 1}" if len(images) > 1 else f"{title} Reference")
+        if ref_image_link is None:
+            ref_image_link = wb.link(ref_img_id, 0)
+        else:
+            batch_id = wb.add_node("ImageBatch", {
+                "image1": ref_image_link,
+                "image2": wb.link(ref_img_id, 0),
+            }, meta_title=f"{title} References")
+            ref_image_link = wb.link(batch_id, 0)
 
     # Encode image with CLIP Vision
     encode_id = wb.add_node("CLIPVisionEncode", {
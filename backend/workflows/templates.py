@@ -0,0 +1,180 @@
+"""
+Compiled txt2img workflow templates.
+
+The txt2img graph's shape depends only on a few structural flags (GGUF or
+checkpoint, VAE override, which CLIP fields fall back to defaults, LoRA
+count, CLIP skip on/off, hires fix on/off). Everything else is a value in a
+known input. A template is the graph built once per shape from placeholder
+values, plus a slot table of (node_id, input, getter) entries; producing a
+workflow is then a per-node copy and a handful of slot writes instead of a
+full WorkflowBuilder pass (which hashes every node for its content ID).
+
+Node IDs are those of the placeholder build, so they are fixed per shape:
+still stable across submissions, which is what ComfyUI's cache needs.
+
+Payloads using IP-Adapter, ControlNet, img2img or face swap are built
+directly with build_txt2img_workflow; those graphs vary too much to be worth
+a template per combination.
+
+Link lists ([node_id, output]) are shared between the template and every
+workflow produced from it; nothing in the backend mutates them.
+
+Run `python -m backend.tests.bench_templates` for a microbenchmark.
+"""
+
+import random
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+from .base import DEFAULT_FLUX_CLIP1, DEFAULT_FLUX_CLIP2, DEFAULT_FLUX_VAE, is_gguf_model
+from .txt2img import build_txt2img_workflow, uses_conditioning_extras
+
+# Compiled shapes kept in memory
+TEMPLATE_CACHE_SIZE = 128
+
+# (node_id, input_name, getter(payload, seed))
+Slot = tuple[str, str, Callable]
+
+_templates: "OrderedDict[tuple, tuple[dict, list[Slot], list[tuple[str, int]]]]" = OrderedDict()
+
+
+def txt2img_shape(payload) -> tuple:
+    """Structural key of the graph build_txt2img_workflow would produce."""
+    gguf = is_gguf_model(payload.model)
+    return (
+        gguf,
+        bool(payload.vae and payload.vae != "Automatic"),
+        gguf and not payload.clipModel1,
+        gguf and not payload.clipModel2,
+        sum(1 for lora in payload.loras if lora.name),
+        payload.clipSkip > 1,
+        bool(payload.hiresFix and payload.hiresFix.enabled),
+    )
+
+
+def build_txt2img_from_template(
+    payload,
+    controlnets: Optional[list[dict]] = None,
+    captures: Optional[dict] = None,
+) -> dict:
+    """Same graph as build_txt2img_workflow(payload), via a compiled template."""
+    if controlnets or uses_conditioning_extras(payload):
+        return build_txt2img_workflow(payload, controlnets, captures)
+    shape = txt2img_shape(payload)
+    compiled = _templates.get(shape)
+    if compiled is None:
+        compiled = _compile(shape)
+        _templates[shape] = compiled
+        if len(_templates) > TEMPLATE_CACHE_SIZE:
+            _templates.popitem(last=False)
+    else:
+        _templates.move_to_end(shape)
+    template, slots, lora_titles = compiled
+
+    workflow = {
+        node_id: {**node, "inputs": dict(node["inputs"])}
+        for node_id, node in template.items()
+    }
+    seed = payload.seed if payload.seed >= 0 else random.randint(0, 2**32 - 1)
+    for node_id, input_name, getter in slots:
+        workflow[node_id]["inputs"][input_name] = getter(payload, seed)
+    # Titles number LoRAs by list position, empty entries included, as add_lora_chain does
+    positions = [i for i, lora in enumerate(payload.loras) if lora.name]
+    for node_id, index in lora_titles:
+        position = positions[index]
+        workflow[node_id]["_meta"] = {"title": f"LoRA {position + 1}: {payload.loras[position].name[:30]}"}
+    return workflow
+
+
+def _placeholder_payload(shape: tuple) -> SimpleNamespace:
+    """Payload with fixed values that produces the given shape."""
+    gguf, vae_override, default_clip1, default_clip2, lora_count, clip_skip, hires = shape
+    return SimpleNamespace(
+        model="model.gguf" if gguf else "model.safetensors",
+        vae="vae.safetensors" if vae_override else "Automatic",
+        clipModel1="" if default_clip1 else "clip1.safetensors",
+        clipModel2="" if default_clip2 else "clip2.safetensors",
+        clipType="flux",
+        loras=[
+            SimpleNamespace(name=f"lora{i}.safetensors", strengthModel=1.0, strengthClip=1.0)
+            for i in range(lora_count)
+        ],
+        clipSkip=2 if clip_skip else 1,
+        prompt="positive",
+        negativePrompt="negative",
+        width=1024,
+        height=1024,
+        batchSize=1,
+        seed=0,
+        steps=20,
+        cfg=7.0,
+        sampler="euler",
+        scheduler="normal",
+        hiresFix=SimpleNamespace(enabled=hires, scale=1.5, steps=10, denoise=0.45, upscaleMethod="nearest-exact"),
+    )
+
+
+def _compile(shape: tuple) -> tuple[dict, list[Slot], list[tuple[str, int]]]:
+    """Build the placeholder graph and locate every payload-dependent input."""
+    gguf = shape[0]
+    template = build_txt2img_workflow(_placeholder_payload(shape))
+    slots: list[Slot] = []
+    lora_titles: list[tuple[str, int]] = []
+    encodes = 0
+    loras = 0
+
+    def lora_getter(index: int, field: str) -> Callable:
+        return lambda p, s: getattr([lora for lora in p.loras if lora.name][index], field)
+
+    for node_id, node in template.items():
+        class_type = node["class_type"]
+        title = node.get("_meta", {}).get("title", "")
+        add = lambda name, getter: slots.append((node_id, name, getter))
+
+        if class_type in ("CheckpointLoaderSimple", "UnetLoaderGGUF"):
+            add("ckpt_name" if class_type == "CheckpointLoaderSimple" else "unet_name", lambda p, s: p.model)
+        elif class_type == "DualCLIPLoaderGGUF":
+            add("clip_name1", lambda p, s: p.clipModel1 or DEFAULT_FLUX_CLIP1)
+            add("clip_name2", lambda p, s: p.clipModel2 or DEFAULT_FLUX_CLIP2)
+            add("type", lambda p, s: p.clipType)
+        elif class_type == "VAELoader":
+            if gguf:
+                add("vae_name", lambda p, s: p.vae if p.vae and p.vae != "Automatic" else DEFAULT_FLUX_VAE)
+            else:
+                add("vae_name", lambda p, s: p.vae)
+        elif class_type == "LoraLoader":
+            add("lora_name", lora_getter(loras, "name"))
+            add("strength_model", lora_getter(loras, "strengthModel"))
+            add("strength_clip", lora_getter(loras, "strengthClip"))
+            lora_titles.append((node_id, loras))
+            loras += 1
+        elif class_type == "CLIPSetLastLayer":
+            add("stop_at_clip_layer", lambda p, s: -p.clipSkip)
+        elif class_type == "CLIPTextEncode":
+            if encodes == 0:
+                add("text", lambda p, s: p.prompt)
+            else:
+                add("text", lambda p, s: p.negativePrompt or "")
+            encodes += 1
+        elif class_type == "EmptyLatentImage":
+            add("width", lambda p, s: p.width)
+            add("height", lambda p, s: p.height)
+            add("batch_size", lambda p, s: p.batchSize)
+        elif class_type == "KSampler":
+            add("seed", lambda p, s: s)
+            add("cfg", lambda p, s: p.cfg)
+            add("sampler_name", lambda p, s: p.sampler)
+            add("scheduler", lambda p, s: p.scheduler)
+            if title == "KSampler (Hires)":
+                add("steps", lambda p, s: p.hiresFix.steps)
+                add("denoise", lambda p, s: p.hiresFix.denoise)
+            else:
+                add("steps", lambda p, s: p.steps)
+        elif class_type == "LatentUpscale":
+            add("upscale_method", lambda p, s: p.hiresFix.upscaleMethod)
+            add("width", lambda p, s: int(p.width * p.hiresFix.scale))
+            add("height", lambda p, s: int(p.height * p.hiresFix.scale))
+
+    return template, slots, lora_titles
+
@@ -3,9 +3,24 @@ Text-to-image workflow builder.
 
 Flow: LoadModel → (LoRA chain) → CLIPTextEncode x2 → EmptyLatentImage
       → KSampler → (optional HiresFix: LatentUpscale → KSampler2) → VAEDecode → SaveImage
+
+Optional conditioning is applied in the same prompt rather than as separate
+generate/edit round trips:
+      characterRef / styleRef → IP-Adapter on the MODEL
+      controlNets             → ControlNetApplyAdvanced on the CONDITIONING
+      img2img                 → LoadImage → ImageScale → VAEEncode replaces the
+                                empty latent; KSampler runs at img2img.denoise
+      faceSwap                → ReActor on the decoded image, before SaveImage
+
+Sweeps share everything up to the latent and fan out into one
+KSampler → (HiresFix) → VAEDecode → SaveImage branch per seed/cfg/steps/
+sampler combination, so models are loaded and prompts encoded once.
 """
 
+import itertools
 import random
+from typing import Optional
+
 from .base import (
     WorkflowBuilder,
     load_model_chain,
@@ -13,20 +28,57 @@ from .base import (
     add_clip_text_encode,
     add_empty_latent,
     add_ksampler,
+    add_load_image,
     add_vae_decode,
+    add_vae_encode,
     add_save_image,
     add_latent_upscale,
 )
+from .controlnet import add_controlnet_chain
+from .faceswap import add_face_swap
+from .ipadapter import add_ipadapter
 from .lora import add_lora_chain
 
 
-def build_txt2img_workflow(payload) -> dict:
-    """Build a txt2img ComfyUI workflow from the frontend payload."""
-    wb = WorkflowBuilder()
+def _resolve_seed(seed: int) -> int:
+    return seed if seed >= 0 else random.randint(0, 2**32 - 1)
+
+
+def _enabled(config, *required: str) -> bool:
+    """True if an optional payload section is enabled and has its required fields."""
+    return bool(config and config.enabled and all(getattr(config, name, None) for name in required))
+
+
+def _ref_enabled(ref) -> bool:
+    return _enabled(ref, "model") and bool(ref.image or ref.images)
+
+
+def active_controlnets(payload) -> list[dict]:
+    """Enabled ControlNet entries as dicts for add_controlnet_chain."""
+    return [cn.model_dump() for cn in getattr(payload, "controlNets", ()) if _enabled(cn, "model", "image")]
+
 
-    # Resolve seed
-    seed = payload.seed if payload.seed >= 0 else random.randint(0, 2**32 - 1)
+def uses_conditioning_extras(payload) -> bool:
+    """True if any IP-Adapter, ControlNet, img2img or face swap section is enabled."""
+    return (
+        _ref_enabled(getattr(payload, "characterRef", None))
+        or _ref_enabled(getattr(payload, "styleRef", None))
+        or bool(active_controlnets(payload))
+        or _enabled(getattr(payload, "img2img", None), "image")
+        or _enabled(getattr(payload, "faceSwap", None), "image")
+    )
+
+
+def _add_shared_stages(
+    wb: WorkflowBuilder,
+    payload,
+    controlnets: Optional[list[dict]] = None,
+    captures: Optional[dict] = None,
+) -> tuple:
+    """Model chain, LoRAs, CLIP skip, text encodes, conditioning extras and latent.
 
+    Returns (model_link, vae_link, positive_cond, negative_cond, latent_link, denoise).
+    """
     # 1. Load model chain (auto-detects GGUF vs checkpoint)
     model_link, clip_link, vae_link = load_model_chain(wb, payload)
 
@@ -42,18 +94,68 @@ def build_txt2img_workflow(payload) -> dict:
     positive_cond = add_clip_text_encode(wb, payload.prompt, clip_link)
     negative_cond = add_clip_text_encode(wb, payload.negativePrompt or "", clip_link)
 
-    # 5. Empty latent
-    latent_link = add_empty_latent(wb, payload.width, payload.height, payload.batchSize)
+    # 5. IP-Adapter references (character, then style)
+    for ref, title in ((getattr(payload, "characterRef", None), "Character Reference"),
+                       (getattr(payload, "styleRef", None), "Style Reference")):
+        if _ref_enabled(ref):
+            model_link = add_ipadapter(wb, model_link, ref.model_dump(), title=title)
+
+    # 6. ControlNets (entries may carry preprocess-cache annotations)
+    if controlnets is None:
+        controlnets = active_controlnets(payload)
+    if controlnets:
+        positive_cond, negative_cond = add_controlnet_chain(
+            wb, positive_cond, negative_cond, controlnets, captures,
+        )
+
+    # 7. Latent: the encoded img2img source, or an empty latent
+    img2img = getattr(payload, "img2img", None)
+    if _enabled(img2img, "image"):
+        image_link, _ = add_load_image(wb, img2img.image, title="img2img Source")
+        scale_id = wb.add_node("ImageScale", {
+            "upscale_method": "lanczos",
+            "width": payload.width,
+            "height": payload.height,
+            "crop": "center",
+            "image": image_link,
+        }, meta_title="Fit Source")
+        latent_link = add_vae_encode(wb, wb.link(scale_id, 0), vae_link)
+        if payload.batchSize > 1:
+            repeat_id = wb.add_node("RepeatLatentBatch", {
+                "amount": payload.batchSize,
+                "samples": latent_link,
+            }, meta_title="Repeat Latent")
+            latent_link = wb.link(repeat_id, 0)
+        denoise = img2img.denoise
+    else:
+        latent_link = add_empty_latent(wb, payload.width, payload.height, payload.batchSize)
+        denoise = 1.0
+
+    return model_link, vae_link, positive_cond, negative_cond, latent_link, denoise
+
+
+def _add_sampling_branch(
+    wb: WorkflowBuilder,
+    payload,
+    shared: tuple,
+    seed: int,
+    steps: int,
+    cfg: float,
+    sampler_name: str,
+    scheduler: str,
+) -> str:
+    """KSampler → optional hires fix → VAEDecode → SaveImage. Returns the SaveImage node ID."""
+    model_link, vae_link, positive_cond, negative_cond, latent_link, denoise = shared
 
     # 6. KSampler
     latent_link = add_ksampler(
         wb, model_link, positive_cond, negative_cond, latent_link,
         seed=seed,
-        steps=payload.steps,
-        cfg=payload.cfg,
-        sampler_name=payload.sampler,
-        scheduler=payload.scheduler,
-        denoise=1.0,
+        steps=steps,
+        cfg=cfg,
+        sampler_name=sampler_name,
+        scheduler=scheduler,
+        denoise=denoise,
         title="KSampler",
     )
 
@@ -74,9 +176,9 @@ def build_txt2img_workflow(payload) -> dict:
             wb, model_link, positive_cond, negative_cond, latent_link,
             seed=seed,
             steps=hf.steps,
-            cfg=payload.cfg,
-            sampler_name=payload.sampler,
-            scheduler=payload.scheduler,
+            cfg=cfg,
+            sampler_name=sampler_name,
+            scheduler=scheduler,
             denoise=hf.denoise,
             title="KSampler (Hires)",
         )
@@ -84,7 +186,78 @@ def build_txt2img_workflow(payload) -> dict:
     # 8. VAE Decode
     image_link = add_vae_decode(wb, latent_link, vae_link)
 
-    # 9. Save
-    add_save_image(wb, image_link, prefix="Matrice")
+    # 9. Optional face swap
+    face_swap = getattr(payload, "faceSwap", None)
+    if _enabled(face_swap, "image"):
+        image_link = add_face_swap(wb, image_link, face_swap.model_dump())
+
+    # 10. Save
+    return add_save_image(wb, image_link, prefix="Matrice")
+
+
+def build_txt2img_workflow(
+    payload,
+    controlnets: Optional[list[dict]] = None,
+    captures: Optional[dict] = None,
+) -> dict:
+    """Build a txt2img ComfyUI workflow from the frontend payload.
 
+    controlnets overrides the payload's ControlNet entries (e.g. annotated
+    by the PreprocessCache); captures is passed to add_controlnet_chain.
+    """
+    wb = WorkflowBuilder()
+    shared = _add_shared_stages(wb, payload, controlnets, captures)
+    _add_sampling_branch(
+        wb, payload, shared,
+        seed=_resolve_seed(payload.seed),
+        steps=payload.steps,
+        cfg=payload.cfg,
+        sampler_name=payload.sampler,
+        scheduler=payload.scheduler,
+    )
     return wb.build()
+
+
+def build_txt2img_sweep_workflow(
+    payload,
+    controlnets: Optional[list[dict]] = None,
+    captures: Optional[dict] = None,
+) -> tuple[dict, list[dict]]:
+    """Build one workflow covering every combination in payload.sweep.
+
+    Each of sweep.seeds / cfgs / steps / samplers falls back to the base
+    payload value when empty; the branches are their cartesian product.
+    controlnets and captures are as for build_txt2img_workflow.
+    Returns (workflow, branches) where each branch is
+    {"index", "seed", "cfg", "steps", "sampler", "saveNode"}.
+    """
+    sweep = payload.sweep
+    combos = itertools.product(
+        sweep.seeds or [payload.seed],
+        sweep.cfgs or [payload.cfg],
+        sweep.steps or [payload.steps],
+        sweep.samplers or [payload.sampler],
+    )
+
+    wb = WorkflowBuilder()
+    shared = _add_shared_stages(wb, payload, controlnets, captures)
+    branches = []
+    for index, (seed, cfg, steps, sampler_name) in enumerate(combos):
+        seed = _resolve_seed(seed)
+        save_node = _add_sampling_branch(
+            wb, payload, shared,
+            seed=seed,
+            steps=steps,
+            cfg=cfg,
+            sampler_name=sampler_name,
+            scheduler=payload.scheduler,
+        )
+        branches.append({
+            "index": index,
+            "seed": seed,
+            "cfg": cfg,
+            "steps": steps,
+            "sampler": sampler_name,
+            "saveNode": save_node,
+        })
+    return wb.build(), branches
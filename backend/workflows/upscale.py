@@ -2,10 +2,24 @@
 Upscale workflow builder.
 
 Model upscale: LoadImage → UpscaleModelLoader → ImageUpscaleWithModel → SaveImage
-Latent upscale: LoadModel → LoadImage → VAEEncode → LatentUpscale → KSampler → VAEDecode → SaveImage
+Latent upscale: LoadModel → LoadImage → VAEEncode → LatentUpscaleBy → KSampler → VAEDecode → SaveImage
+Tiled upscale: LoadModel → LoadImage → ImageScale (to the target size), then per tile
+      ImageCrop → VAEEncode → KSampler → VAEDecode → ImageCompositeMasked (feathered)
+      back onto the canvas → SaveImage
+Hybrid upscale (preset): LoadModel → LoadImage → ImageUpscaleWithModel → ImageScale
+      (to the exact factor) → short low-denoise refine, tiled as above when
+      the target is larger than one tile → SaveImage
+
+Tiled and hybrid modes sample one tile-sized latent at a time, so VRAM use
+depends on tileSize rather than the output size; the canvas itself is an
+IMAGE, which ComfyUI keeps in system RAM. They need the source dimensions to
+lay out the tiles, so the route reads them before the graph is built.
 """
 
+import math
 import random
+from typing import Optional
+
 from .base import (
     WorkflowBuilder,
     load_model_chain,
@@ -15,18 +29,42 @@ from .base import (
     add_vae_encode,
     add_save_image,
     add_load_image,
-    add_latent_upscale,
 )
 from .lora import add_lora_chain
 
+# Tiled mode refuses layouts with more tiles than this (8× of a 1024² source
+# at 1024px tiles with 64px overlap is 81)
+MAX_UPSCALE_TILES = 256
+
+# Modes that lay out the output from the source dimensions
+SIZED_UPSCALE_MODES = {"tiled", "hybrid"}
+
+# Hybrid preset: the model upscale already supplies structure, so the refine
+# pass only adds detail — a few steps at low denoise
+HYBRID_REFINE_STEPS = 10
+HYBRID_REFINE_DENOISE = 0.3
+
+# ImageScale methods; latent-only methods (bislerp) fall back to bicubic
+IMAGE_SCALE_METHODS = {"nearest-exact", "bilinear", "area", "bicubic", "lanczos"}
 
-def build_upscale_workflow(payload) -> dict:
-    """Build an upscale ComfyUI workflow from the edit payload."""
+
+def build_upscale_workflow(payload, source_size: Optional[tuple[int, int]] = None) -> dict:
+    """Build an upscale ComfyUI workflow from the edit payload.
+
+    source_size is the (width, height) of the source image, required for
+    upscaleMode "tiled" and "hybrid".
+    """
     wb = WorkflowBuilder()
 
     # Load source image
     image_link, _ = add_load_image(wb, payload.image, title="Source Image")
 
+    if payload.upscaleMode in SIZED_UPSCALE_MODES:
+        if source_size is None:
+            raise ValueError(f"{payload.upscaleMode.capitalize()} upscale needs the source image size")
+        if payload.upscaleMode == "hybrid":
+            return _build_hybrid_upscale(wb, image_link, payload, source_size)
+        return _build_tiled_upscale(wb, image_link, payload, source_size)
     if payload.upscaleModel:
         # Model-based upscale (ESRGAN, RealESRGAN, etc.)
         return _build_model_upscale(wb, image_link, payload)
@@ -35,6 +73,44 @@ def build_upscale_workflow(payload) -> dict:
         return _build_latent_upscale(wb, image_link, payload)
 
 
+def upscale_target_size(source_size: tuple[int, int], factor: float) -> tuple[int, int]:
+    """Output size for a scale factor, rounded to multiples of 8."""
+    width, height = source_size
+    return (
+        max(8, round(width * factor / 8) * 8),
+        max(8, round(height * factor / 8) * 8),
+    )
+
+
+def tile_spans(length: int, tile: int, overlap: int) -> list[tuple[int, int]]:
+    """(start, size) of tiles covering [0, length), overlapping by at least overlap.
+
+    Tiles are spread evenly, the first starting at 0 and the last ending at
+    length; starts are multiples of 8.
+    """
+    tile = min(tile, length)
+    if tile >= length:
+        return [(0, length)]
+    overlap = min(overlap, tile // 2)
+    count = math.ceil((length - overlap) / (tile - overlap))
+    step = (length - tile) / (count - 1)
+    starts = [min(length - tile, int(i * step) // 8 * 8) for i in range(count - 1)]
+    return [(start, tile) for start in starts] + [(length - tile, tile)]
+
+
+def _add_refine_stages(wb: WorkflowBuilder, payload) -> tuple:
+    """Model chain, LoRAs and prompt encodes. Returns (model, vae, positive, negative)."""
+    model_link, clip_link, vae_link = load_model_chain(wb, payload)
+
+    if payload.loras:
+        lora_dicts = [{"name": l.name, "strengthModel": l.strengthModel, "strengthClip": l.strengthClip} for l in payload.loras]
+        model_link, clip_link = add_lora_chain(wb, model_link, clip_link, lora_dicts)
+
+    positive_cond = add_clip_text_encode(wb, payload.prompt, clip_link)
+    negative_cond = add_clip_text_encode(wb, payload.negativePrompt or "", clip_link)
+    return model_link, vae_link, positive_cond, negative_cond
+
+
 def _build_model_upscale(wb: WorkflowBuilder, image_link, payload) -> dict:
     """Upscale using an upscale model (ESRGAN, etc.)."""
     # Load upscale model
@@ -60,28 +136,18 @@ def _build_latent_upscale(wb: WorkflowBuilder, image_link, payload) -> dict:
     """Upscale via latent space with KSampler refinement."""
     seed = payload.seed if payload.seed >= 0 else random.randint(0, 2**32 - 1)
 
-    # Load model chain (auto-detects GGUF vs checkpoint)
-    model_link, clip_link, vae_link = load_model_chain(wb, payload)
-
-    # LoRA chain
-    if payload.loras:
-        lora_dicts = [{"name": l.name, "strengthModel": l.strengthModel, "strengthClip": l.strengthClip} for l in payload.loras]
-        model_link, clip_link = add_lora_chain(wb, model_link, clip_link, lora_dicts)
-
-    # Text encoding
-    positive_cond = add_clip_text_encode(wb, payload.prompt, clip_link)
-    negative_cond = add_clip_text_encode(wb, payload.negativePrompt or "", clip_link)
+    model_link, vae_link, positive_cond, negative_cond = _add_refine_stages(wb, payload)
 
     # Encode to latent
     latent_link = add_vae_encode(wb, image_link, vae_link)
 
-    # Latent upscale
-    latent_link = add_latent_upscale(
-        wb, latent_link,
-        method=payload.upscaleMethod,
-        width=2048,
-        height=2048,
-    )
+    # Latent upscale (by factor, so the aspect ratio is kept)
+    upscale_id = wb.add_node("LatentUpscaleBy", {
+        "upscale_method": payload.upscaleMethod,
+        "scale_by": payload.upscaleFactor,
+        "samples": latent_link,
+    }, meta_title="Latent Upscale")
+    latent_link = wb.link(upscale_id, 0)
 
     # KSampler refinement
     latent_link = add_ksampler(
@@ -102,3 +168,167 @@ def _build_latent_upscale(wb: WorkflowBuilder, image_link, payload) -> dict:
     add_save_image(wb, result_image, prefix="Matrice_upscale")
 
     return wb.build()
+
+
+def _build_tiled_upscale(wb: WorkflowBuilder, image_link, payload, source_size: tuple[int, int]) -> dict:
+    """Upscale in pixel space, then refine tile by tile with feathered seams."""
+    seed = payload.seed if payload.seed >= 0 else random.randint(0, 2**32 - 1)
+    width, height = upscale_target_size(source_size, payload.upscaleFactor)
+    tiles = _tile_layout(payload, width, height)
+
+    stages = _add_refine_stages(wb, payload)
+
+    # 1. Plain resize to the target size: the starting canvas
+    base_link = _scale_image(wb, image_link, payload, width, height)
+
+    # 2. Refine tile by tile
+    canvas_link = _refine_tiles(
+        wb, base_link, tiles, payload, stages,
+        seed=seed, steps=payload.steps, denoise=payload.denoise,
+    )
+
+    # 3. Save
+    add_save_image(wb, canvas_link, prefix="Matrice_upscale")
+
+    return wb.build()
+
+
+def _build_hybrid_upscale(wb: WorkflowBuilder, image_link, payload, source_size: tuple[int, int]) -> dict:
+    """Model upscale, resize to the exact factor, then a short low-denoise refine."""
+    if not payload.upscaleModel:
+        raise ValueError("Hybrid upscale needs an upscale model")
+    seed = payload.seed if payload.seed >= 0 else random.randint(0, 2**32 - 1)
+    width, height = upscale_target_size(source_size, payload.upscaleFactor)
+    tiles = _tile_layout(payload, width, height)
+
+    stages = _add_refine_stages(wb, payload)
+
+    # 1. Model upscale at the model's native factor (typically 4×)
+    loader_id = wb.add_node("UpscaleModelLoader", {
+        "model_name": payload.upscaleModel,
+    }, meta_title="Load Upscale Model")
+    upscale_id = wb.add_node("ImageUpscaleWithModel", {
+        "upscale_model": wb.link(loader_id, 0),
+        "image": image_link,
+    }, meta_title="Upscale Image")
+
+    # 2. Resize to the requested factor
+    base_link = _scale_image(wb, wb.link(upscale_id, 0), payload, width, height, method="lanczos")
+
+    # 3. Refine: detail only, so a few steps at low denoise (tiled when large)
+    canvas_link = _refine_tiles(
+        wb, base_link, tiles, payload, stages,
+        seed=seed,
+        steps=min(payload.steps, HYBRID_REFINE_STEPS),
+        denoise=min(payload.denoise, HYBRID_REFINE_DENOISE),
+    )
+
+    # 4. Save
+    add_save_image(wb, canvas_link, prefix="Matrice_upscale")
+
+    return wb.build()
+
+
+def _tile_layout(payload, width: int, height: int) -> tuple[list, list]:
+    """(rows, columns) spans for refining a width×height image."""
+    tile = max(64, payload.tileSize // 8 * 8)
+    overlap = payload.tileOverlap // 8 * 8
+    columns = tile_spans(width, tile, overlap)
+    rows = tile_spans(height, tile, overlap)
+    if len(columns) * len(rows) > MAX_UPSCALE_TILES:
+        raise ValueError(
+            f"Tiled upscale to {width}x{height} needs {len(columns) * len(rows)} tiles "
+            f"(max {MAX_UPSCALE_TILES}); use a larger tile size or a smaller factor"
+        )
+    return rows, columns
+
+
+def _scale_image(wb: WorkflowBuilder, image_link, payload, width: int, height: int, method: str = "") -> list:
+    if not method:
+        method = payload.upscaleMethod if payload.upscaleMethod in IMAGE_SCALE_METHODS else "bicubic"
+    node_id = wb.add_node("ImageScale", {
+        "upscale_method": method,
+        "width": width,
+        "height": height,
+        "crop": "disabled",
+        "image": image_link,
+    }, meta_title="Resize to Target")
+    return wb.link(node_id, 0)
+
+
+def _refine_tiles(
+    wb: WorkflowBuilder,
+    base_link,
+    tiles: tuple[list, list],
+    payload,
+    stages: tuple,
+    seed: int,
+    steps: int,
+    denoise: float,
+) -> list:
+    """Refine an image tile by tile and return the link to the stitched result.
+
+    Tiles are pasted back in raster order, each feathered on the sides it
+    shares with tiles already pasted (left, top), so seams fade across the
+    overlap. A single tile is just a plain encode → sample → decode.
+    """
+    model_link, vae_link, positive_cond, negative_cond = stages
+    rows, columns = tiles
+    overlap = payload.tileOverlap // 8 * 8
+    canvas_link = base_link
+
+    for row, (y, tile_h) in enumerate(rows):
+        for column, (x, tile_w) in enumerate(columns):
+            single = len(rows) == 1 and len(columns) == 1
+            tile_link = base_link
+            if not single:
+                crop_id = wb.add_node("ImageCrop", {
+                    "width": tile_w,
+                    "height": tile_h,
+                    "x": x,
+                    "y": y,
+                    "image": base_link,
+                }, meta_title=f"Tile {row + 1},{column + 1}")
+                tile_link = wb.link(crop_id, 0)
+            latent_link = add_vae_encode(wb, tile_link, vae_link)
+            latent_link = add_ksampler(
+                wb, model_link, positive_cond, negative_cond, latent_link,
+                seed=seed,
+                steps=steps,
+                cfg=payload.cfg,
+                sampler_name=payload.sampler,
+                scheduler=payload.scheduler,
+                denoise=denoise,
+                title="KSampler (Upscale Refine)" if single else f"KSampler (Tile {row + 1},{column + 1})",
+            )
+            tile_image = add_vae_decode(wb, latent_link, vae_link)
+            if single:
+                return tile_image
+
+            mask_id = wb.add_node("SolidMask", {
+                "value": 1.0,
+                "width": tile_w,
+                "height": tile_h,
+            })
+            mask_link = wb.link(mask_id, 0)
+            if overlap and (row or column):
+                feather_id = wb.add_node("FeatherMask", {
+                    "left": overlap if column else 0,
+                    "top": overlap if row else 0,
+                    "right": 0,
+                    "bottom": 0,
+                    "mask": mask_link,
+                }, meta_title="Feather Seam")
+                mask_link = wb.link(feather_id, 0)
+
+            paste_id = wb.add_node("ImageCompositeMasked", {
+                "x": x,
+                "y": y,
+                "resize_source": False,
+                "destination": canvas_link,
+                "source": tile_image,
+                "mask": mask_link,
+            }, meta_title="Paste Tile")
+            canvas_link = wb.link(paste_id, 0)
+
+    return canvas_link